@@ -59,9 +59,10 @@ def test_symbolic_links_in_scan(temp_dir):
     # Проверяем, что символическая ссылка корректно обрабатывается
     result = scan_directory(temp_dir)
 
-    # Ожидаемая информация о символической ссылке
-    symlink_info = f"[SYMLINK] symlink.txt - 19 bytes\n"
-    target_info = f"target.txt - 19 bytes\n"
+    # Ожидаемая информация о символической ссылке (рядом показывается место на диске)
+    on_disk = format_file_size(os.stat(target_file).st_blocks * 512)
+    symlink_info = f"[SYMLINK] symlink.txt - 19 bytes ({on_disk} on disk)\n"
+    target_info = f"target.txt - 19 bytes ({on_disk} on disk)\n"
 
     assert symlink_info in result, f"Expected symbolic link info '{symlink_info}' in result:\n{result}"
     assert target_info in result, f"Expected target file info '{target_info}' in result:\n{result}"
@@ -113,8 +114,9 @@ def test_filter_application_in_gui(temp_dir):
     with open(os.path.join(temp_dir, 'file2.log'), 'w') as f:
         f.write("Test log content")
 
-    count = app.count_filtered_items(temp_dir)
-    assert count == 1  # Учитывается только файл с расширением .txt
+    # Учитывается только файл с расширением .txt
+    assert app._apply_filters(os.path.join(temp_dir, 'file1.txt'))
+    assert not app._apply_filters(os.path.join(temp_dir, 'file2.log'))
 
 
 def test_format_file_size():
@@ -246,13 +248,14 @@ def test_scan_with_invalid_directory(mock_showerror, app):
     mock_showerror.assert_called_once_with("Error", "'invalid_path' is not a valid directory.")
 
 @patch("os.path.isdir", return_value=True)
-@patch("disk_scanner_gui.DiskScannerGUI.count_filtered_items", return_value=10)
 @patch("threading.Thread.start", MagicMock())
-def test_scan_and_display_tree(mock_isdir, mock_count_filtered_items, app):
+def test_scan_and_display_tree(mock_isdir, app):
     """Тест вызова сканирования директории."""
+    app.use_cache.set(False)
     app.path_entry.insert(0, "valid_directory")
     app._scan_and_display_tree()
-    assert app.total_items == 10
-    mock_count_filtered_items.assert_called_once_with("valid_directory")
+    # Предварительного подсчёта нет, а прошлого сканирования для оценки ещё не было
+    assert app.total_items == 0
+    assert len(app.tree.get_children()) == 1
 
 
@@ -0,0 +1,151 @@
+import os
+import asyncio
+import logging
+from collections import namedtuple
+from disk_scanner import scan_directory, get_top_5_heavy_items
+from fs_listing import LISTING_ERRORS
+from size_tree import _TreeBuilder, _check_root, _new_tree, _list_directory, FLAG_DIR, FLAG_HARDLINK, FLAG_UNFOLLOWED
+
+# ``allocated`` is the space taken on disk (st_blocks * 512); ``size`` the apparent size.
+ScanEntry = namedtuple("ScanEntry", ["path", "name", "size", "is_dir", "is_link", "allocated"], defaults=(0,))
+
+_DONE = object()
+
+
+async def _walk(path, tree_ready, follow_symlinks=False, max_concurrency=8, queue_size=1024, executor=None):
+    """
+    Shared traversal behind the async API; yields ScanEntry records.
+
+    Directory reads go through the same _list_directory/_TreeBuilder code as
+    the threaded scanner, with the blocking calls run in ``executor``. At
+    most ``max_concurrency`` directories are being read at once, and a reader
+    keeps its slot until the consumer has taken its entries from a queue of
+    ``queue_size`` records, so a slow consumer stops the scan instead of
+    letting results pile up in memory.
+    """
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(executor, _check_root, path)
+    tree = await loop.run_in_executor(executor, _new_tree, path)
+    builder = _TreeBuilder(tree, os.path.realpath(path), follow_symlinks)
+    tree_ready(tree)
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    queue = asyncio.Queue(maxsize=queue_size)
+    # index -> [subdirectories still being scanned, bytes so far, path, allocated so far]
+    open_dirs = {}
+    tasks = set()
+
+    async def complete(index):
+        # A directory is reported once its whole subtree is done; that may complete its parent too.
+        while True:
+            _, size, dir_path, allocated = open_dirs.pop(index)
+            node = tree.node(index)
+            await queue.put(ScanEntry(dir_path, node.name, size, True, node.is_link, allocated))
+            parent = tree.parent[index]
+            if parent < 0:
+                await queue.put(_DONE)
+                return
+            state = open_dirs[parent]
+            state[0] -= 1
+            state[1] += size
+            state[3] += allocated
+            if state[0]:
+                return
+            index = parent
+
+    async def visit(index, dir_path):
+        try:
+            async with semaphore:
+                entries, denied = await loop.run_in_executor(executor, _list_directory, dir_path)
+                subdirs = builder.add_listing(index, entries, denied)
+                files_size = files_allocated = 0
+                for child in list(tree.child_indices(index)):
+                    flags = tree.flags[child]
+                    # Subdirectories are reported once complete; repeated hardlinks are not reported at all.
+                    if flags & FLAG_HARDLINK or (flags & FLAG_DIR and not flags & FLAG_UNFOLLOWED):
+                        continue
+                    node = tree.node(child)
+                    files_size += node.size
+                    files_allocated += node.allocated
+                    await queue.put(ScanEntry(os.path.join(dir_path, node.name), node.name, node.size,
+                                              node.is_dir, node.is_link, node.allocated))
+                open_dirs[index] = [len(subdirs), files_size, dir_path, files_allocated]
+                for child, child_path in subdirs:
+                    spawn(visit(child, child_path))
+                if not subdirs:
+                    await complete(index)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.exception(f"Async scan failed in {dir_path}: {e}")
+            await queue.put(e)
+
+    def spawn(coroutine):
+        task = asyncio.ensure_future(coroutine)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    spawn(visit(0, path))
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        for task in list(tasks):
+            task.cancel()
+        LISTING_ERRORS.flush()
+
+
+async def iter_entries_async(path, follow_symlinks=False, max_concurrency=8, queue_size=1024, executor=None):
+    """
+    Scans a directory without blocking the event loop, yielding entries as they are found.
+
+    Files are yielded as soon as their directory has been read; a directory is
+    yielded with its recursive size once everything beneath it is done, so the
+    root comes last.
+
+    Args:
+        path (str): The root directory path.
+        follow_symlinks (bool): See size_tree.build_size_tree.
+        max_concurrency (int): Maximum number of directory reads in flight.
+        queue_size (int): Entries buffered for the consumer before the scan pauses.
+        executor (Executor or None): Executor for the blocking syscalls; the
+            loop's default executor when omitted.
+
+    Yields:
+        ScanEntry: (path, name, size, is_dir, is_link, allocated) records.
+        A file reached again through another hardlink is not yielded.
+    """
+    async for entry in _walk(path, lambda tree: None, follow_symlinks, max_concurrency, queue_size, executor):
+        yield entry
+
+
+async def build_size_tree_async(path, follow_symlinks=False, max_concurrency=8, executor=None):
+    """Async counterpart of size_tree.build_size_tree."""
+    trees = []
+    async for _ in _walk(path, trees.append, follow_symlinks, max_concurrency, executor=executor):
+        pass
+    tree = trees[0]
+    await asyncio.get_running_loop().run_in_executor(executor, tree.roll_up)
+    tree.compact()
+    return tree.node(0)
+
+
+async def scan_directory_async(path, filters=None, max_concurrency=8, executor=None):
+    """Async counterpart of disk_scanner.scan_directory."""
+    tree = await build_size_tree_async(path, follow_symlinks=True, max_concurrency=max_concurrency, executor=executor)
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, lambda: scan_directory(path, filters=filters, tree=tree))
+
+
+async def get_top_5_heavy_items_async(directory, filters=None, max_concurrency=8, executor=None):
+    """Async counterpart of disk_scanner.get_top_5_heavy_items."""
+    loop = asyncio.get_running_loop()
+    if not await loop.run_in_executor(executor, os.path.isdir, directory):
+        raise NotADirectoryError(f"'{directory}' is not a valid directory.")
+    tree = await build_size_tree_async(directory, max_concurrency=max_concurrency, executor=executor)
+    return await loop.run_in_executor(executor, lambda: get_top_5_heavy_items(directory, filters, tree=tree))
@@ -0,0 +1,68 @@
+"""
+Reports how many bytes the compact SizeTree store needs per node.
+
+Usage:
+    python benchmarks/bench_node_store.py --nodes 1000000
+    python benchmarks/bench_node_store.py --path /some/directory
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from size_tree import SizeTree, FLAG_DIR, build_size_tree  # noqa: E402
+
+
+def build_synthetic_tree(nodes, files_per_dir=20):
+    """Builds an in-memory tree of ``nodes`` entries without touching the filesystem."""
+    tree = SizeTree("/synthetic")
+    tree.add(-1, "", flags=FLAG_DIR)
+    dirs = [0]
+    next_dir = 0
+    while len(tree) < nodes:
+        parent = dirs[next_dir]
+        next_dir += 1
+        for i in range(files_per_dir):
+            if len(tree) >= nodes:
+                break
+            if i % 5 == 0:
+                dirs.append(tree.add(parent, f"dir_{len(dirs):08d}", inode=len(tree), flags=FLAG_DIR))
+            else:
+                # Real trees repeat file names a lot (index.js, __init__.py, ...).
+                tree.add(parent, f"file_{i:02d}.dat", size=i * 1024, inode=len(tree))
+    tree.roll_up()
+    tree.compact()
+    return tree
+
+
+def measure(label, build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    tree = build()
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = len(tree)
+    print(f"{label}: {count} nodes in {elapsed:.2f}s")
+    print(f"  store size:    {tree.nbytes() / count:.1f} bytes/node")
+    print(f"  retained heap: {current / count:.1f} bytes/node")
+    print(f"  peak heap:     {peak / count:.1f} bytes/node")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=1_000_000, help="number of synthetic nodes")
+    parser.add_argument("--path", help="scan a real directory instead of a synthetic tree")
+    args = parser.parse_args()
+
+    if args.path:
+        measure(args.path, lambda: build_size_tree(args.path).tree)
+    else:
+        measure("synthetic", lambda: build_synthetic_tree(args.nodes))
+
+
+if __name__ == "__main__":
+    main()
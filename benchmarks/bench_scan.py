@@ -0,0 +1,191 @@
+"""
+Benchmarks the scan entry points on synthetic trees and saves the results as JSON.
+
+Each (workload, shape) case runs in a fresh process, so its peak RSS is its
+own. A case reports entries/sec (best of --repeat runs, after one warm-up
+run), peak RSS and the syscalls counted by fs_listing (directories listed,
+stat calls per entry) plus the read syscalls from /proc/self/io on Linux.
+
+Usage:
+    python benchmarks/bench_scan.py --output results.json
+    python benchmarks/bench_scan.py --compare baseline.json --threshold 0.15
+    python benchmarks/bench_scan.py --shape wide --workload calculate_size --scale 4
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from tree_generator import SHAPES, ensure_tree  # noqa: E402
+
+WORKLOADS = ("scan_directory", "get_top_5_heavy_items", "visualize_disk_usage", "calculate_size")
+# Results are compared on these metrics; True means higher is better.
+METRICS = {"entries_per_sec": True, "peak_rss_kb": False, "stats_per_entry": False}
+_RESULTS_VERSION = 1
+
+
+def _workload(name):
+    if name == "scan_directory":
+        from disk_scanner import scan_directory
+        return scan_directory
+    if name == "get_top_5_heavy_items":
+        from disk_scanner import get_top_5_heavy_items
+        return get_top_5_heavy_items
+    if name == "visualize_disk_usage":
+        from visualizer import visualize_disk_usage
+        return visualize_disk_usage
+    from file_size import calculate_size
+    return calculate_size
+
+
+def _read_syscalls():
+    # syscr counts read-like syscalls (read, pread, getdents is not included); Linux only.
+    try:
+        with open("/proc/self/io") as f:
+            return int(next(line for line in f if line.startswith("syscr:")).split()[1])
+    except (OSError, StopIteration):
+        return None
+
+
+def _peak_rss_kb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def _run_case(workload, root, entries, repeat, queue):
+    """Runs one case in a child process and puts its result dict on ``queue``."""
+    logging.disable(logging.CRITICAL)
+    from fs_listing import LISTING_STATS
+
+    function = _workload(workload)
+    function(root)
+    timings = []
+    for _ in range(repeat):
+        LISTING_STATS.reset()
+        reads_before = _read_syscalls()
+        start = time.perf_counter()
+        function(root)
+        timings.append(time.perf_counter() - start)
+        reads_after = _read_syscalls()
+    best = min(timings)
+    queue.put({
+        "seconds": best,
+        "entries_per_sec": entries / best if best else None,
+        "peak_rss_kb": _peak_rss_kb(),
+        "directories_listed": LISTING_STATS.directories,
+        "stat_calls": LISTING_STATS.stat_calls,
+        "stats_per_entry": LISTING_STATS.stats_per_entry,
+        "read_syscalls": None if reads_before is None else reads_after - reads_before,
+    })
+
+
+def run_case(workload, root, entries, repeat=3):
+    """Measures one workload on one generated tree in a fresh process."""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_run_case, args=(workload, root, entries, repeat, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """
+    Lists the metrics that got worse than ``baseline`` by more than ``threshold`` (0.1 is 10%).
+
+    Returns:
+        list: Human-readable regression lines; empty when there are none.
+    """
+    previous = {(case["workload"], case["shape"]): case for case in baseline["cases"]}
+    regressions = []
+    for case in results["cases"]:
+        old = previous.get((case["workload"], case["shape"]))
+        if old is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            new_value, old_value = case.get(metric), old.get(metric)
+            if not new_value or not old_value:
+                continue
+            change = (new_value - old_value) / old_value
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append(f"{case['workload']} on {case['shape']}: {metric} "
+                                   f"{old_value:.4g} -> {new_value:.4g} ({change:+.1%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "disk-usage-bench"),
+                        help="where the synthetic trees are generated (reused between runs)")
+    parser.add_argument("--shape", choices=SHAPES, action="append", help="tree shape (default: all)")
+    parser.add_argument("--workload", choices=WORKLOADS, action="append", help="entry point (default: all)")
+    parser.add_argument("--scale", type=int, default=1, help="size multiplier for the trees")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case; the best one is kept")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative change that counts as a regression (default 0.2)")
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    results = {
+        "version": _RESULTS_VERSION,
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "scale": args.scale,
+        "seed": args.seed,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "cases": [],
+    }
+    for shape in args.shape or SHAPES:
+        root, manifest = ensure_tree(args.workdir, shape, args.scale, args.seed)
+        for workload in args.workload or WORKLOADS:
+            case = {"workload": workload, "shape": shape, "entries": manifest["entries"]}
+            case.update(run_case(workload, root, manifest["entries"], args.repeat))
+            results["cases"].append(case)
+            print(f"{workload:<22} {shape:<12} {case['entries_per_sec']:>12,.0f} entries/s  "
+                  f"{case['peak_rss_kb'] or 0:>8,} KB peak  {case['stats_per_entry']:.2f} stats/entry")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions.")
+
+
+if __name__ == "__main__":
+    main()
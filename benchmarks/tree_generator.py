@@ -0,0 +1,193 @@
+"""
+Generates deterministic synthetic directory trees for the scan benchmarks.
+
+Every shape stresses one part of the scanner:
+
+    wide         a few directories with thousands of entries each
+    deep         long chains of nested directories
+    small-files  many directories full of small files with real data
+    sparse       a few huge sparse files (terabytes apparent, kilobytes on disk)
+    symlinks     a farm of file and directory symlinks, including cycles
+    hardlinks    sets of files hardlinked from several directories
+
+The same shape, scale and seed always produce the same names, sizes and
+links, so results from different commits are comparable.
+
+Usage:
+    python benchmarks/tree_generator.py /tmp/bench-trees --scale 2
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+
+SHAPES = ("wide", "deep", "small-files", "sparse", "symlinks", "hardlinks")
+_MANIFEST = ".manifest.json"
+_GENERATOR_VERSION = 1
+
+
+class _Counter:
+    """Tracks what a generator created, in the terms a scan reports (entries below the root)."""
+
+    def __init__(self, root):
+        self.root = root
+        self.entries = 0
+        self.directories = 0
+        self.apparent_bytes = 0
+
+    def mkdir(self, path):
+        os.mkdir(path)
+        self.entries += 1
+        self.directories += 1
+
+    def write(self, path, size, sparse=False):
+        with open(path, "wb") as f:
+            if sparse:
+                f.truncate(size)
+                # A little real data at the start, so the file is not entirely a hole.
+                f.write(b"\1" * min(size, 4096))
+            else:
+                f.write(b"\0" * size)
+        self.entries += 1
+        self.apparent_bytes += size
+
+    def symlink(self, target, path):
+        os.symlink(target, path)
+        self.entries += 1
+
+    def hardlink(self, source, path):
+        os.link(source, path)
+        self.entries += 1
+
+
+def _wide(counter, rng, scale):
+    for d in range(4):
+        directory = os.path.join(counter.root, f"wide_{d}")
+        counter.mkdir(directory)
+        for i in range(2500 * scale):
+            counter.write(os.path.join(directory, f"entry_{i:06d}.dat"), rng.randrange(0, 2048))
+
+
+def _deep(counter, rng, scale):
+    for chain in range(10 * scale):
+        directory = counter.root
+        for depth in range(100):
+            directory = os.path.join(directory, f"level_{chain}_{depth}")
+            counter.mkdir(directory)
+            counter.write(os.path.join(directory, "leaf.txt"), rng.randrange(0, 512))
+
+
+def _small_files(counter, rng, scale):
+    for d in range(50 * scale):
+        directory = os.path.join(counter.root, f"pkg_{d:04d}")
+        counter.mkdir(directory)
+        for i in range(200):
+            # Real trees repeat names a lot (index.js, __init__.py, ...).
+            counter.write(os.path.join(directory, f"module_{i % 40:02d}_{i}.py"), rng.randrange(0, 4096))
+
+
+def _sparse(counter, rng, scale):
+    for i in range(8 * scale):
+        counter.write(os.path.join(counter.root, f"disk_{i:02d}.img"), rng.randrange(1, 64) << 30, sparse=True)
+
+
+def _symlinks(counter, rng, scale):
+    targets = os.path.join(counter.root, "targets")
+    counter.mkdir(targets)
+    files = []
+    for i in range(500):
+        path = os.path.join(targets, f"target_{i:04d}.bin")
+        counter.write(path, rng.randrange(0, 8192))
+        files.append(path)
+    for d in range(40 * scale):
+        farm = os.path.join(counter.root, f"farm_{d:04d}")
+        counter.mkdir(farm)
+        for i in range(100):
+            link = os.path.join(farm, f"link_{i:03d}")
+            if i % 10 == 0:
+                # Directory links: back to the targets, and to an ancestor to make a cycle.
+                counter.symlink(targets if i % 20 else counter.root, link)
+            else:
+                counter.symlink(os.path.relpath(rng.choice(files), farm), link)
+
+
+def _hardlinks(counter, rng, scale):
+    sources = os.path.join(counter.root, "originals")
+    counter.mkdir(sources)
+    originals = []
+    for i in range(400 * scale):
+        path = os.path.join(sources, f"blob_{i:05d}.bin")
+        counter.write(path, rng.randrange(0, 16384))
+        originals.append(path)
+    for copy in range(5):
+        directory = os.path.join(counter.root, f"backup_{copy}")
+        counter.mkdir(directory)
+        for path in originals:
+            counter.hardlink(path, os.path.join(directory, os.path.basename(path)))
+
+
+_BUILDERS = {"wide": _wide, "deep": _deep, "small-files": _small_files, "sparse": _sparse,
+             "symlinks": _symlinks, "hardlinks": _hardlinks}
+
+
+def generate_tree(root, shape, scale=1, seed=0):
+    """
+    Creates a synthetic tree under ``root`` (which must not exist yet).
+
+    Args:
+        root (str): Directory to create.
+        shape (str): One of SHAPES.
+        scale (int): Multiplies the number of directories or files.
+        seed (int): Seed for names, sizes and link targets.
+
+    Returns:
+        dict: The manifest: shape, scale, seed, entries below the root,
+        directories and apparent bytes of regular files.
+    """
+    if shape not in _BUILDERS:
+        raise ValueError(f"Unknown shape '{shape}'. Expected one of: {', '.join(SHAPES)}.")
+    os.makedirs(root)
+    counter = _Counter(root)
+    _BUILDERS[shape](counter, random.Random(f"{shape}-{seed}"), scale)
+    manifest = {"shape": shape, "scale": scale, "seed": seed, "version": _GENERATOR_VERSION,
+                "entries": counter.entries, "directories": counter.directories,
+                "apparent_bytes": counter.apparent_bytes}
+    # The manifest lives next to the tree, so it is not counted in the tree itself.
+    with open(root.rstrip(os.sep) + _MANIFEST, "w") as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def ensure_tree(workdir, shape, scale=1, seed=0):
+    """
+    Returns (root, manifest) of a generated tree in ``workdir``, reusing one
+    made earlier with the same parameters and regenerating it otherwise.
+    """
+    root = os.path.join(workdir, f"{shape}-x{scale}-s{seed}")
+    try:
+        with open(root + _MANIFEST) as f:
+            manifest = json.load(f)
+        if manifest.get("version") == _GENERATOR_VERSION and os.path.isdir(root):
+            return root, manifest
+    except (OSError, ValueError):
+        pass
+    shutil.rmtree(root, ignore_errors=True)
+    return root, generate_tree(root, shape, scale, seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("workdir", help="directory to create the trees in")
+    parser.add_argument("--shape", choices=SHAPES, action="append", help="shape to generate (default: all)")
+    parser.add_argument("--scale", type=int, default=1, help="size multiplier")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    os.makedirs(args.workdir, exist_ok=True)
+    for shape in args.shape or SHAPES:
+        root, manifest = ensure_tree(args.workdir, shape, args.scale, args.seed)
+        print(f"{root}: {manifest['entries']} entries, {manifest['directories']} directories")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+import os
+import time
+import bisect
+import logging
+import threading
+from array import array
+from collections import namedtuple
+from file_size import format_file_size
+from fs_listing import list_directory
+from inode_set import InodeSet
+from size_tree import walk_sizes, _make_lister, SIZE_MODES
+from scan_filters import compile_filter, pruner
+
+try:
+    import numpy as np
+except ImportError:  # The group-bys fall back to plain Python loops over the arrays.
+    np = None
+
+_DAY = 86400
+# Upper bounds of the age buckets, in days; the last bucket is open-ended.
+AGE_BINS = (30, 90, 180, 365, 730)
+STALE_DAYS = 180
+
+Breakdown = namedtuple("Breakdown", ["label", "bytes", "files"])
+# ``accessed``/``modified``: Breakdown per age bucket (AGE_BINS), youngest first; ``stale``: one Breakdown of
+# the files not accessed for ``stale_days``.
+BreakdownReport = namedtuple("BreakdownReport", ["extensions", "owners", "accessed", "modified", "stale", "files",
+                                                 "bytes", "size_mode", "complete"])
+
+
+def _extension(name):
+    # Same as os.path.splitext(name)[1].lower() (leading dots do not start an extension), at a third of the cost.
+    head, dot, tail = name.rpartition(".")
+    return dot + tail.lower() if head.strip(".") else ""
+
+
+class FileColumns:
+    """
+    Per-file columns captured while a scan lists directories.
+
+    Every regular file adds one row: an extension id (into ``extensions``),
+    the apparent and allocated size, mtime, atime and owner uid, each column
+    in its own typed array. The values come from the stat the listing makes
+    anyway, and rows are appended once per directory under a lock. Repeated
+    hardlinks to an inode are left out, like in the size tree, and so are
+    files that do not match ``filters``.
+
+    Pass one to build_size_tree (``columns=``) or use scan_columns, then
+    aggregate with by_extension, by_owner, by_age and not_accessed.
+    """
+
+    def __init__(self, filters=None):
+        self.filters = compile_filter(filters)
+        self._lock = threading.Lock()
+        self._hardlinks = InodeSet()
+        self.extensions = []
+        self._extension_ids = {}
+        self.extension = array("I")
+        self.size = array("Q")
+        self.allocated = array("Q")
+        self.mtime = array("d")
+        self.atime = array("d")
+        self.uid = array("I")
+
+    def __len__(self):
+        return len(self.size)
+
+    def lister(self):
+        """Returns a directory lister that captures the files of every directory it lists."""
+        def list_and_capture(path):
+            details = []
+            listing = list_directory(path, details)
+            if details:
+                self.add(path, details)
+            return listing
+
+        return list_and_capture
+
+    def add(self, directory, details):
+        """Appends the (name, stat_result) pairs of one directory's files."""
+        filters = self.filters
+        if filters is not None:
+            details = [(name, info) for name, info in details
+                       if filters.matches(os.path.join(directory, name), info.st_size)]
+        infos = [info for _, info in details]
+        extensions = [_extension(name) for name, _ in details]
+        if infos and getattr(infos[0], "st_blocks", None) is not None:
+            allocated = [info.st_blocks * 512 for info in infos]
+        else:  # Windows has no st_blocks
+            allocated = [info.st_size for info in infos]
+        with self._lock:
+            if any(info.st_nlink > 1 for info in infos):
+                keep = [info.st_nlink == 1 or self._hardlinks.add(info.st_dev, info.st_ino) for info in infos]
+                infos = [info for info, kept in zip(infos, keep) if kept]
+                extensions = [extension for extension, kept in zip(extensions, keep) if kept]
+                allocated = [size for size, kept in zip(allocated, keep) if kept]
+            ids = self._extension_ids
+            for extension in set(extensions).difference(ids):
+                ids[extension] = len(self.extensions)
+                self.extensions.append(extension)
+            # One extend per column and directory; appending per file costs several times more.
+            self.extension.extend([ids[extension] for extension in extensions])
+            self.size.extend([info.st_size for info in infos])
+            self.allocated.extend(allocated)
+            self.mtime.extend([info.st_mtime for info in infos])
+            self.atime.extend([info.st_atime for info in infos])
+            self.uid.extend([getattr(info, "st_uid", 0) for info in infos])
+
+
+def _column(values):
+    # A zero-copy view of an array.array as a NumPy array.
+    return np.frombuffer(values, dtype=values.typecode)
+
+
+def _weights(columns, size_mode):
+    if size_mode not in SIZE_MODES:
+        raise ValueError(f"Unknown size mode '{size_mode}'. Expected one of: {', '.join(SIZE_MODES)}.")
+    return columns.allocated if size_mode == "allocated" else columns.size
+
+
+def _group_by(keys, weights, groups):
+    """Sums ``weights`` and counts rows per key (0 to ``groups`` - 1); returns (bytes, files) lists."""
+    if np is not None:
+        keys = _column(keys) if isinstance(keys, array) else keys
+        totals = np.bincount(keys, weights=_column(weights), minlength=groups)
+        counts = np.bincount(keys, minlength=groups)
+        return [int(total) for total in totals], counts.tolist()
+    totals = [0] * groups
+    counts = [0] * groups
+    for key, weight in zip(keys, weights):
+        totals[key] += weight
+        counts[key] += 1
+    return totals, counts
+
+
+def _ranked(labels, totals, counts, n):
+    rows = [Breakdown(label, total, count) for label, total, count in zip(labels, totals, counts) if count]
+    rows.sort(key=lambda row: (-row.bytes, row.label))
+    return rows[:n] if n is not None else rows
+
+
+def by_extension(columns, size_mode="apparent", n=None):
+    """Bytes and files per lower-cased extension ("" for none), largest first; the first ``n`` rows."""
+    totals, counts = _group_by(columns.extension, _weights(columns, size_mode), len(columns.extensions))
+    return _ranked(columns.extensions, totals, counts, n)
+
+
+def _owner_name(uid):
+    try:
+        import pwd
+        return pwd.getpwuid(uid).pw_name
+    except (ImportError, KeyError):
+        return str(uid)
+
+
+def by_owner(columns, size_mode="apparent", n=None):
+    """Bytes and files per owner (user name, or the uid when it has none), largest first."""
+    if np is not None:
+        uids, keys = np.unique(_column(columns.uid), return_inverse=True)
+        uids = uids.tolist()
+    else:
+        uids = sorted(set(columns.uid))
+        index = {uid: i for i, uid in enumerate(uids)}
+        keys = [index[uid] for uid in columns.uid]
+    totals, counts = _group_by(keys, _weights(columns, size_mode), len(uids))
+    return _ranked([_owner_name(uid) for uid in uids], totals, counts, n)
+
+
+def _age_labels(bins):
+    def days(count):
+        return f"{count // 365} years" if count >= 730 and count % 365 == 0 else f"{count} days"
+
+    labels = [f"< {days(bins[0])}"]
+    labels.extend(f"{days(low)} - {days(high)}" for low, high in zip(bins, bins[1:]))
+    labels.append(f"> {days(bins[-1])}")
+    return labels
+
+
+def by_age(columns, field="atime", size_mode="apparent", bins=AGE_BINS, now=None):
+    """
+    Bytes and files per age bucket, youngest first.
+
+    Args:
+        columns (FileColumns): Captured files.
+        field (str): "atime" (last access) or "mtime" (last modification).
+            Most filesystems are mounted relatime, so access times lag by up
+            to a day and are only updated when older than the mtime.
+        size_mode (str): Sum "apparent" or "allocated" sizes.
+        bins (tuple): Increasing bucket bounds in days.
+        now (float or None): Reference time, defaults to the current time.
+
+    Returns:
+        list: One Breakdown per bucket, empty buckets included.
+    """
+    if field not in ("atime", "mtime"):
+        raise ValueError(f"Unknown time field '{field}'. Expected 'atime' or 'mtime'.")
+    now = time.time() if now is None else now
+    times = getattr(columns, field)
+    # A file is in bucket i when its age is below bins[i] days (and not below the bound before); timestamps
+    # in the future count as new.
+    bounds = [now - days * _DAY for days in bins]
+    if np is not None:
+        keys = len(bins) - np.searchsorted(bounds[::-1], _column(times), side="left")
+    else:
+        reversed_bounds = bounds[::-1]
+        keys = [len(bins) - bisect.bisect_left(reversed_bounds, value) for value in times]
+    totals, counts = _group_by(keys, _weights(columns, size_mode), len(bins) + 1)
+    return [Breakdown(label, total, count) for label, total, count in zip(_age_labels(bins), totals, counts)]
+
+
+def not_accessed(columns, days=STALE_DAYS, size_mode="apparent", now=None):
+    """Returns a Breakdown of the files whose atime is more than ``days`` days old."""
+    now = time.time() if now is None else now
+    cutoff = now - days * _DAY
+    weights = _weights(columns, size_mode)
+    if np is not None:
+        stale = _column(columns.atime) <= cutoff
+        total, count = int(_column(weights)[stale].sum()), int(np.count_nonzero(stale))
+    else:
+        total = count = 0
+        for atime, weight in zip(columns.atime, weights):
+            if atime <= cutoff:
+                total += weight
+                count += 1
+    return Breakdown(f"not accessed in {days} days", total, count)
+
+
+def scan_columns(path, filters=None, workers=None, mounts=None, dir_timeout=None, metrics=None, cancel=None):
+    """
+    Scans ``path`` once, keeping only the FileColumns of its files (no tree).
+
+    Args:
+        path (str): The root directory path.
+        filters (list, str or ScanFilter): Only matching files are captured;
+            excluded directories are not listed.
+        workers, mounts, dir_timeout, metrics, cancel: Scan engine options,
+            see build_size_tree.
+
+    Returns:
+        tuple: (FileColumns, complete), where complete is False when the
+        scan was cancelled.
+    """
+    columns = FileColumns(filters)
+    complete = walk_sizes(path, lambda *entry: None, workers=workers,
+                          lister=_make_lister(dir_timeout=dir_timeout, metrics=metrics, cancel=cancel,
+                                              columns=columns),
+                          prune=pruner(columns.filters), mounts=mounts, metrics=metrics, cancel=cancel)
+    return columns, complete
+
+
+def summarize(columns, size_mode="apparent", n=10, stale_days=STALE_DAYS, now=None, complete=True):
+    """Runs every breakdown over ``columns``; ``n`` limits the extension and owner rankings."""
+    start = time.perf_counter()
+    now = time.time() if now is None else now
+    weights = _weights(columns, size_mode)
+    report = BreakdownReport(
+        extensions=by_extension(columns, size_mode, n),
+        owners=by_owner(columns, size_mode, n),
+        accessed=by_age(columns, "atime", size_mode, now=now),
+        modified=by_age(columns, "mtime", size_mode, now=now),
+        stale=not_accessed(columns, stale_days, size_mode, now),
+        files=len(columns),
+        bytes=int(_column(weights).sum()) if np is not None else sum(weights),
+        size_mode=size_mode,
+        complete=complete,
+    )
+    logging.info(f"Breakdowns of {len(columns)} files computed in {time.perf_counter() - start:.2f}s"
+                 f"{'' if np is not None else ' (without NumPy)'}.")
+    return report
+
+
+def breakdown(path, filters=None, size_mode="apparent", n=10, stale_days=STALE_DAYS, workers=None, mounts=None,
+              dir_timeout=None, metrics=None, cancel=None):
+    """
+    Bytes by file type, by owner and by age under ``path``, from one scan.
+
+    Returns:
+        BreakdownReport: See summarize.
+    """
+    columns, complete = scan_columns(path, filters, workers, mounts, dir_timeout, metrics, cancel)
+    return summarize(columns, size_mode, n, stale_days, complete=complete)
+
+
+def format_breakdowns(report):
+    """Renders a BreakdownReport as the text tables printed by the CLI."""
+    def table(title, rows):
+        lines = ["", f"{title}:"]
+        width = max((len(row.label) for row in rows), default=0)
+        lines.extend(f"  {row.label:<{width}}  {format_file_size(row.bytes):>10}  {row.files:>10,} files"
+                     for row in rows)
+        return lines
+
+    size = "on disk" if report.size_mode == "allocated" else "apparent size"
+    lines = [f"{report.files:,} files, {format_file_size(report.bytes)} ({size})"]
+    if not report.complete:
+        lines.append("The scan was stopped early; the numbers are lower bounds.")
+    lines.extend(table("By type", [row._replace(label=row.label or "(no extension)") for row in report.extensions]))
+    lines.extend(table("By owner", report.owners))
+    lines.extend(table("By last access", report.accessed))
+    lines.extend(table("By last modification", report.modified))
+    lines.append("")
+    lines.append(f"{format_file_size(report.stale.bytes)} in {report.stale.files:,} files {report.stale.label}")
+    return "\n".join(lines)
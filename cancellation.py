@@ -0,0 +1,47 @@
+import time
+import threading
+
+# Why a scan stopped early, as reported by CancelToken.reason.
+CANCELLED = "cancelled"
+DEADLINE = "deadline"
+
+
+class CancelToken:
+    """
+    Asks a running scan to stop, from any thread.
+
+    Scans check the token once per directory. Directories not listed yet are
+    skipped and the scan returns what it has, marked incomplete (see
+    size_tree.FLAG_INCOMPLETE). With a per-directory timeout, a listing stuck
+    in the kernel is abandoned as well, so all workers are free within a
+    fraction of a second.
+
+    Args:
+        deadline (float or None): Seconds from now after which the token
+            cancels itself, a global deadline for everything it is passed to.
+    """
+
+    def __init__(self, deadline=None):
+        self._event = threading.Event()
+        self.deadline = time.monotonic() + deadline if deadline is not None else None
+        self.reason = None
+
+    def cancel(self, reason=CANCELLED):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self):
+        if self._event.is_set():
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(DEADLINE)
+            return True
+        return False
+
+    def remaining(self):
+        """Seconds left before the deadline, or None without one."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
@@ -1,149 +1,458 @@
 import os
+import json
+import heapq
 import logging
-from file_size import calculate_size, format_file_size
+from collections import deque
+from file_size import format_file_size
+from size_tree import build_size_tree, iter_nodes, walk_sizes, _TreeBuilder, _check_root, _make_lister, SIZE_MODES
+from scan_filters import compile_filter, pruner
+from fs_listing import LISTING_TIMED_OUT, LISTING_CANCELLED, LISTING_ERRORS
+from scan_scheduler import default_worker_count
+from sampling import sample_sizes, format_estimate
 from concurrent.futures import ThreadPoolExecutor
 
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+TOP_ITEM_KINDS = ("files", "dirs", "both")
+RECORD_FORMATS = ("text", "ndjson")
+# Last line of the output of a scan that was cancelled or ran past its deadline.
+INCOMPLETE_LINE = "[INCOMPLETE] The scan was stopped before it finished; sizes are lower bounds.\n"
 
 
-import os
+def _file_line(indent, name, size, allocated, is_link, duplicate):
+    prefix = ("[SYMLINK] " if is_link else "") + ("[HARDLINK] " if duplicate else "")
+    return f"{indent}{prefix}{name} - {format_file_size(size)} ({format_file_size(allocated)} on disk)\n"
+
+
+def _iter_tree_lines(root, level, filters):
+    """Yields the text lines of a size tree in the format printed by scan_directory; ``filters`` is compiled."""
+    stack = [(root, level)]
+    while stack:
+        node, level = stack.pop()
+        indent = "    " * level
+        if node.is_mount:
+            yield f"{indent}[MOUNT] {node.name} (not scanned)\n"
+            continue
+        if node.is_link and node.children is None:
+            yield f"{indent}[SYMLINK] {node.name} -> {node.link_target}\n"
+            continue
+        if node.denied:
+            yield f"{indent}[ACCESS DENIED]\n"
+            continue
+        if node.timed_out:
+            yield f"{indent}[TIMED OUT]\n"
+            continue
+        if node.incomplete and node.tree.first_child[node.index] < 0:
+            yield f"{indent}[NOT SCANNED]\n"
+            continue
+
+        subdirs = []
+        for child in node.sorted_children():
+            if child.is_dir:
+                if filters is None or not filters.prunes(child.name, child.path):
+                    subdirs.append(child)
+            elif filters is None or filters.matches(child.path, child.size):
+                yield _file_line(indent, child.name, child.size, child.allocated, child.is_link, child.is_duplicate)
+        # Files of a directory are printed before the contents of its subdirectories.
+        stack.extend((child, level + 1) for child in reversed(subdirs))
+
+
+class _StreamFrame:
+    """A directory whose listing has been streamed and whose subdirectories are still pending."""
+
+    __slots__ = ("path", "level", "is_link", "size", "allocated", "subdirs", "prefetched")
+
+    def __init__(self, path, level, is_link):
+        self.path = path
+        self.level = level
+        self.is_link = is_link
+        self.size = 0
+        self.allocated = 0
+        self.subdirs = deque()
+        self.prefetched = {}
+
+
+def _record(kind, path, size, allocated, is_link, **extra):
+    record = {"type": kind, "path": path, "size": size, "allocated": allocated, "is_link": is_link}
+    record.update(extra)
+    return json.dumps(record) + "\n"
+
+
+def _iter_tree_records(root, filters):
+    """Yields the NDJSON records of a size tree in the order iter_scan_lines streams them; ``filters`` is compiled."""
+    # A directory is pushed a second time (closing=True) so that its record follows its subtree.
+    stack = [(root, False)]
+    while stack:
+        node, closing = stack.pop()
+        if closing:
+            yield _record("dir", node.path, node.size, node.allocated, node.is_link)
+            continue
+        if node.is_mount:
+            yield _record("dir", node.path, 0, 0, False, mount=True)
+            continue
+        if node.is_link and node.children is None:
+            yield _record("dir", node.path, 0, 0, True, target=node.link_target)
+            continue
+        if node.denied:
+            yield _record("dir", node.path, 0, 0, node.is_link, denied=True)
+            continue
+        if node.timed_out:
+            yield _record("dir", node.path, 0, 0, node.is_link, timed_out=True)
+            continue
+
+        subdirs = []
+        for child in node.sorted_children():
+            if child.is_dir:
+                if filters is None or not filters.prunes(child.name, child.path):
+                    subdirs.append(child)
+            elif filters is None or filters.matches(child.path, child.size):
+                extra = {"duplicate": True} if child.is_duplicate else {}
+                yield _record("file", child.path, child.size, child.allocated, child.is_link, **extra)
+        stack.append((node, True))
+        stack.extend((child, False) for child in reversed(subdirs))
 
-def count_filtered_items(directory, filters_enabled=False, filters=None):
+
+def iter_scan_lines(path, level=0, filters=None, record_format="text", follow_symlinks=True, workers=None,
+                    cache=None, prefetch=8, backend=None, mounts=None, dir_timeout=None, metrics=None, cancel=None,
+                    tree=None):
     """
-    Counts the number of items in a directory, applying optional file filters.
+    Scans a directory and yields its tree line by line while the scan runs.
+
+    Directories are walked depth-first in the same sorted order as
+    scan_directory, so the output is deterministic. A directory's lines are
+    yielded as soon as it has been listed; listings of the next ``prefetch``
+    subdirectories of every open directory are fetched in the background.
+    Only the open directories are held in memory, and closing the generator
+    (for example when ``head`` closes the pipe) stops the scan.
 
     Args:
-        directory (str): The root directory path.
-        filters_enabled (bool): Whether to apply file type filters.
-        filters (list or None): A list of file extensions to filter, e.g., [".txt", ".py"].
+        path (str): The root directory path.
+        level (int): Indentation level of the root's entries (text format).
+        filters (list, str, ScanFilter or None): Which files to show, e.g.
+            [".txt", ".py"]; see scan_filters.ScanFilter.parse. Excluded
+            directories are not listed at all.
+        record_format (str): "text" for the scan_directory format, or "ndjson"
+            for one JSON record per line. Files are reported when their
+            directory is listed and directories (with their recursive
+            apparent and allocated sizes) when their subtree is complete.
+            A file already counted through another hardlink is marked
+            "duplicate" and left out of its directory's sizes.
+        follow_symlinks (bool): See size_tree.build_size_tree.
+        workers (int or None): Number of listing threads.
+        cache (ScanCache or None): Persistent cache of directory listings.
+        prefetch (int): Subdirectory listings fetched ahead per open directory.
+        backend (str or None): Directory listing backend, see fs_listing.get_lister.
+        mounts (MountPolicy or None): Mount points not to enter; see build_size_tree.
+        dir_timeout (float or None): Seconds before a single directory listing
+            is given up on; see build_size_tree.
+        metrics (ScanMetrics or None): Counts listings and times the
+            "list" and "render" phases; finished when the walk is done.
+        cancel (CancelToken or None): Stops the scan when cancelled or past
+            its deadline; the last line is then INCOMPLETE_LINE (an
+            "incomplete" record in NDJSON).
+        tree (SizeNode or None): A tree already built by build_size_tree for
+            ``path`` (e.g. by the "processes" mode); when given, its lines are
+            yielded in the same order and the filesystem is not touched again.
 
-    Returns:
-        int: The total number of items matching the filters.
+    Yields:
+        str: Lines ending with a newline.
     """
-    count = 0
-    try:
-        for root, dirs, files in os.walk(directory, followlinks=True):
-            if filters_enabled and filters:
-                # Filter files based on the provided extensions
-                filtered_files = [f for f in files if any(f.lower().endswith(ext.lower()) for ext in filters)]
-            else:
-                filtered_files = files
-            count += len(filtered_files)
-            count += len(dirs)  # Include directories in the count
-    except Exception as e:
-        print(f"Error counting filtered items in {directory}: {e}")
-    return count
-
-def scan_directory(path, level=0, visited=None, filters=None):
-    logging.debug(f"Scanning directory: {path} at level {level}")
-    if not os.path.exists(path):
-        logging.error(f"Path does not exist: {path}")
-        raise FileNotFoundError(f"Path '{path}' does not exist.")
+    if record_format not in RECORD_FORMATS:
+        raise ValueError(f"Unknown record format '{record_format}'. Expected one of: {', '.join(RECORD_FORMATS)}.")
+    filters = compile_filter(filters)
+    ndjson = record_format == "ndjson"
+    if tree is not None:
+        yield from _iter_tree_records(tree, filters) if ndjson else _iter_tree_lines(tree, level, filters)
+        if tree.incomplete:
+            reason = cancel.reason if cancel is not None else None
+            yield (json.dumps({"type": "incomplete", "path": path, "reason": reason}) + "\n" if ndjson
+                   else INCOMPLETE_LINE)
+        return
+    logging.debug(f"Streaming scan of {path} at level {level}")
+    _check_root(path)
+    prune = pruner(filters)
+    lister = _make_lister(cache, backend, dir_timeout, metrics, cancel)
+    builder = _TreeBuilder(None, os.path.realpath(path), follow_symlinks, lister, mounts=mounts)
+    workers = workers or default_worker_count()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    if metrics is not None:
+        metrics.watch(None, workers)
 
-    if visited is None:
-        visited = set()
+    def top_up(frame):
+        wanted = 0
+        for _, entry_path, _, _, follow, _ in frame.subdirs:
+            if wanted == prefetch:
+                break
+            if follow:
+                wanted += 1
+                if entry_path not in frame.prefetched:
+                    frame.prefetched[entry_path] = executor.submit(builder.lister, entry_path)
 
-    resolved_path = os.path.realpath(path)
-    if resolved_path in visited:
-        logging.warning(f"Cycle detected, skipping: {resolved_path}")
-        return f"{'    ' * level}[SYMLINK] {os.path.basename(path)} -> {os.readlink(path)}\n"
+    def open_dir(frame, future):
+        entries, denied = future.result()
+        if denied == LISTING_CANCELLED:
+            return []
+        if metrics is None:
+            return render(frame, entries, denied)
+        with metrics.phase("render"):
+            return render(frame, entries, denied)
+
+    def render(frame, entries, denied):
+        indent = "    " * frame.level
+        if denied == LISTING_TIMED_OUT:
+            return [_record("dir", frame.path, 0, 0, frame.is_link, timed_out=True) if ndjson
+                    else f"{indent}[TIMED OUT]\n"]
+        if denied:
+            return [_record("dir", frame.path, 0, 0, frame.is_link, denied=True) if ndjson
+                    else f"{indent}[ACCESS DENIED]\n"]
+        lines = []
+        entries = sorted(entries, key=lambda e: e[0].lower())
+        for name, entry_path, is_dir, is_link, size, _, link_target, allocated, hardlink in entries:
+            if is_dir:
+                if prune is not None and prune(name, entry_path):
+                    continue
+                mount = not is_link and builder.stops_at_mount(name, entry_path)
+                with builder.lock:
+                    follow = not mount and (not is_link or builder.follows_link(entry_path))
+                frame.subdirs.append((name, entry_path, is_link, link_target, follow, mount))
+                continue
+            # Only this thread walks the tree, so the first hardlink in output order is the one counted.
+            duplicate = hardlink is not None and not builder.hardlinks.add(*hardlink)
+            if not duplicate:
+                frame.size += size
+                frame.allocated += allocated
+            if filters is not None and not filters.matches(entry_path, size):
+                continue
+            if ndjson:
+                extra = {"duplicate": True} if duplicate else {}
+                lines.append(_record("file", entry_path, size, allocated, is_link, **extra))
+            else:
+                lines.append(_file_line(indent, name, size, allocated, is_link, duplicate))
+        top_up(frame)
+        return lines
 
-    visited.add(resolved_path)
-    result = []
-    try:
-        items = sorted(os.listdir(path), key=lambda x: x.lower())
-        if not items:  # Добавляем проверку на пустую директорию
-            return ""  # Пустая директория не выводит свой путь
-        with ThreadPoolExecutor() as executor:
-            futures = []
-
-            for item in items:
-                item_path = os.path.join(path, item)
-                if os.path.islink(item_path):
-                    logging.debug(f"Found symlink: {item_path}")
-                    if os.path.isdir(item_path):
-                        futures.append(executor.submit(scan_directory, item_path, level + 1, visited, filters))
-                    elif filters is None or any(item_path.endswith(f) for f in filters):
-                        size = calculate_size(item_path)
-                        formatted_size = format_file_size(size)
-                        result.append(f"{'    ' * level}[SYMLINK] {item} - {formatted_size}\n")
-                elif os.path.isdir(item_path):
-                    futures.append(executor.submit(scan_directory, item_path, level + 1, visited, filters))
-                elif filters is None or any(item_path.endswith(f) for f in filters):
-                    size = calculate_size(item_path)
-                    formatted_size = format_file_size(size)
-                    result.append(f"{'    ' * level}{item} - {formatted_size}\n")
-
-            for future in futures:
-                try:
-                    result.append(future.result())
-                except Exception as e:
-                    logging.error(f"Error processing item: {e}")
-    except PermissionError as e:
-        logging.warning(f"Permission denied: {path}. Exception: {e}")
-        result.append(f"{'    ' * level}[ACCESS DENIED]\n")
-    except FileNotFoundError:
-        logging.warning(f"Path not found: {path}")
-
-    return "".join(result)
-
-def calculate_total_items(path):
-    """Calculate total items in the directory tree for progress tracking."""
-    total = 0
     try:
-        for _, dirs, files in os.walk(path):
-            total += len(dirs) + len(files)
-    except Exception as e:
-        logging.error(f"Error calculating total items: {e}")
-    return total
-def get_top_5_heavy_items(directory, filters=None):
+        root = _StreamFrame(path, level, False)
+        yield from open_dir(root, executor.submit(builder.lister, path))
+        stack = [root]
+        while stack:
+            if cancel is not None and cancel.cancelled:
+                logging.warning(f"Scan of {path} stopped ({cancel.reason}); the output is incomplete")
+                yield (json.dumps({"type": "incomplete", "path": path, "reason": cancel.reason}) + "\n" if ndjson
+                       else INCOMPLETE_LINE)
+                break
+            frame = stack[-1]
+            if not frame.subdirs:
+                stack.pop()
+                if ndjson:
+                    yield _record("dir", frame.path, frame.size, frame.allocated, frame.is_link)
+                if stack:
+                    stack[-1].size += frame.size
+                    stack[-1].allocated += frame.allocated
+                continue
+
+            name, entry_path, is_link, link_target, follow, mount = frame.subdirs.popleft()
+            if mount:
+                yield (_record("dir", entry_path, 0, 0, False, mount=True) if ndjson
+                       else f"{'    ' * (frame.level + 1)}[MOUNT] {name} (not scanned)\n")
+                continue
+            if not follow:
+                yield (_record("dir", entry_path, 0, 0, True, target=link_target) if ndjson
+                       else f"{'    ' * (frame.level + 1)}[SYMLINK] {name} -> {link_target}\n")
+                continue
+            future = frame.prefetched.pop(entry_path, None) or executor.submit(builder.lister, entry_path)
+            top_up(frame)
+            child = _StreamFrame(entry_path, frame.level + 1, is_link)
+            yield from open_dir(child, future)
+            stack.append(child)
+        if cache is not None:
+            cache.finish_scan()
+        if metrics is not None:
+            metrics.finish()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        LISTING_ERRORS.flush()
+
+
+def scan_directory(path, level=0, filters=None, tree=None, workers=None, mode="threads", cache=None,
+                   backend=None, mounts=None, dir_timeout=None, metrics=None, cancel=None):
     """
-    Get the 5 largest files or directories in the specified directory with optional filters.
+    Scans a directory and returns its tree as indented text.
+
+    Args:
+        path (str): The root directory path.
+        level (int): Indentation level of the root's entries.
+        filters (list, str, ScanFilter or None): Which files to show; see
+            scan_filters.ScanFilter.parse.
+        tree (SizeNode or None): A tree already built by build_size_tree for
+            ``path``; when given, the filesystem is not touched again.
+        workers (int or None): Number of scan workers sharing one thread pool
+            (or worker processes in "processes" mode).
+        mode (str): Scan mode, "threads" or "processes".
+        cache (ScanCache or None): Persistent cache of directory listings.
+        backend (str or None): Directory listing backend, see fs_listing.get_lister.
+        mounts (MountPolicy or None): Mount points not to enter; see build_size_tree.
+        dir_timeout (float or None): Per-directory listing timeout; see build_size_tree.
+        metrics (ScanMetrics or None): Scan counters and phase timers; see scan_metrics.
+        cancel (CancelToken or None): Stops the scan early; the partial tree
+            ends with INCOMPLETE_LINE.
+
+    Returns:
+        str: The rendered tree.
+    """
+    logging.debug(f"Scanning directory: {path} at level {level}")
+    filters = compile_filter(filters)
+    if tree is None and mode == "processes":
+        tree = build_size_tree(path, follow_symlinks=True, workers=workers, mode=mode, prune=pruner(filters),
+                               backend=backend, mounts=mounts, dir_timeout=dir_timeout, metrics=metrics, cancel=cancel)
+    if tree is None:
+        return "".join(iter_scan_lines(path, level, filters, workers=workers, cache=cache, backend=backend,
+                                       mounts=mounts, dir_timeout=dir_timeout, metrics=metrics, cancel=cancel))
+    if metrics is None:
+        text = "".join(_iter_tree_lines(tree, level, filters))
+    else:
+        with metrics.phase("render"):
+            text = "".join(_iter_tree_lines(tree, level, filters))
+    return text + INCOMPLETE_LINE if tree.incomplete else text
+
+
+def get_top_heavy_items(directory, n=5, kind="both", filters=None, tree=None, workers=None, mode="threads",
+                        cache=None, backend=None, size_mode="apparent", mounts=None, dir_timeout=None,
+                        metrics=None, cancel=None, sample_budget=None, seed=None):
     """
-    logging.info(f"Retrieving top 5 heaviest items in: {directory}")
+    Get the N largest files and/or directories under a directory.
+
+    Directories are weighed by their full recursive size, with every
+    hardlinked inode counted once. Only a heap of the current N largest items
+    is kept, so memory does not grow with the number of files; without a
+    prebuilt tree the walk does not keep a tree either.
+
+    Args:
+        directory (str): The root directory path.
+        n (int): How many items to return.
+        kind (str): "files", "dirs" or "both".
+        filters (list, str, ScanFilter or None): Only items that match; see
+            scan_filters.ScanFilter.parse. Excluded directories are skipped
+            without being listed.
+        tree (SizeNode or None): A tree already built for ``directory``.
+        workers, mode, cache, backend, mounts, dir_timeout, metrics, cancel:
+            Scan engine options, see build_size_tree. A cancelled scan
+            ranks what it got to.
+        size_mode (str): Rank by "apparent" size or by "allocated" space on disk.
+        sample_budget (float or None): Seconds for an approximate answer
+            instead of a full scan, see sampling.sample_sizes. Only the
+            top-level entries are ranked then.
+        seed (int or None): Seed for the sampling probes.
+
+    Returns:
+        list: Dicts with "name" (path), "size" and "allocated" (formatted),
+        "bytes" and "allocated_bytes" (raw sizes), largest first. Sampled
+        results carry only the ``size_mode`` pair (the other is None), plus
+        "estimated", "low", "high", "visited_dirs" and "estimated_dirs".
+    """
+    logging.info(f"Retrieving top {n} heaviest items in: {directory}")
+    if kind not in TOP_ITEM_KINDS:
+        raise ValueError(f"Unknown item kind '{kind}'. Expected one of: {', '.join(TOP_ITEM_KINDS)}.")
+    if size_mode not in SIZE_MODES:
+        raise ValueError(f"Unknown size mode '{size_mode}'. Expected one of: {', '.join(SIZE_MODES)}.")
     if not os.path.isdir(directory):
         raise NotADirectoryError(f"'{directory}' is not a valid directory.")
+    if n <= 0:
+        return []
 
-    def apply_filters(item_path):
-        if not filters:
-            return True
-        return any(item_path.endswith(ext.strip()) for ext in filters)
+    filters = compile_filter(filters)
+    prune = pruner(filters)
+    if tree is None and sample_budget is not None:
+        return _sampled_top_items(directory, n, kind, filters, size_mode, sample_budget, seed, cache=cache,
+                                  backend=backend, prune=prune, mounts=mounts, dir_timeout=dir_timeout, cancel=cancel)
+    heap = []
+    root_path = tree.path if tree is not None else directory
 
-    items = []
-    visited = set()
+    by_allocated = size_mode == "allocated"
+
+    def consider(path, size, allocated, is_dir, is_link):
+        if is_dir and (is_link or kind == "files" or path == root_path):
+            return
+        if not is_dir and kind == "dirs":
+            return
+        if filters is not None and not filters.matches(path, size):
+            return
+        # Ties go to the lexicographically smaller path, so results are deterministic.
+        item = (allocated if by_allocated else size, _ReversedPath(path), size, allocated)
+        if len(heap) < n:
+            heapq.heappush(heap, item)
+        elif item > heap[0]:
+            heapq.heapreplace(heap, item)
+
+    if tree is None and mode == "processes":
+        tree = build_size_tree(directory, workers=workers, mode=mode, prune=prune, backend=backend, mounts=mounts,
+                               dir_timeout=dir_timeout, metrics=metrics, cancel=cancel)
+    if tree is not None:
+        for node in iter_nodes(tree, prune):
+            if not node.is_duplicate:
+                consider(node.path, node.size, node.allocated, node.is_dir, node.is_link)
+    else:
+        walk_sizes(directory, consider, workers=workers,
+                   lister=_make_lister(cache, backend, dir_timeout, metrics, cancel), prune=prune, mounts=mounts,
+                   metrics=metrics, cancel=cancel)
+        if cache is not None:
+            cache.finish_scan()
 
-    for root, dirs, files in os.walk(directory):
-        resolved_root = os.path.realpath(root)
-        if resolved_root in visited:
+    items = sorted(heap, reverse=True)
+    logging.info(f"Top {n} heaviest items retrieved.")
+    return [{"name": path.value, "size": format_file_size(size), "bytes": size,
+             "allocated": format_file_size(allocated), "allocated_bytes": allocated}
+            for _, path, size, allocated in items]
+
+
+def _sampled_top_items(directory, n, kind, filters, size_mode, budget, seed, **scan_options):
+    scan = sample_sizes(directory, budget, size_mode, seed, **scan_options)
+    items = []
+    for item in scan.items:
+        if (kind == "files" and item.is_dir) or (kind == "dirs" and not item.is_dir):
             continue
-        visited.add(resolved_root)
+        if filters is not None and not filters.matches(item.path, item.size):
+            continue
+        formatted = format_estimate(item)
+        sizes = {"size": None, "bytes": None, "allocated": formatted, "allocated_bytes": item.size}
+        if size_mode == "apparent":
+            sizes = {"size": formatted, "bytes": item.size, "allocated": None, "allocated_bytes": None}
+        items.append(dict(name=item.path, estimated=not item.exact, low=item.low, high=item.high,
+                          visited_dirs=item.visited_dirs, estimated_dirs=item.estimated_dirs, **sizes))
+        if len(items) == n:
+            break
+    logging.info(f"Top {n} items estimated from {scan.visited_dirs} of about {scan.estimated_dirs} directories.")
+    return items
 
-        for file in files:
-            file_path = os.path.join(root, file)
-            if not apply_filters(file_path):
-                continue
-            try:
-                size = os.path.getsize(file_path)
-                items.append({"name": file_path, "size": size})
-            except FileNotFoundError:
-                logging.warning(f"File not found: {file_path}")
-
-        for dir_name in dirs:
-            dir_path = os.path.join(root, dir_name)
-            if not apply_filters(dir_path):
-                continue
-            resolved_path = os.path.realpath(dir_path)
-            if resolved_path in visited:
-                continue
-            try:
-                size = sum(
-                    os.path.getsize(os.path.join(dir_path, f)) for f in os.listdir(dir_path)
-                    if os.path.isfile(os.path.join(dir_path, f))
-                )
-                items.append({"name": dir_path, "size": size})
-            except FileNotFoundError:
-                logging.warning(f"Directory not found: {dir_path}")
-
-    items = sorted(items, key=lambda x: x["size"], reverse=True)[:5]
-    logging.info("Top 5 heaviest items retrieved.")
-    return [{"name": item["name"], "size": format_file_size(item["size"])} for item in items]
+
+def format_item_sizes(item):
+    """Renders the sizes of a get_top_heavy_items entry, e.g. "1.2 MB (1.3 MB on disk)"."""
+    # Sampled items only carry the size they were ranked by.
+    if item["allocated"] is None:
+        return item["size"]
+    if item["size"] is None:
+        return f"{item['allocated']} on disk"
+    return f"{item['size']} ({item['allocated']} on disk)"
+
+
+class _ReversedPath:
+    """Orders paths backwards, so that a min-heap of (size, path) evicts the larger path on ties."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return self.value > other.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def get_top_5_heavy_items(directory, filters=None, tree=None, workers=None, mode="threads", cache=None,
+                          backend=None, size_mode="apparent", mounts=None, dir_timeout=None, metrics=None,
+                          cancel=None, sample_budget=None, seed=None):
+    """
+    Get the 5 largest files or directories in the specified directory with optional filters.
+    """
+    return get_top_heavy_items(directory, 5, "both", filters, tree, workers, mode, cache, backend, size_mode,
+                               mounts, dir_timeout, metrics, cancel, sample_budget, seed)
@@ -1,16 +1,36 @@
 import os
+import bisect
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import threading
-from queue import Queue, Empty
-from disk_scanner import calculate_total_items, get_top_5_heavy_items
-from visualizer import visualize_disk_usage, plot_disk_usage
-from file_size import format_file_size, calculate_size
+import contextlib
+from disk_scanner import get_top_5_heavy_items, format_item_sizes
+from visualizer import (visualize_disk_usage, plot_disk_usage, plot_breakdowns, visualize_treemap, plot_treemap,
+                        DiskUsageExplorer)
+from file_size import format_file_size
+from size_tree import build_size_tree, ScanProgress, SCAN_MODES
+from scan_filters import compile_filter, pruner
+from scan_cache import ScanCache
+from watcher import SizeTreeWatcher
+from mounts import MountPolicy
+from snapshots import save_snapshot, diff_snapshots, format_diff
+from duplicates import find_duplicates, format_duplicates
+from breakdowns import breakdown
+from scan_metrics import ScanMetrics
+from cancellation import CancelToken
 import time
 import logging
 
-# Настройка логгирования
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+# Treeview заполняется лениво: строк за один вызов after() и строк до строки «ещё N»
+INSERT_BATCH = 500
+PAGE_SIZE = 5000
+PLACEHOLDER_TEXT = "Loading..."
+PROGRESS_INTERVAL_MS = 200
+# Папка, которая читается дольше (зависший NFS/FUSE), пропускается, чтобы скан не вставал целиком
+DIR_TIMEOUT_SECONDS = 30
+TREEMAP_SIZE = (1200, 800)
+# «Быстрая оценка»: диаграмма и топ-5 по случайной выборке папок за это время вместо полного скана
+SAMPLE_BUDGET_SECONDS = 10
 
 class DiskScannerGUI(tk.Tk):
     def __init__(self):
@@ -19,8 +39,34 @@ class DiskScannerGUI(tk.Tk):
         logging.info("Application started.")
         self.filters_enabled = tk.BooleanVar(value=False)
         self.filters = tk.StringVar()
+        self.scan_mode = tk.StringVar(value="threads")
+        # Кэш выключен по умолчанию: дописанные на месте файлы (логи, базы) он показывает со старым размером
+        self.use_cache = tk.BooleanVar(value=False)
+        self.watch_enabled = tk.BooleanVar(value=False)
+        self.one_filesystem = tk.BooleanVar(value=False)
+        self.quick_estimate = tk.BooleanVar(value=False)
+        self._scan_cache = None
+        self._compiled_filter = None
+        self._compiled_filter_text = None
+        self._watcher = None
+        self._size_tree = None
+        # Параметры скана для снимка, если дерево на экране собрано с кэшем; иначе None
+        self._snapshot_scan_options = None
+        self._scan_generation = 0
+        # Общий токен всех запущенных сканирований; кнопка Stop отменяет его и заводит новый
+        self._cancel = CancelToken()
+        # Счётчики и время фаз последнего сканирования, включая заполнение Treeview
+        self._metrics = None
+        # Связь строк Treeview с узлами дерева размеров
+        self._tree_items = {}
+        self._item_nodes = {}
+        self._unloaded = set()
+        self._more_rows = {}
+        # Открытые диаграммы отображаемого дерева; изменения от наблюдателя сбрасывают их кэш
+        self._explorers = []
         self.total_items = 0
         self._create_widgets()
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
 
     def _create_widgets(self):
         logging.debug("Initializing widgets.")
@@ -41,44 +87,98 @@ class DiskScannerGUI(tk.Tk):
         self.time_label = tk.Label(self, text="")
         self.time_label.pack(pady=5)
 
-        tk.Label(self, text="File Type Filters (comma-separated, e.g., .txt,.py):").pack(pady=5)
+        tk.Label(self, text="Filters (comma-separated, e.g., .txt,.py,size>1M,!node_modules):").pack(pady=5)
         filter_frame = tk.Frame(self)
         filter_frame.pack(pady=5)
         self.filter_entry = ttk.Entry(filter_frame, textvariable=self.filters, width=40)
         self.filter_entry.pack(side=tk.LEFT, padx=5)
         ttk.Checkbutton(filter_frame, text="Enable Filters", variable=self.filters_enabled).pack(side=tk.LEFT)
 
-        tk.Button(self, text="Scan and Display Tree", command=self._scan_and_display_tree).pack(pady=5)
-        tk.Button(self, text="Visualize Disk Usage", command=self._visualize_disk_usage).pack(pady=5)
+        mode_frame = tk.Frame(self)
+        mode_frame.pack(pady=5)
+        tk.Label(mode_frame, text="Scan mode:").pack(side=tk.LEFT)
+        ttk.Combobox(mode_frame, textvariable=self.scan_mode, values=SCAN_MODES,
+                     state="readonly", width=12).pack(side=tk.LEFT, padx=5)
+        ttk.Checkbutton(mode_frame, text="Use scan cache", variable=self.use_cache).pack(side=tk.LEFT)
+        ttk.Checkbutton(mode_frame, text="Watch for changes", variable=self.watch_enabled).pack(side=tk.LEFT)
+        ttk.Checkbutton(mode_frame, text="Stay on one filesystem", variable=self.one_filesystem).pack(side=tk.LEFT)
+
+        scan_frame = tk.Frame(self)
+        scan_frame.pack(pady=5)
+        tk.Button(scan_frame, text="Scan and Display Tree", command=self._scan_and_display_tree).pack(side=tk.LEFT,
+                                                                                                     padx=5)
+        tk.Button(scan_frame, text="Stop", command=self._stop_scans).pack(side=tk.LEFT)
+        visualize_frame = tk.Frame(self)
+        visualize_frame.pack(pady=5)
+        tk.Button(visualize_frame, text="Visualize Disk Usage", command=self._visualize_disk_usage).pack(side=tk.LEFT,
+                                                                                                        padx=5)
+        tk.Button(visualize_frame, text="Treemap", command=self._show_treemap).pack(side=tk.LEFT)
+        tk.Button(visualize_frame, text="Breakdowns", command=self._show_breakdowns).pack(side=tk.LEFT, padx=5)
         tk.Button(self, text="Show Top 5 Largest Items", command=self._show_top_5_heavy_items).pack(pady=5)
-
-        self.tree = ttk.Treeview(self, columns=("size"), displaycolumns=("size"))
+        ttk.Checkbutton(self, text=f"Quick estimate ({SAMPLE_BUDGET_SECONDS} s)",
+                        variable=self.quick_estimate).pack()
+        snapshot_frame = tk.Frame(self)
+        snapshot_frame.pack(pady=5)
+        tk.Button(snapshot_frame, text="Save Snapshot", command=self._save_snapshot).pack(side=tk.LEFT, padx=5)
+        tk.Button(snapshot_frame, text="Compare with Snapshot", command=self._compare_with_snapshot).pack(side=tk.LEFT)
+        tk.Button(snapshot_frame, text="Find Duplicates", command=self._find_duplicates).pack(side=tk.LEFT, padx=5)
+
+        # Видимый размер и место на диске (st_blocks) рядом; повторные жёсткие ссылки не суммируются
+        self.tree = ttk.Treeview(self, columns=("size", "allocated"), displaycolumns=("size", "allocated"))
         self.tree.heading("#0", text="Directory Structure", anchor="w")
         self.tree.heading("size", text="Size", anchor="w")
+        self.tree.heading("allocated", text="On disk", anchor="w")
         self.tree.column("size", anchor="w", width=100)
+        self.tree.column("allocated", anchor="w", width=100)
         self.tree.pack(fill=tk.BOTH, expand=True, pady=10)
+        self.tree.bind("<<TreeviewOpen>>", self._on_tree_open)
         logging.debug("Widgets initialized successfully.")
 
 
-    def count_filtered_items(self, directory):
-        """Подсчитывает количество элементов с учетом фильтров, включая символические ссылки."""
-        count = 0
-        try:
-            for root, dirs, files in os.walk(directory, followlinks=True):  # Добавлен параметр followlinks
-                # Применение фильтров для файлов
-                filtered_files = [f for f in files if self._apply_filters(os.path.join(root, f))]
-                count += len(filtered_files)
-                count += len(dirs)  # Все папки учитываются
-        except Exception as e:
-            logging.exception(f"Error counting filtered items in {directory}: {e}")
-        return count
+    def _scan_options(self):
+        """Scan engine options selected in the window."""
+        options = {"mode": self.scan_mode.get(), "dir_timeout": DIR_TIMEOUT_SECONDS, "cancel": self._cancel}
+        if self.one_filesystem.get():
+            options["mounts"] = MountPolicy(one_filesystem=True)
+        if self.use_cache.get():
+            if self._scan_cache is None:
+                self._scan_cache = ScanCache()
+            options["cache"] = self._scan_cache
+        return options
+
+    def _sample_budget(self):
+        return SAMPLE_BUDGET_SECONDS if self.quick_estimate.get() else None
+
+    def _stop_scans(self):
+        """Cancels every running scan; each one stops within a fraction of a second and keeps what it found."""
+        logging.info("Stopping the running scans.")
+        self._cancel.cancel()
+        self._cancel = CancelToken()
+        if self._metrics is not None and self._metrics.finished is None:
+            self.time_label["text"] = "Stopping..."
+
+    def _on_close(self):
+        # Без отмены окно закрылось бы, а процесс ждал бы окончания сканирования в рабочих потоках
+        self._cancel.cancel()
+        self._stop_watcher()
+        self.destroy()
+
+    def _active_filters(self):
+        """The filter from the entry field, compiled once per distinct text; None when filtering is off."""
+        if not self.filters_enabled.get():
+            return None
+        text = self.filters.get()
+        if text != self._compiled_filter_text:
+            self._compiled_filter = compile_filter(text)
+            self._compiled_filter_text = text
+        return self._compiled_filter
 
     def _apply_filters(self, file_path):
-        if not self.filters_enabled.get():
-            return True
-        filters = [f.strip() for f in self.filters.get().split(",") if f.strip()]
-        result = any(file_path.lower().endswith(f.lower()) for f in filters) if filters else True
-        logging.debug(f"Applying filters to {file_path}: {result}")
+        filters = self._active_filters()
+        result = filters is None or filters.matches(file_path)
+        # Вызывается для каждого файла: сообщение форматируется, только если DEBUG включён
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(f"Applying filters to {file_path}: {result}")
         return result
 
     def _browse_directory(self):
@@ -97,91 +197,320 @@ class DiskScannerGUI(tk.Tk):
             messagebox.showerror("Error", f"'{directory}' is not a valid directory.")
             return
         logging.info(f"Scanning directory: {directory}")
+        try:
+            filters = self._active_filters()
+        except ValueError as e:
+            messagebox.showerror("Error", f"Invalid filter: {e}")
+            return
+        self._stop_watcher()
+        self._explorers = []
+        scan_options = self._scan_options()
+        # Исключённые папки (например, !node_modules) не сканируются вовсе
+        scan_options["prune"] = pruner(filters)
+        # Снимок не берёт размеры из кэша: файлы, дописанные на месте, там со старым размером
+        self._snapshot_scan_options = ({key: value for key, value in scan_options.items() if key != "cache"}
+                                       if "cache" in scan_options else None)
+        # Отдельного прохода для подсчёта нет: оценка берётся из прошлого сканирования, если оно было
+        self.total_items = self._expected_entries(directory, scan_options.get("cache"))
+        logging.info(f"Expected items from the previous scan: {self.total_items or 'unknown'}")
+        progress = ScanProgress(self.total_items)
+        self._metrics = scan_options["metrics"] = ScanMetrics()
+        # Наблюдатель получает те же исключения и границы ФС, что и скан
+        watch = ({"prune": scan_options["prune"], "mounts": scan_options.get("mounts")}
+                 if self.watch_enabled.get() else None)
+        self._scan_generation += 1
+        self._size_tree = None
+        self._forget_rows("")
         self.tree.delete(*self.tree.get_children())
         self.progress_bar['value'] = 0
         self.time_label['text'] = ""
         self.loading_bar.start()
-        self.total_items = self.count_filtered_items(directory)
-        logging.info(f"Total filtered items to scan: {self.total_items}")
-        threading.Thread(target=self._scan_directory_with_progress, args=(directory,)).start()
-
-    def _scan_directory_with_progress(self, directory):
-        visited_paths = set()
-        progress_queue = Queue()
+        root_item = self.tree.insert("", "end", text=os.path.basename(directory), values=("Calculating...",), open=True)
+        # Настройки читаются здесь: переменные Tk нельзя трогать из рабочего потока
+        threading.Thread(target=self._scan_directory_with_progress, daemon=True,
+                         args=(directory, root_item, self._scan_generation, scan_options,
+                               watch, progress)).start()
+        self._poll_progress(self._scan_generation, progress)
+
+    def _expected_entries(self, directory, cache):
+        """Entry count of the last scan of ``directory``: the tree on screen, else the scan cache."""
+        previous = self._size_tree
+        if previous is not None and os.path.abspath(previous.path) == os.path.abspath(directory):
+            return len(previous.tree) - 1
+        if cache is not None:
+            totals = cache.cached_totals(directory)
+            if totals is not None:
+                return totals[1]
+        return 0
+
+    def _shows_directory(self, directory):
+        """Whether the displayed tree is the scan of ``directory``; False when either path is gone."""
+        current = self._size_tree
+        if current is None:
+            return False
+        try:
+            return os.path.samefile(current.path, directory)
+        except OSError:
+            # Отсканированную папку могли удалить или переименовать: тогда сканируем заново
+            return False
+
+    def _poll_progress(self, generation, progress):
+        """Shows the counters of the running scan; reschedules itself until the scan is done."""
+        if generation != self._scan_generation or progress.finished:
+            return
+        self.progress_bar["value"] = progress.fraction() * 100
+        eta = progress.eta()
+        remaining = f", remaining time: {eta:.0f}s" if eta is not None else ""
+        self.time_label["text"] = (f"Scanned {progress.entries} items, "
+                                   f"{progress.dirs_completed}/{progress.dirs_discovered} folders{remaining}\n"
+                                   f"{self._metrics.status_line()}")
+        self.after(PROGRESS_INTERVAL_MS, self._poll_progress, generation, progress)
+
+    def _scan_directory_with_progress(self, directory, root_item, generation, scan_options, watch, progress):
+        """Builds the size tree off the Tk thread and hands it to the widget via after()."""
         start_time = time.time()
-        SYMLINK_TIMEOUT = 5  # Тайм-аут в секундах для символических ссылок
-
-        def populate_treeview(tree, parent, path):
-            try:
-                for item in sorted(os.listdir(path), key=lambda x: x.lower()):
-                    item_path = os.path.join(path, item)
-
-                    # Проверка на символические ссылки
-                    if os.path.islink(item_path):
-                        logging.warning(f"Skipping symbolic link: {item_path}")
-                        progress_queue.put(1)  # Прогресс отмечается для символической ссылки
-                        continue
-
-                    if item_path in visited_paths:
-                        logging.debug(f"Skipping already visited path: {item_path}")
-                        continue
-                    visited_paths.add(item_path)
-
-                    is_dir = os.path.isdir(item_path)
-                    if not is_dir and not self._apply_filters(item_path):
-                        logging.info(f"Skipping file {item_path} due to filter.")
-                        progress_queue.put(1)  # Прогресс отмечается для отфильтрованного файла
-                        continue
-
-                    size = calculate_size(item_path)
-                    size_text = format_file_size(size)
-                    node_id = tree.insert(parent, "end", text=item, values=(size_text,), open=False)
-
-                    # Рекурсивный вызов для директорий
-                    if is_dir:
-                        logging.debug(f"Entering directory: {item_path}")
-                        populate_treeview(tree, node_id, item_path)
-
-                    progress_queue.put(1)  # Прогресс для файла или папки
-            except Exception as e:
-                logging.exception(f"Error populating treeview: {e}")
-
-        def update_progress_bar():
-            completed_items = 0
-            last_progress_time = time.time()
-
-            while completed_items < self.total_items:
-                try:
-                    # Проверка на тайм-аут
-                    if time.time() - last_progress_time > SYMLINK_TIMEOUT:
-                        logging.warning("No progress detected for a long time. Assuming scan is complete.")
-                        break
-
-                    # Обновление прогресса
-                    completed_items += progress_queue.get(timeout=0.5)
-                    last_progress_time = time.time()  # Обновляем время последнего прогресса
-
-                    elapsed_time = time.time() - start_time
-                    remaining_items = self.total_items - completed_items
-                    remaining_time = (elapsed_time / completed_items) * remaining_items if completed_items > 0 else 0
-
-                    # Обновление интерфейса
-                    self.progress_bar["value"] = (completed_items / self.total_items) * 100
-                    self.time_label["text"] = f"Remaining time: {remaining_time:.2f}s"
-                    self.update_idletasks()
-                except Empty:
+        try:
+            size_tree = build_size_tree(directory, progress=progress, **scan_options)
+        except Exception as e:
+            logging.exception(f"Error scanning {directory}: {e}")
+            progress.finish()
+            size_tree = None
+        self.after(0, self._finish_scan, root_item, generation, size_tree, watch, time.time() - start_time)
+
+    def _finish_scan(self, root_item, generation, size_tree, watch, elapsed):
+        # Устаревший скан не должен ни показывать дерево, ни запускать наблюдатель
+        if generation != self._scan_generation:
+            return
+        self.loading_bar.stop()
+        self.progress_bar["value"] = 100
+        if size_tree is None:
+            self.tree.item(root_item, values=("Error",))
+            self.time_label["text"] = "Scan failed!"
+            return
+        logging.info(f"Scan complete in {elapsed:.2f}s.")
+        self._size_tree = size_tree
+        self._tree_items[size_tree.index] = root_item
+        self._item_nodes[root_item] = size_tree.index
+        self.tree.item(root_item, values=(format_file_size(size_tree.size), format_file_size(size_tree.allocated)))
+        if watch is not None and not size_tree.incomplete:
+            self._start_watcher(size_tree, **watch)
+        self._load_children(root_item)
+        if size_tree.incomplete:
+            self.time_label["text"] = "Scan stopped: the sizes shown are incomplete."
+        else:
+            self.time_label["text"] = f"Scan complete! {self._metrics.status_line()}"
+
+    # --- ленивое заполнение Treeview ------------------------------------
+
+    def _tree_lock(self):
+        watcher = self._watcher
+        return watcher.lock if watcher is not None else contextlib.nullcontext()
+
+    def _on_tree_open(self, event=None):
+        item = self.tree.focus()
+        if item in self._more_rows:
+            self._load_more(item)
+        elif item in self._unloaded:
+            self._load_children(item)
+
+    def _load_children(self, item):
+        """Fills the children of a Treeview item from the size tree; only called when it is expanded."""
+        self._unloaded.discard(item)
+        self._forget_rows(item)
+        self.tree.delete(*self.tree.get_children(item))
+        # Сортировка большой папки идёт в фоне, чтобы окно не замирало
+        threading.Thread(target=self._collect_rows, daemon=True,
+                         args=(item, self._size_tree.tree, self._item_nodes[item], self._active_filters(),
+                               self._scan_generation)).start()
+
+    @staticmethod
+    def _child_row(child, filters):
+        """The row of a node, (index, text, size, allocated size, expandable); None when it is not shown."""
+        if child.is_link:
+            return None
+        if not child.is_dir and filters is not None and not filters.matches(child.path, child.size):
+            return None
+        expandable = child.is_dir and child.tree.first_child[child.index] >= 0
+        # Точки монтирования и папки, до которых остановленный скан не дошёл, подписываем
+        name = child.name
+        if child.is_mount:
+            name += " [mount, not scanned]"
+        elif child.incomplete:
+            name += " [not scanned, stopped]"
+        return child.index, name, format_file_size(child.size), format_file_size(child.allocated), expandable
+
+    def _collect_rows(self, item, tree, index, filters, generation):
+        with self._tree_lock():
+            rows = [row for row in (self._child_row(child, filters) for child in tree.node(index).sorted_children())
+                    if row is not None]
+        self.after(0, self._insert_rows, item, rows, 0, min(len(rows), PAGE_SIZE), generation)
+
+    def _insert_row(self, parent, position, row):
+        index, name, size_text, allocated_text, expandable = row
+        item = self.tree.insert(parent, position, text=name, values=(size_text, allocated_text), open=False)
+        self._tree_items[index] = item
+        self._item_nodes[item] = index
+        if expandable:
+            # Заглушка нужна, чтобы у папки появилась стрелка раскрытия
+            self.tree.insert(item, "end", text=PLACEHOLDER_TEXT)
+            self._unloaded.add(item)
+
+    def _insert_rows(self, parent, rows, start, stop, generation):
+        """Inserts rows[start:stop] under ``parent``, INSERT_BATCH rows per after() call."""
+        if generation != self._scan_generation or not self.tree.exists(parent):
+            return
+        started = time.perf_counter()
+        end = min(start + INSERT_BATCH, stop)
+        for row in rows[start:end]:
+            # Строку могло уже добавить обновление от наблюдателя
+            if row[0] not in self._tree_items:
+                self._insert_row(parent, "end", row)
+        if self._metrics is not None:
+            self._metrics.add_time("gui", time.perf_counter() - started)
+        if end < stop:
+            self.after(1, self._insert_rows, parent, rows, end, stop, generation)
+        elif stop < len(rows):
+            more = self.tree.insert(parent, "end", text=f"... {len(rows) - stop} more items (expand to show)",
+                                    values=("", ""), open=False)
+            self.tree.insert(more, "end", text=PLACEHOLDER_TEXT)
+            self._more_rows[more] = (parent, rows, stop)
+
+    def _load_more(self, more):
+        parent, rows, start = self._more_rows.pop(more)
+        self.tree.delete(more)
+        self._insert_rows(parent, rows, start, min(len(rows), start + PAGE_SIZE), self._scan_generation)
+
+    def _forget_rows(self, item):
+        """Drops the bookkeeping for everything below a Treeview item before it is deleted."""
+        stack = list(self.tree.get_children(item))
+        while stack:
+            child = stack.pop()
+            self._unloaded.discard(child)
+            self._more_rows.pop(child, None)
+            index = self._item_nodes.pop(child, None)
+            if index is not None and self._tree_items.get(index) == child:
+                del self._tree_items[index]
+            stack.extend(self.tree.get_children(child))
+        if item == "":
+            self._tree_items.clear()
+            self._item_nodes.clear()
+
+    def _delete_row(self, item):
+        self._forget_rows(item)
+        self._unloaded.discard(item)
+        self._more_rows.pop(item, None)
+        index = self._item_nodes.pop(item, None)
+        if index is not None and self._tree_items.get(index) == item:
+            del self._tree_items[index]
+        self.tree.delete(item)
+
+    def _start_watcher(self, root, prune=None, mounts=None):
+        self._stop_watcher()
+        try:
+            self._watcher = SizeTreeWatcher(root, on_change=self._on_watch_change, prune=prune, mounts=mounts).start()
+            logging.info(f"Watching {root.path} for changes.")
+        except OSError as e:
+            logging.error(f"Cannot watch {root.path}: {e}")
+
+    def _stop_watcher(self):
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+
+    def _on_watch_change(self, changed):
+        # Вызывается из потока наблюдателя; обновляем виджет в потоке Tk
+        self.after(0, self._refresh_changed_rows, changed)
+
+    def _refresh_changed_rows(self, changed):
+        """Updates only the rows of directories the watcher reported, and their ancestors."""
+        watcher = self._watcher
+        if watcher is None:
+            return
+        filters = self._active_filters()
+        with watcher.lock:
+            tree = watcher.tree
+            sizes = {}
+            for index in changed:
+                while index >= 0 and index not in sizes:
+                    sizes[index] = (tree.size[index], tree.allocated[index])
+                    index = tree.parent[index]
+            # Свёрнутые папки перечитаются при раскрытии; для раскрытых берём содержимое без сортировки
+            listings = {}
+            for index in changed:
+                item = self._tree_items.get(index)
+                if item is None or item in self._unloaded or not self.tree.exists(item):
                     continue
-
-            # Завершение прогресс-бара
-            self.progress_bar["value"] = 100
-            logging.info("Scan complete.")
-            self.loading_bar.stop()
-            self.time_label["text"] = "Scan complete!"
-
-        # Запуск потоков
-        root_node = self.tree.insert("", "end", text=os.path.basename(directory), values=("Calculating...",), open=True)
-        threading.Thread(target=populate_treeview, args=(self.tree, root_node, directory)).start()
-        threading.Thread(target=update_progress_bar).start()
+                listing = {}
+                for child in tree.node(index).children:
+                    row = self._child_row(child, filters)
+                    if row is not None:
+                        listing[child.index] = (child.name.lower(), row)
+                listings[item] = listing
+        for index, (size, allocated) in sizes.items():
+            item = self._tree_items.get(index)
+            if item is None or not self.tree.exists(item):
+                continue
+            self.tree.item(item, values=(format_file_size(size), format_file_size(allocated)))
+        for item, listing in listings.items():
+            self._sync_children(item, listing)
+        self._explorers = [explorer for explorer in self._explorers if explorer.window.winfo_exists()]
+        for explorer in self._explorers:
+            explorer.invalidate(sizes)
+
+    def _sync_children(self, parent, listing):
+        """
+        Brings the rows under an expanded item in line with ``listing``
+        ({node index: (sort key, row)}) without reloading them: shown rows
+        are updated in place, rows of removed entries are deleted and new
+        entries are inserted at their sorted position, so opened subfolders
+        stay open.
+        """
+        if not self.tree.exists(parent):
+            return
+        keys = []
+        shown = set()
+        more = None
+        for item in self.tree.get_children(parent):
+            if item in self._more_rows:
+                more = item
+                continue
+            index = self._item_nodes.get(item)
+            if index is None:
+                continue
+            if index not in listing:
+                self._delete_row(item)
+                continue
+            key, (_, name, size_text, allocated_text, expandable) = listing[index]
+            self.tree.item(item, text=name, values=(size_text, allocated_text))
+            if expandable and not self.tree.get_children(item):
+                self.tree.insert(item, "end", text=PLACEHOLDER_TEXT)
+                self._unloaded.add(item)
+            keys.append(key)
+            shown.add(index)
+        # Строки за «ещё N» пока не показаны: обновляем их в отложенном списке
+        pending = pending_keys = None
+        if more is not None:
+            _, rows, start = self._more_rows[more]
+            pending = [listing[row[0]][1] for row in rows[start:] if row[0] in listing]
+            pending_keys = [listing[row[0]][0] for row in pending]
+            shown.update(row[0] for row in pending)
+        for index, (key, row) in listing.items():
+            if index in shown:
+                continue
+            position = bisect.bisect_right(keys, key)
+            if more is not None and position == len(keys):
+                at = bisect.bisect_right(pending_keys, key)
+                pending_keys.insert(at, key)
+                pending.insert(at, row)
+            else:
+                self._insert_row(parent, position, row)
+                keys.insert(position, key)
+        if more is not None:
+            if pending:
+                self._more_rows[more] = (parent, pending, 0)
+                self.tree.item(more, text=f"... {len(pending)} more items (expand to show)")
+            else:
+                self._delete_row(more)
 
     def _visualize_disk_usage(self):
         directory = self.path_entry.get()
@@ -190,21 +519,94 @@ class DiskScannerGUI(tk.Tk):
             messagebox.showerror("Error", f"'{directory}' is not a valid directory.")
             return
         logging.info(f"Visualizing disk usage for: {directory}")
+        filters = self._active_filters()
+        budget = self._sample_budget()
+        if budget is None and self._shows_directory(directory):
+            # Диаграмма и переходы по папкам строятся из уже отсканированного дерева
+            watcher = self._watcher
+            self._explorers.append(DiskUsageExplorer(self._size_tree, filters=filters,
+                                                     lock=watcher.lock if watcher is not None else None))
+            return
+        scan_options = self._scan_options()
 
         def perform_visualization():
-            self.loading_bar.start()
             try:
-                filters = self.filters.get().split(",") if self.filters_enabled.get() else None
-                labels, sizes, formatted_sizes = visualize_disk_usage(directory, filters)
-                plot_disk_usage(labels, sizes, formatted_sizes)
+                if budget is None:
+                    root = build_size_tree(directory, prune=pruner(filters), **scan_options)
+                    # Окна Tk создаём только из главного потока
+                    self.after(0, lambda: DiskUsageExplorer(root, filters=filters))
+                else:
+                    labels, sizes, formatted_sizes = visualize_disk_usage(directory, filters, sample_budget=budget,
+                                                                          **scan_options)
+                    self.after(0, plot_disk_usage, labels, sizes, formatted_sizes)
                 logging.info("Visualization complete.")
             except Exception as e:
                 logging.exception("Visualization failed.")
-                messagebox.showerror("Error", str(e))
+                self.after(0, messagebox.showerror, "Error", str(e))
             finally:
-                self.loading_bar.stop()
+                self.after(0, self.loading_bar.stop)
 
-        threading.Thread(target=perform_visualization).start()
+        # Полосу загрузки и окна сообщений трогаем только из потока Tk; рабочий поток передаёт их через after()
+        self.loading_bar.start()
+        threading.Thread(target=perform_visualization, daemon=True).start()
+
+    def _show_treemap(self):
+        """Treemap of the directory: laid out from the displayed tree when it is the same one, else after a scan."""
+        directory = self.path_entry.get()
+        if not os.path.isdir(directory):
+            logging.error(f"Invalid directory: {directory}")
+            messagebox.showerror("Error", f"'{directory}' is not a valid directory.")
+            return
+        width, height = TREEMAP_SIZE
+        if self._shows_directory(directory):
+            current = self._size_tree
+            # Раскладка берёт готовые размеры из дерева и не обращается к диску
+            with self._tree_lock():
+                rects = visualize_treemap(directory, tree=current, width=width, height=height)
+            plot_treemap(rects, width, height, f"Treemap of {directory}")
+            return
+        logging.info(f"Scanning for the treemap: {directory}")
+        filters = self._active_filters()
+        scan_options = self._scan_options()
+
+        def scan():
+            try:
+                rects = visualize_treemap(directory, filters, width=width, height=height, **scan_options)
+                self.after(0, plot_treemap, rects, width, height, f"Treemap of {directory}")
+            except Exception as e:
+                logging.exception("Treemap failed.")
+                self.after(0, messagebox.showerror, "Error", str(e))
+            finally:
+                self.after(0, self.loading_bar.stop)
+
+        self.loading_bar.start()
+        threading.Thread(target=scan, daemon=True).start()
+
+    def _show_breakdowns(self):
+        """Charts bytes by file type, owner and last access; one extra scan that records times and owners."""
+        directory = self.path_entry.get()
+        if not os.path.isdir(directory):
+            logging.error(f"Invalid directory: {directory}")
+            messagebox.showerror("Error", f"'{directory}' is not a valid directory.")
+            return
+        logging.info(f"Computing breakdowns for: {directory}")
+        filters = self._active_filters()
+        options = self._scan_options()
+        options = {key: options[key] for key in ("mounts", "dir_timeout", "cancel") if key in options}
+
+        def compute():
+            try:
+                report = breakdown(directory, filters, **options)
+                # Окна Tk создаём только из главного потока
+                self.after(0, plot_breakdowns, report)
+            except Exception as e:
+                logging.exception("Computing the breakdowns failed.")
+                self.after(0, messagebox.showerror, "Error", str(e))
+            finally:
+                self.after(0, self.loading_bar.stop)
+
+        self.loading_bar.start()
+        threading.Thread(target=compute, daemon=True).start()
 
     def _show_top_5_heavy_items(self):
         directory = self.path_entry.get()
@@ -213,23 +615,115 @@ class DiskScannerGUI(tk.Tk):
             messagebox.showerror("Error", f"'{directory}' is not a valid directory.")
             return
         logging.info(f"Fetching top 5 largest items from: {directory}")
+        # Настройки читаются здесь: переменные Tk нельзя трогать из рабочего потока
+        filters = self._active_filters()
+        budget = self._sample_budget()
+        scan_options = self._scan_options()
+        watcher = self._watcher
 
         def fetch_top_5():
-            self.loading_bar.start()
             try:
-                filters = self.filters.get().split(",") if self.filters_enabled.get() else None
-                top_items = get_top_5_heavy_items(directory, filters)
-                result = "\n".join([f"{item['name']}: {item['size']}" for item in top_items])
+                if watcher is not None and os.path.samefile(watcher.root.path, directory):
+                    # Дерево поддерживается наблюдателем в актуальном состоянии, пересканирование не нужно
+                    with watcher.lock:
+                        top_items = get_top_5_heavy_items(directory, filters, tree=watcher.root)
+                else:
+                    top_items = get_top_5_heavy_items(directory, filters, sample_budget=budget, **scan_options)
+                result = "\n".join([f"{item['name']}: {format_item_sizes(item)}" for item in top_items])
                 logging.info(f"Top 5 items: {result}")
-                messagebox.showinfo("Top 5 Largest Items", result)
+                self.after(0, messagebox.showinfo, "Top 5 Largest Items", result)
             except Exception as e:
                 logging.exception("Failed to fetch top 5 items.")
+                self.after(0, messagebox.showerror, "Error", str(e))
+            finally:
+                self.after(0, self.loading_bar.stop)
+
+        self.loading_bar.start()
+        threading.Thread(target=fetch_top_5, daemon=True).start()
+
+    def _save_snapshot(self):
+        if self._size_tree is None:
+            messagebox.showerror("Error", "Scan a directory first.")
+            return
+        file_path = filedialog.asksaveasfilename(defaultextension=".dust",
+                                                 filetypes=[("Scan snapshots", "*.dust"), ("All files", "*")])
+        if not file_path:
+            return
+        if self._snapshot_scan_options is None:
+            try:
+                # Наблюдатель может менять дерево, поэтому сохраняем под его блокировкой
+                with self._tree_lock():
+                    save_snapshot(self._size_tree, file_path)
+            except OSError as e:
+                logging.exception("Saving the snapshot failed.")
                 messagebox.showerror("Error", str(e))
+            return
+        # Дерево на экране собрано с кэшем, поэтому для снимка папка сканируется заново без него
+        directory = self._size_tree.path
+        scan_options = dict(self._snapshot_scan_options, cancel=self._cancel)
+
+        def rescan():
+            try:
+                save_snapshot(build_size_tree(directory, **scan_options), file_path)
+                logging.info(f"Snapshot of {directory} saved to {file_path}")
+            except Exception as e:
+                logging.exception("Saving the snapshot failed.")
+                self.after(0, messagebox.showerror, "Error", str(e))
+            finally:
+                self.after(0, self.loading_bar.stop)
+
+        self.loading_bar.start()
+        threading.Thread(target=rescan, daemon=True).start()
+
+    def _compare_with_snapshot(self):
+        """Shows what grew between a saved snapshot and the tree currently displayed."""
+        if self._size_tree is None:
+            messagebox.showerror("Error", "Scan a directory first.")
+            return
+        file_path = filedialog.askopenfilename(filetypes=[("Scan snapshots", "*.dust"), ("All files", "*")])
+        if not file_path:
+            return
+        current = self._size_tree
+
+        def compare():
+            try:
+                with self._tree_lock():
+                    report = format_diff(diff_snapshots(file_path, current, n=10))
+                self.after(0, messagebox.showinfo, "Changes since the snapshot", report)
+            except Exception as e:
+                logging.exception("Comparing with the snapshot failed.")
+                self.after(0, messagebox.showerror, "Error", str(e))
             finally:
-                self.loading_bar.stop()
+                self.after(0, self.loading_bar.stop)
 
-        threading.Thread(target=fetch_top_5).start()
+        self.loading_bar.start()
+        threading.Thread(target=compare, daemon=True).start()
+
+    def _find_duplicates(self):
+        directory = self.path_entry.get()
+        if not os.path.isdir(directory):
+            logging.error(f"Invalid directory: {directory}")
+            messagebox.showerror("Error", f"'{directory}' is not a valid directory.")
+            return
+        logging.info(f"Searching for duplicates in: {directory}")
+        filters = self._active_filters()
+        scan_options = self._scan_options()
+
+        def search():
+            try:
+                report = find_duplicates(directory, filters=filters, **scan_options)
+                self.after(0, messagebox.showinfo, "Duplicate files", format_duplicates(report, n=10))
+            except Exception as e:
+                logging.exception("Searching for duplicates failed.")
+                self.after(0, messagebox.showerror, "Error", str(e))
+            finally:
+                self.after(0, self.loading_bar.stop)
+
+        self.loading_bar.start()
+        threading.Thread(target=search, daemon=True).start()
 
 if __name__ == "__main__":
+    # Логгирование настраивает только запускаемое приложение, а не импортируемые модули
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     app = DiskScannerGUI()
     app.mainloop()
@@ -0,0 +1,243 @@
+import os
+import hashlib
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from file_size import format_file_size
+from size_tree import build_size_tree, iter_nodes, walk_sizes, _make_lister, SIZE_MODES
+from scan_filters import compile_filter, pruner
+from scan_scheduler import default_worker_count
+
+# Bytes hashed at each end of a file before it is hashed completely.
+PARTIAL_BYTES = 64 * 1024
+# Read size for full hashes; hashlib releases the GIL for large updates, so threads hash in parallel.
+_READ_BUFFER = 1024 * 1024
+# Unreadable files are logged one by one up to this count, then only counted.
+_LOGGED_ERRORS = 5
+
+# ``paths`` are the identical files, sorted; ``reclaimable`` is what deleting all but the first would free.
+DuplicateGroup = namedtuple("DuplicateGroup", ["size", "digest", "paths", "reclaimable"])
+DuplicateReport = namedtuple("DuplicateReport", ["groups", "reclaimable", "candidates", "hashed_bytes", "complete"])
+
+
+def _read_at(fd, size, offset):
+    os.lseek(fd, offset, os.SEEK_SET)
+    chunks = []
+    while size > 0:
+        chunk = os.read(fd, min(size, _READ_BUFFER))
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _digest():
+    return hashlib.blake2b(digest_size=20)
+
+
+class _Hasher:
+    """Hashes candidate files for find_duplicates, through the digest cache when there is one."""
+
+    def __init__(self, cache, cancel):
+        self.cache = cache
+        self.cancel = cancel
+        self.lock = threading.Lock()
+        self.hashed_bytes = 0
+        self.errors = 0
+
+    def _failed(self, path, error):
+        with self.lock:
+            self.errors += 1
+            errors = self.errors
+        if errors <= _LOGGED_ERRORS:
+            logging.warning(f"Cannot hash {path}: {error}")
+
+    def _read(self, fd, size, offset=0):
+        data = _read_at(fd, size, offset)
+        with self.lock:
+            self.hashed_bytes += len(data)
+        return data
+
+    def _partial(self, fd, size):
+        # Files up to two blocks are read whole: their partial digest is already the full one.
+        digest = _digest()
+        if size <= 2 * PARTIAL_BYTES:
+            digest.update(self._read(fd, size))
+        else:
+            digest.update(self._read(fd, PARTIAL_BYTES))
+            digest.update(self._read(fd, PARTIAL_BYTES, size - PARTIAL_BYTES))
+        return digest.digest()
+
+    def _full(self, fd):
+        digest = _digest()
+        buffer = bytearray(_READ_BUFFER)
+        view = memoryview(buffer)
+        hashed = 0
+        os.lseek(fd, 0, os.SEEK_SET)
+        with open(fd, "rb", buffering=0, closefd=False) as f:
+            while True:
+                count = f.readinto(buffer)
+                if not count:
+                    break
+                digest.update(view[:count])
+                hashed += count
+        with self.lock:
+            self.hashed_bytes += hashed
+        return digest.digest()
+
+    def hash(self, path, size, full):
+        """
+        Returns the partial digest of ``path`` (or the full one with
+        ``full``), or None when the file cannot be read, no longer has the
+        scanned size, or the search was cancelled.
+        """
+        if self.cancel is not None and self.cancel.cancelled:
+            return None
+        try:
+            fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        except OSError as e:
+            self._failed(path, e)
+            return None
+        try:
+            stat = os.fstat(fd)
+            if stat.st_size != size:
+                return None
+            key = (stat.st_dev, stat.st_ino, stat.st_mtime_ns, size)
+            cached = self.cache.lookup_hashes(*key) if self.cache is not None else None
+            partial, complete = cached or (None, None)
+            if partial is None:
+                partial = self._partial(fd, size)
+            if full and complete is None:
+                complete = partial if size <= 2 * PARTIAL_BYTES else self._full(fd)
+            if self.cache is not None and cached != (partial, complete):
+                self.cache.store_hashes(*key, stat.st_mtime, partial, complete)
+            return complete if full else partial
+        except OSError as e:
+            self._failed(path, e)
+            return None
+        finally:
+            os.close(fd)
+
+
+def _regroup(executor, groups, hash_file):
+    """Splits every (size, files) group by the digests ``hash_file`` returns; keeps groups of two or more."""
+    jobs = [(size, path, allocated) for size, _, files in groups for path, allocated in files]
+    buckets = {}
+    for (size, path, allocated), digest in zip(jobs, executor.map(lambda job: hash_file(job[1], job[0]), jobs)):
+        if digest is not None:
+            buckets.setdefault((size, digest), []).append((path, allocated))
+    return [(size, digest, files) for (size, digest), files in buckets.items() if len(files) > 1]
+
+
+def find_duplicates(directory, min_size=1, filters=None, tree=None, workers=None, mode="threads", cache=None,
+                    backend=None, size_mode="apparent", mounts=None, dir_timeout=None, metrics=None, cancel=None):
+    """
+    Finds files with identical contents under a directory.
+
+    The sizes come from one scan (or from ``tree``). Files are grouped by
+    exact size first; only sizes shared by several files are read at all.
+    Those are hashed over their first and last PARTIAL_BYTES, and only files
+    that still match another one are hashed completely. Hashing runs on a
+    thread pool with large reads. Hardlinks to an inode already seen are
+    left out, since deleting them frees nothing, and so are symlinks.
+
+    Args:
+        directory (str): The root directory path.
+        min_size (int): Smallest file size to consider, in bytes; empty
+            files are skipped by default.
+        filters (list, str or ScanFilter): Only files matching the filter
+            are compared.
+        tree (SizeNode or None): A prebuilt tree to take the sizes from
+            instead of scanning.
+        workers (int or None): Scan workers and hashing threads.
+        mode, backend, mounts, dir_timeout, metrics: Scan engine options,
+            see build_size_tree.
+        cache (ScanCache or None): Used for the listings and to keep the
+            digests, so unchanged files are not read again by later searches.
+        size_mode (str): Count reclaimable bytes as "apparent" size or as
+            "allocated" space on disk.
+        cancel (CancelToken or None): Stops the scan and the hashing early;
+            files not hashed by then are left out of the result.
+
+    Returns:
+        DuplicateReport: DuplicateGroup's (largest reclaimable space first),
+        the total reclaimable bytes, how many files shared a size with
+        another one, how many bytes were read for hashing and whether the
+        search ran to completion.
+    """
+    if size_mode not in SIZE_MODES:
+        raise ValueError(f"Unknown size mode '{size_mode}'. Expected one of: {', '.join(SIZE_MODES)}.")
+    logging.info(f"Searching for duplicate files in: {directory}")
+    filters = compile_filter(filters)
+    prune = pruner(filters)
+    by_size = {}
+
+    def consider(path, size, allocated, is_dir, is_link):
+        if is_dir or is_link or size < min_size:
+            return
+        if filters is not None and not filters.matches(path, size):
+            return
+        by_size.setdefault(size, []).append((path, allocated))
+
+    complete = True
+    if tree is None and mode == "processes":
+        tree = build_size_tree(directory, workers=workers, mode=mode, prune=prune, backend=backend, mounts=mounts,
+                               dir_timeout=dir_timeout, metrics=metrics, cancel=cancel)
+    if tree is not None:
+        complete = not tree.incomplete
+        for node in iter_nodes(tree, prune):
+            if not node.is_duplicate:
+                consider(node.path, node.size, node.allocated, node.is_dir, node.is_link)
+    else:
+        complete = walk_sizes(directory, consider, workers=workers,
+                              lister=_make_lister(cache, backend, dir_timeout, metrics, cancel), prune=prune,
+                              mounts=mounts, metrics=metrics, cancel=cancel)
+        if cache is not None:
+            cache.finish_scan()
+
+    groups = [(size, None, files) for size, files in by_size.items() if len(files) > 1]
+    candidates = sum(len(files) for _, _, files in groups)
+    by_size = None
+    hasher = _Hasher(cache, cancel)
+    with ThreadPoolExecutor(workers or default_worker_count()) as executor:
+        groups = _regroup(executor, groups, lambda path, size: hasher.hash(path, size, False))
+        confirmed = [group for group in groups if group[0] <= 2 * PARTIAL_BYTES]
+        confirmed += _regroup(executor, [group for group in groups if group[0] > 2 * PARTIAL_BYTES],
+                              lambda path, size: hasher.hash(path, size, True))
+    if cache is not None:
+        cache.finish_hashing()
+    if hasher.errors > _LOGGED_ERRORS:
+        logging.warning(f"{hasher.errors} files could not be hashed in total.")
+
+    by_allocated = size_mode == "allocated"
+    result = []
+    for size, digest, files in confirmed:
+        files.sort()
+        reclaimable = sum(allocated if by_allocated else size for _, allocated in files[1:])
+        result.append(DuplicateGroup(size, digest.hex(), tuple(path for path, _ in files), reclaimable))
+    result.sort(key=lambda group: (-group.reclaimable, group.paths))
+    if cancel is not None and cancel.cancelled:
+        complete = False
+    report = DuplicateReport(result, sum(group.reclaimable for group in result), candidates, hasher.hashed_bytes,
+                             complete)
+    logging.info(f"Found {len(result)} groups of duplicates, {format_file_size(report.reclaimable)} reclaimable; "
+                 f"read {format_file_size(report.hashed_bytes)} of {candidates} candidate files.")
+    return report
+
+
+def format_duplicates(report, n=None):
+    """Renders a DuplicateReport as the text report printed by the CLI and shown by the GUI (the first ``n`` groups)."""
+    lines = [f"Reclaimable: {format_file_size(report.reclaimable)} in {len(report.groups)} groups of duplicate files"]
+    if not report.complete:
+        lines.append("The search was stopped early; more duplicates may exist.")
+    for i, group in enumerate(report.groups[:n], 1):
+        lines.append("")
+        lines.append(f"{i}. {format_file_size(group.reclaimable)} reclaimable: {len(group.paths)} copies of "
+                     f"{format_file_size(group.size)}")
+        lines.extend(f"   {path}" for path in group.paths)
+    if n is not None and len(report.groups) > n:
+        lines.append("")
+        lines.append(f"... and {len(report.groups) - n} more groups")
+    return "\n".join(lines)
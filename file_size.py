@@ -1,8 +1,8 @@
 import os
+import stat
+from size_tree import walk_sizes
 
 
-import os
-
 def format_file_size(bytes_size):
     if bytes_size >= 1024 ** 3:
         return f"{bytes_size / 1024 ** 3:.1f} GB"
@@ -14,16 +14,21 @@ def format_file_size(bytes_size):
 
 
 def calculate_size(path):
-    if os.path.isfile(path):
-        return os.path.getsize(path)
-    elif os.path.isdir(path):
-        total = 0
-        for dirpath, _, filenames in os.walk(path):
-            for file in filenames:
-                full_path = os.path.join(dirpath, file)
-                try:
-                    total += os.path.getsize(full_path)
-                except FileNotFoundError:
-                    pass
-        return total
-    return 0
+    """Returns the size of a file, or the total size of the files under a directory (0 if missing)."""
+    try:
+        info = os.stat(path)
+    except OSError:
+        return 0
+    if stat.S_ISREG(info.st_mode):
+        return info.st_size
+    if not stat.S_ISDIR(info.st_mode):
+        return 0
+    # The directory is walked through the same single-stat listing as the scanner.
+    totals = {}
+
+    def on_entry(entry_path, size, allocated, is_dir, is_link):
+        if entry_path == path:
+            totals["root"] = size
+
+    walk_sizes(path, on_entry, workers=1)
+    return totals.get("root", 0)
@@ -0,0 +1,467 @@
+import os
+import sys
+import errno
+import struct
+import ctypes
+import ctypes.util
+import logging
+import platform
+import queue
+import threading
+import time
+
+LISTING_BACKENDS = ("scandir", "statx")
+# Returned instead of True/False as the ``denied`` part of a listing that was given up on.
+LISTING_TIMED_OUT = "timed out"
+# ... or that was abandoned because the scan was cancelled while it ran.
+LISTING_CANCELLED = "cancelled"
+# How often a listing waiting for its thread checks the scan's cancel token.
+_CANCEL_POLL_SECONDS = 0.1
+
+
+class ListingStats:
+    """
+    Counts directory listings, entries and the metadata syscalls spent on them.
+
+    ``stats_per_entry`` is the number to watch for regressions: a scan that
+    learns types from d_type and stats each file once stays at or below 1.0.
+    Counters are added once per directory, so keeping them costs nothing per
+    entry.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.directories = 0
+            self.entries = 0
+            self.stat_calls = 0
+
+    def add(self, entries, stat_calls):
+        with self._lock:
+            self.directories += 1
+            self.entries += entries
+            self.stat_calls += stat_calls
+
+    @property
+    def stats_per_entry(self):
+        return self.stat_calls / self.entries if self.entries else 0.0
+
+
+# Shared by every scan in the process.
+LISTING_STATS = ListingStats()
+
+
+class ListingErrors:
+    """
+    Aggregates repeated listing errors into rate-limited log summaries.
+
+    A scan of a whole disk can fail on thousands of directories. The first
+    ``first`` errors of each kind ("permission denied", "not found",
+    "error", "timed out") are logged one by one; after that at most one
+    summary per kind is logged every ``interval`` seconds, with the count
+    and a few sample paths. ``flush`` logs what is left when a scan ends.
+    """
+
+    def __init__(self, first=5, interval=10.0, samples=3):
+        self.first = first
+        self.interval = interval
+        self.samples = samples
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = {}
+            self._samples = {}
+            self._unreported = {}
+            self._reported_at = time.monotonic()
+
+    def add(self, kind, path, message, level=logging.WARNING):
+        """Counts one error of ``kind`` at ``path``; ``message`` is only logged while the kind is below ``first``."""
+        with self._lock:
+            count = self.counts.get(kind, 0) + 1
+            self.counts[kind] = count
+            samples = self._samples.setdefault(kind, [])
+            if len(samples) < self.samples:
+                samples.append(path)
+            if count <= self.first:
+                summaries = None
+            else:
+                self._unreported[kind] = self._unreported.get(kind, 0) + 1
+                now = time.monotonic()
+                summaries = self._take_summaries() if now - self._reported_at >= self.interval else []
+        if summaries is None:
+            logging.log(level, message)
+            if count == self.first:
+                logging.log(level, f"Further '{kind}' errors are summarized every {self.interval:g}s")
+            return
+        for summary in summaries:
+            logging.warning(summary)
+
+    def _take_summaries(self):
+        # Called with the lock held.
+        summaries = [f"{kind}: {unreported} more directories ({self.counts[kind]} in total), "
+                     f"e.g. {', '.join(self._samples[kind])}"
+                     for kind, unreported in self._unreported.items()]
+        self._unreported = {}
+        self._reported_at = time.monotonic()
+        return summaries
+
+    def flush(self):
+        """Logs the errors not reported yet and starts counting afresh; called when a scan ends."""
+        with self._lock:
+            summaries = self._take_summaries()
+        for summary in summaries:
+            logging.warning(summary)
+        self.reset()
+
+
+# Shared by every scan in the process, like LISTING_STATS.
+LISTING_ERRORS = ListingErrors()
+
+
+def _listing_failed(path, error):
+    """Records why ``path`` could not be listed; returns True when it was for lack of permission."""
+    if isinstance(error, PermissionError):
+        LISTING_ERRORS.add("permission denied", path, f"Permission denied: {path}. Exception: {error}")
+        return True
+    if isinstance(error, FileNotFoundError):
+        LISTING_ERRORS.add("not found", path, f"Path not found: {path}")
+    else:
+        LISTING_ERRORS.add("error", path, f"Error listing {path}: {error}", logging.ERROR)
+    return False
+
+
+def _allocated(info):
+    # st_blocks is always in 512-byte units; Windows has no st_blocks, so report the apparent size.
+    blocks = getattr(info, "st_blocks", None)
+    return info.st_size if blocks is None else blocks * 512
+
+
+def list_directory(path, details=None):
+    """
+    Lists a single directory with os.scandir and returns its entries.
+
+    Types come from the DirEntry (d_type on Linux), so directories cost no
+    stat at all. Files cost one lstat, and a symlink one stat of its target
+    (cached by the DirEntry, so its size is free) plus one readlink. The same
+    lstat gives the allocated size and the link count.
+
+    Args:
+        path (str): The directory to list.
+        details (list or None): When given, (name, stat_result) of every
+            regular file is appended to it, for callers that need more
+            than sizes (see breakdowns.FileColumns); costs no extra stat.
+
+    Returns:
+        tuple: (entries, denied), where entries is a list of
+        (name, path, is_dir, is_link, size, inode, link_target, allocated, hardlink)
+        tuples and denied is True when the directory could not be read.
+        ``size`` is the apparent size and ``allocated`` the space taken on
+        disk (st_blocks * 512). ``hardlink`` is (st_dev, st_ino) for a file
+        with more than one link, so it can be counted once, and None otherwise.
+    """
+    entries = []
+    stat_calls = 0
+    try:
+        with os.scandir(path) as iterator:
+            for entry in iterator:
+                try:
+                    is_link = entry.is_symlink()
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_link, is_dir = False, False
+                size = allocated = 0
+                link_target = hardlink = None
+                if is_link:
+                    # is_dir() above stat'ed the target; readlink is the second call.
+                    stat_calls += 2
+                    try:
+                        link_target = os.readlink(entry.path)
+                    except OSError:
+                        link_target = None
+                if not is_dir:
+                    stat_calls += not is_link
+                    try:
+                        # Symlinks to files report the size of their target, like os.path.getsize.
+                        info = entry.stat(follow_symlinks=is_link)
+                        size = info.st_size
+                        allocated = _allocated(info)
+                        if info.st_nlink > 1 and not is_link:
+                            hardlink = (info.st_dev, info.st_ino)
+                        if details is not None and not is_link:
+                            details.append((entry.name, info))
+                    except OSError:
+                        pass
+                try:
+                    inode = entry.inode()
+                except OSError:
+                    inode = 0
+                entries.append((entry.name, entry.path, is_dir, is_link, size, inode, link_target, allocated,
+                                hardlink))
+    except OSError as e:
+        if _listing_failed(path, e):
+            return entries, True
+    LISTING_STATS.add(len(entries), stat_calls)
+    return entries, False
+
+
+# --- Linux getdents64 + statx backend ------------------------------------
+
+_DT_UNKNOWN = 0
+_DT_DIR = 4
+_DT_LNK = 10
+_AT_SYMLINK_NOFOLLOW = 0x100
+_AT_STATX_DONT_SYNC = 0x4000
+_STATX_TYPE = 0x1
+_STATX_NLINK = 0x4
+_STATX_SIZE = 0x200
+_STATX_BLOCKS = 0x400
+_S_IFMT = 0o170000
+_S_IFDIR = 0o040000
+_S_IFLNK = 0o120000
+# struct linux_dirent64 { u64 d_ino; s64 d_off; u16 d_reclen; u8 d_type; char d_name[]; }
+_DIRENT = struct.Struct("<QqHB")
+# The head of struct statx: mask, blksize, attributes, nlink, uid, gid, mode, (pad), ino, size, blocks
+_STATX_HEAD = struct.Struct("<IIQIIIH2xQQQ")
+# stx_dev_major and stx_dev_minor, after the four timestamps and the rdev pair
+_STATX_DEV = struct.Struct("<II")
+_STATX_DEV_OFFSET = 136
+_STATX_SIZEOF = 256
+_GETDENTS_BUFFER = 64 * 1024
+_SYS_GETDENTS64 = {"x86_64": 217, "aarch64": 61, "riscv64": 61, "i386": 220, "i686": 220, "armv7l": 217}
+
+_libc = None
+
+
+def _load_statx():
+    global _libc
+    if _libc is not None:
+        return _libc
+    if not sys.platform.startswith("linux"):
+        raise OSError(errno.ENOSYS, "The statx backend needs Linux")
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    if not hasattr(libc, "statx"):
+        raise OSError(errno.ENOSYS, "statx is not available in this C library")
+    libc.statx.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_uint, ctypes.c_void_p]
+    if hasattr(libc, "getdents64"):
+        libc.getdents64.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t]
+        libc.getdents64.restype = ctypes.c_ssize_t
+        libc.list_entries = libc.getdents64
+    else:
+        # glibc before 2.30 has no wrapper; go through syscall(2).
+        number = _SYS_GETDENTS64.get(platform.machine())
+        if number is None:
+            raise OSError(errno.ENOSYS, f"Unknown getdents64 syscall number on {platform.machine()}")
+        libc.syscall.restype = ctypes.c_long
+        libc.list_entries = lambda fd, buffer, size: libc.syscall(number, fd, buffer, ctypes.c_size_t(size))
+    _libc = libc
+    return libc
+
+
+def _statx(libc, dir_fd, name, flags, buffer):
+    """Returns (mode, size, allocated, hardlink) for ``name`` relative to ``dir_fd``, or None on failure."""
+    wanted = _STATX_TYPE | _STATX_SIZE | _STATX_BLOCKS | _STATX_NLINK
+    if libc.statx(dir_fd, name, flags | _AT_STATX_DONT_SYNC, wanted, buffer) != 0:
+        return None
+    _, _, _, nlink, _, _, mode, inode, size, blocks = _STATX_HEAD.unpack_from(buffer)
+    hardlink = None
+    if nlink > 1:
+        hardlink = (os.makedev(*_STATX_DEV.unpack_from(buffer, _STATX_DEV_OFFSET)), inode)
+    return mode, size, blocks * 512, hardlink
+
+
+def list_directory_statx(path):
+    """
+    Lists a single directory with raw getdents64 and statx calls (Linux only).
+
+    Entries are read in 64 KiB batches and stat'ed relative to the open
+    directory, asking statx only for the fields the scan uses. Returns the
+    same (entries, denied) tuple as list_directory.
+    """
+    libc = _load_statx()
+    entries = []
+    stat_calls = 0
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY | os.O_CLOEXEC)
+    except OSError as e:
+        return entries, _listing_failed(path, e)
+
+    buffer = ctypes.create_string_buffer(_GETDENTS_BUFFER)
+    stat_buffer = ctypes.create_string_buffer(_STATX_SIZEOF)
+    try:
+        while True:
+            length = libc.list_entries(fd, buffer, _GETDENTS_BUFFER)
+            if length < 0:
+                error = ctypes.get_errno()
+                _listing_failed(path, OSError(error, os.strerror(error)))
+                break
+            if length == 0:
+                break
+            data = buffer.raw[:length]
+            offset = 0
+            while offset < length:
+                inode, _, record_length, d_type = _DIRENT.unpack_from(data, offset)
+                raw_name = data[offset + _DIRENT.size:offset + record_length].split(b"\0", 1)[0]
+                offset += record_length
+                if raw_name in (b".", b".."):
+                    continue
+
+                is_link = d_type == _DT_LNK
+                is_dir = d_type == _DT_DIR
+                result = link_target = None
+                if d_type == _DT_UNKNOWN or not (is_dir or is_link):
+                    # One lstat per file; also answers the type where the filesystem leaves d_type unset.
+                    stat_calls += 1
+                    result = _statx(libc, fd, raw_name, _AT_SYMLINK_NOFOLLOW, stat_buffer)
+                    if result is not None:
+                        mode = result[0] & _S_IFMT
+                        is_link, is_dir = mode == _S_IFLNK, mode == _S_IFDIR
+                if is_link:
+                    stat_calls += 2
+                    result = _statx(libc, fd, raw_name, 0, stat_buffer)
+                    is_dir = result is not None and result[0] & _S_IFMT == _S_IFDIR
+                    if result is not None:
+                        result = result[:3] + (None,)
+                    try:
+                        link_target = os.fsdecode(os.readlink(raw_name, dir_fd=fd))
+                    except OSError:
+                        link_target = None
+                if is_dir or result is None:
+                    size, allocated, hardlink = 0, 0, None
+                else:
+                    _, size, allocated, hardlink = result
+                name = os.fsdecode(raw_name)
+                entries.append((name, os.path.join(path, name), is_dir, is_link, size, inode, link_target,
+                                allocated, hardlink))
+    finally:
+        os.close(fd)
+    LISTING_STATS.add(len(entries), stat_calls)
+    return entries, False
+
+
+def get_lister(backend="scandir"):
+    """
+    Returns the directory lister of a backend.
+
+    Args:
+        backend (str): "scandir" (portable, the default) or "statx" (Linux,
+            raw getdents64/statx through ctypes).
+
+    Returns:
+        callable: ``lister(path) -> (entries, denied)``.
+    """
+    if backend not in LISTING_BACKENDS:
+        raise ValueError(f"Unknown listing backend '{backend}'. Expected one of: {', '.join(LISTING_BACKENDS)}.")
+    if backend == "statx":
+        _load_statx()
+        return list_directory_statx
+    return list_directory
+
+
+# --- per-directory timeouts --------------------------------------------
+
+class _Listing:
+    """One listing handed to a _DaemonPool thread; ``done`` is released when ``result`` is set."""
+
+    __slots__ = ("lister", "path", "done", "result", "abandoned")
+
+    def __init__(self, lister, path):
+        self.lister = lister
+        self.path = path
+        self.done = threading.Lock()
+        self.done.acquire()
+        self.result = None
+        self.abandoned = False
+
+
+class _DaemonPool:
+    """
+    Runs listings on daemon threads, adding a thread whenever none is idle.
+
+    A listing stuck in the kernel (a dead NFS server, a hung FUSE daemon)
+    cannot be interrupted; its thread is simply left behind and a new one
+    takes over. Daemon threads never keep the interpreter from exiting.
+    A bare lock per call instead of a Future keeps the hand-off cheap.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = queue.SimpleQueue()
+        self._idle = 0
+
+    def submit(self, listing):
+        with self._lock:
+            # Every queued listing has a thread of its own waiting for it.
+            if self._idle:
+                self._idle -= 1
+            else:
+                threading.Thread(target=self._work, daemon=True, name="listing").start()
+        self._requests.put(listing)
+
+    def _work(self):
+        while True:
+            listing = self._requests.get()
+            if not listing.abandoned:
+                try:
+                    listing.result = listing.lister(listing.path)
+                except BaseException as e:
+                    listing.result = e
+                listing.done.release()
+            with self._lock:
+                self._idle += 1
+
+
+_TIMEOUT_POOL = _DaemonPool()
+
+
+def _wait(listing, timeout, cancel):
+    """Waits for a submitted listing; False when it timed out or ``cancel`` fired first."""
+    if cancel is None:
+        return listing.done.acquire(timeout=timeout)
+    give_up = time.monotonic() + timeout
+    while not cancel.cancelled:
+        left = give_up - time.monotonic()
+        if left <= 0:
+            return False
+        if listing.done.acquire(timeout=min(left, _CANCEL_POLL_SECONDS)):
+            return True
+    return False
+
+
+def with_timeout(lister, timeout, cancel=None):
+    """
+    Wraps a lister so that one hung directory cannot stall a whole scan.
+
+    Each listing runs on a daemon thread; when it takes longer than
+    ``timeout`` seconds the directory is reported as (``[]``,
+    LISTING_TIMED_OUT) and the scan moves on. The stuck call keeps its
+    thread until the kernel returns, and its late result is dropped.
+
+    Args:
+        lister (callable): ``lister(path) -> (entries, denied)``.
+        timeout (float): Seconds to wait for one directory.
+        cancel (CancelToken or None): When it is cancelled, the listing
+            being waited for is abandoned at once and reported as
+            (``[]``, LISTING_CANCELLED).
+
+    Returns:
+        callable: A lister with the same signature.
+    """
+    def list_directory(path):
+        listing = _Listing(lister, path)
+        _TIMEOUT_POOL.submit(listing)
+        if not _wait(listing, timeout, cancel):
+            listing.abandoned = True
+            if cancel is not None and cancel.cancelled:
+                return [], LISTING_CANCELLED
+            LISTING_ERRORS.add("timed out", path, f"Listing {path} took longer than {timeout}s; skipping it")
+            return [], LISTING_TIMED_OUT
+        if isinstance(listing.result, BaseException):
+            raise listing.result
+        return listing.result
+
+    return list_directory
@@ -0,0 +1,87 @@
+from array import array
+
+_EMPTY = 0
+_MIX = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+_INITIAL_BITS = 10
+
+
+class _InodeTable:
+    """Open-addressing hash set of the inode numbers of one device, kept in one array of 64-bit slots."""
+
+    __slots__ = ("slots", "bits", "count", "has_zero")
+
+    def __init__(self, bits=_INITIAL_BITS):
+        self.slots = array("Q", bytes(8 << bits))
+        self.bits = bits
+        self.count = 0
+        # Slot value 0 marks an empty slot, so inode 0 is tracked on the side.
+        self.has_zero = False
+
+    def _find(self, inode):
+        """Returns the slot holding ``inode`` or the empty slot where it belongs."""
+        slots, mask = self.slots, (1 << self.bits) - 1
+        index = ((inode * _MIX) & _MASK64) >> (64 - self.bits)
+        while True:
+            value = slots[index]
+            if value == inode or value == _EMPTY:
+                return index
+            index = (index + 1) & mask
+
+    def add(self, inode):
+        if inode == 0:
+            added, self.has_zero = not self.has_zero, True
+            return added
+        index = self._find(inode)
+        if self.slots[index] == inode:
+            return False
+        self.slots[index] = inode
+        self.count += 1
+        if self.count * 2 > len(self.slots):
+            self._grow()
+        return True
+
+    def __contains__(self, inode):
+        if inode == 0:
+            return self.has_zero
+        return self.slots[self._find(inode)] == inode
+
+    def _grow(self):
+        old = self.slots
+        self.bits += 1
+        self.slots = array("Q", bytes(8 << self.bits))
+        for inode in old:
+            if inode != _EMPTY:
+                self.slots[self._find(inode)] = inode
+
+
+class InodeSet:
+    """
+    Set of (device, inode) pairs for hardlink de-duplication.
+
+    Every device gets an open-addressing table of raw 64-bit inode numbers,
+    kept at most half full. That is 16-32 bytes per inode, against roughly
+    100 for a Python set of (dev, ino) tuples, so tens of millions of
+    hardlinked files fit in memory.
+    """
+
+    def __init__(self):
+        self._tables = {}
+
+    def add(self, device, inode):
+        """Adds a pair; returns True if it was not in the set yet."""
+        table = self._tables.get(device)
+        if table is None:
+            table = self._tables[device] = _InodeTable()
+        return table.add(inode)
+
+    def __contains__(self, key):
+        device, inode = key
+        table = self._tables.get(device)
+        return table is not None and inode in table
+
+    def __len__(self):
+        return sum(table.count + table.has_zero for table in self._tables.values())
+
+    def nbytes(self):
+        return sum(table.slots.itemsize * len(table.slots) for table in self._tables.values())
@@ -1,55 +1,118 @@
-from disk_scanner import scan_directory, get_top_5_heavy_items
+import os
+import sys
+import logging
+import argparse
+from disk_scanner import (iter_scan_lines, get_top_5_heavy_items, get_top_heavy_items,
+                          format_item_sizes, TOP_ITEM_KINDS, RECORD_FORMATS)
 from visualizer import visualize_disk_usage, plot_disk_usage
 from file_size import format_file_size
+from size_tree import SCAN_MODES, SIZE_MODES, build_size_tree
+from scan_filters import compile_filter, pruner
+from fs_listing import LISTING_BACKENDS
+from scan_cache import ScanCache
+from mounts import MountPolicy, mounts_under, is_remote
+from snapshots import save_snapshot, diff_snapshots, format_diff
+from duplicates import find_duplicates, format_duplicates
+from breakdowns import breakdown, format_breakdowns
+from scan_metrics import ScanMetrics, METRICS_FORMATS
+from cancellation import CancelToken
 
 
-def print_tree(path, filters=None):
+def _start_scan(scan_options):
     """
-    Prints the directory tree in a human-readable format using scan_directory.
+    Returns the options for one scan, with a ``deadline`` in seconds turned
+    into a CancelToken that starts counting now.
+    """
+    scan_options = dict(scan_options)
+    deadline = scan_options.pop("deadline", None)
+    if deadline is not None:
+        scan_options["cancel"] = CancelToken(deadline)
+    return scan_options
+
+
+def print_tree(path, filters=None, record_format="text", **scan_options):
+    """
+    Prints the directory tree as it is scanned, using iter_scan_lines.
 
     Args:
         path (str): The root directory path.
         filters (list): Optional list of filters to apply to the files.
+        record_format (str): "text" or "ndjson".
+        **scan_options: Scan engine options such as ``mode`` and ``workers``.
     """
+    scan_options = _start_scan(scan_options)
+    mode = scan_options.pop("mode", "threads")
     try:
-        tree_structure = scan_directory(path, filters=filters)
-        print(tree_structure)
+        if mode == "processes":
+            # The worker processes build the whole tree first; both formats are then rendered from it.
+            tree = build_size_tree(path, follow_symlinks=True, mode=mode, prune=pruner(compile_filter(filters)),
+                                   **scan_options)
+            lines = iter_scan_lines(path, filters=filters, record_format=record_format, tree=tree,
+                                    cancel=scan_options.get("cancel"))
+        else:
+            lines = iter_scan_lines(path, filters=filters, record_format=record_format, **scan_options)
+        for line in lines:
+            sys.stdout.write(line)
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # The reader went away (e.g. "| head"); stop quietly like other CLI tools.
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+    except KeyboardInterrupt:
+        # Closing the generator stops the scan; its worker threads finish their current directory only.
+        print("\nScan interrupted.", file=sys.stderr)
     except FileNotFoundError as e:
         print(f"Error: {str(e)}")
     except Exception as e:
         print(f"An unexpected error occurred: {str(e)}")
 
 
-def show_top_5_heavy_items(path, filters=None):
+def show_top_5_heavy_items(path, filters=None, **scan_options):
     """
     Show the top 5 largest files and directories in the given path.
 
     Args:
         path (str): The root directory path.
         filters (list): Optional list of filters to apply to the files.
+        **scan_options: Scan engine options such as ``mode`` and ``workers``.
+    """
+    show_top_heavy_items(path, filters, **scan_options)
+
+
+def show_top_heavy_items(path, filters=None, n=5, kind="both", **scan_options):
+    """
+    Show the top N largest files and/or directories in the given path.
+
+    Args:
+        path (str): The root directory path.
+        filters (list): Optional list of filters to apply to the files.
+        n (int): How many items to show.
+        kind (str): "files", "dirs" or "both".
+        **scan_options: Scan engine options such as ``mode`` and ``workers``.
     """
     try:
-        top_items = get_top_5_heavy_items(path, filters)
+        top_items = get_top_heavy_items(path, n, kind, filters, **_start_scan(scan_options))
         if top_items:
-            print("\nTop 5 Largest Items:")
+            print(f"\nTop {n} Largest Items:")
             for idx, item in enumerate(top_items, 1):
-                print(f"{idx}. {item['name']} - {item['size']}")
+                print(f"{idx}. {item['name']} - {format_item_sizes(item)}")
         else:
             print("No items found.")
     except Exception as e:
         print(f"Error: {str(e)}")
 
 
-def visualize_disk_usage_console(path, filters=None):
+def visualize_disk_usage_console(path, filters=None, **scan_options):
     """
     Simulate disk usage visualization in the console by summarizing directory sizes.
 
     Args:
         path (str): The root directory path.
         filters (list): Optional list of filters to apply to the files.
+        **scan_options: Scan engine options such as ``mode`` and ``workers``.
     """
     try:
-        labels, sizes, formatted_sizes = visualize_disk_usage(path, filters)
+        labels, sizes, formatted_sizes = visualize_disk_usage(path, filters, **_start_scan(scan_options))
         print("\nDisk Usage Summary:")
         for label, size, formatted_size in zip(labels, sizes, formatted_sizes):
             print(f"{label}: {formatted_size}")
@@ -57,28 +120,151 @@ def visualize_disk_usage_console(path, filters=None):
         print(f"Error: {str(e)}")
 
 
-def main_menu():
+def print_mounts(path):
+    """
+    Prints the mount points below ``path``, so the ones a one-filesystem scan
+    skips can be scanned separately.
+    """
+    mounts = mounts_under(path)
+    if not mounts:
+        print(f"No mount points below {path}.")
+    for mount in mounts:
+        kind = " (remote)" if is_remote(mount) else ""
+        print(f"{mount.mount_point}\t{mount.fstype}{kind}\t{mount.source}")
+
+
+def save_tree_snapshot(path, file_path, **scan_options):
+    """
+    Scans ``path`` and saves the tree as a snapshot for diff_snapshots.
+
+    Args:
+        path (str): The root directory path.
+        file_path (str): Where to write the snapshot.
+        **scan_options: Scan engine options such as ``mode`` and ``workers``;
+            the cache is not used, since files grown in place keep their
+            cached size there.
+    """
+    scan_options = _start_scan(scan_options)
+    scan_options.pop("cache", None)
+    try:
+        root = build_size_tree(path, **scan_options)
+        if root.incomplete:
+            print("Warning: the scan was stopped early; the snapshot is incomplete.")
+        save_snapshot(root, file_path)
+        print(f"Snapshot of {path} saved to {file_path}")
+    except Exception as e:
+        print(f"Error: {str(e)}")
+
+
+def show_snapshot_diff(old_path, new_path, n=5, kind="both", size_mode="apparent"):
+    """
+    Prints what grew between two saved snapshots.
+
+    Args:
+        old_path (str): The earlier snapshot.
+        new_path (str): The later snapshot.
+        n (int): How many items each ranking shows.
+        kind (str): "files", "dirs" or "both".
+        size_mode (str): Compare "apparent" or "allocated" sizes.
+    """
+    try:
+        print(format_diff(diff_snapshots(old_path, new_path, n, kind, size_mode)))
+    except Exception as e:
+        print(f"Error: {str(e)}")
+
+
+def show_duplicates(path, filters=None, n=20, size_mode="apparent", **scan_options):
+    """
+    Prints the groups of identical files under ``path``, largest reclaimable space first.
+
+    Args:
+        path (str): The root directory path.
+        filters (list): Optional filters; only matching files are compared.
+        n (int): How many groups to print.
+        size_mode (str): Count reclaimable "apparent" or "allocated" bytes.
+        **scan_options: Scan engine options such as ``mode`` and ``workers``.
+    """
+    try:
+        report = find_duplicates(path, filters=filters, size_mode=size_mode, **_start_scan(scan_options))
+        print(format_duplicates(report, n))
+    except KeyboardInterrupt:
+        print("\nSearch interrupted.", file=sys.stderr)
+    except Exception as e:
+        print(f"Error: {str(e)}")
+
+
+def show_breakdowns(path, filters=None, size_mode="apparent", n=10, **scan_options):
+    """
+    Prints bytes by file type, by owner and by age under ``path``.
+
+    Args:
+        path (str): The root directory path.
+        filters (list): Optional filters; only matching files are counted.
+        size_mode (str): Sum "apparent" or "allocated" sizes.
+        n (int): How many file types and owners to show.
+        **scan_options: Scan engine options such as ``workers``; the cache,
+            the listing backend and the scan mode are not used.
+    """
+    scan_options = _start_scan(scan_options)
+    for unused in ("mode", "cache", "backend"):
+        scan_options.pop(unused, None)
+    try:
+        print(format_breakdowns(breakdown(path, filters, size_mode, n, **scan_options)))
+    except KeyboardInterrupt:
+        print("\nScan interrupted.", file=sys.stderr)
+    except Exception as e:
+        print(f"Error: {str(e)}")
+
+
+def write_metrics(metrics, metrics_format="prometheus", file_path=None):
+    """
+    Writes the scan metrics of a CLI run to ``file_path``, or to stderr so they do not mix with the output.
+
+    Args:
+        metrics (ScanMetrics): The metrics passed to the scans.
+        metrics_format (str): "json" or "prometheus" (text exposition format).
+        file_path (str or None): Where to write them.
+    """
+    text = metrics.dump(metrics_format)
+    if file_path is None:
+        sys.stderr.write(text)
+        return
+    with open(file_path, "w") as f:
+        f.write(text)
+
+
+def main_menu(scan_options=None, top_n=5, top_kind="both", size_mode="apparent", sample_budget=None):
     """
     Display the main menu and handle user input for the console interface.
+
+    Args:
+        scan_options (dict or None): Scan engine options passed to every scan.
+        top_n (int): How many items the "largest items" option shows.
+        top_kind (str): "files", "dirs" or "both" for the "largest items" option.
+        size_mode (str): Rank the largest items by "apparent" or "allocated" size.
+        sample_budget (float or None): Estimate the largest items by sampling
+            for this many seconds instead of scanning everything.
     """
+    scan_options = scan_options or {}
     while True:
         print("\n=== Disk Scanner ===")
         print("1. Scan directory and print tree")
-        print("2. Show top 5 largest items")
+        print(f"2. Show top {top_n} largest items")
         print("3. Exit")
 
         choice = input("Enter your choice: ").strip()
         if choice == "1":
             path = input("Enter directory path to scan: ").strip()
-            filters_input = input("Enter file type filters (comma-separated, e.g., .txt,.py): ").strip()
+            filters_input = input("Enter filters (comma-separated, e.g., .txt,.py,size>1M,!node_modules): ").strip()
             filters = [f.strip() for f in filters_input.split(",")] if filters_input else None
             print("\nDirectory tree structure:")
-            print_tree(path, filters)
+            print_tree(path, filters, **scan_options)
         elif choice == "2":
-            path = input("Enter directory path to show top 5 largest items: ").strip()
-            filters_input = input("Enter file type filters (comma-separated, e.g., .txt,.py): ").strip()
+            path = input(f"Enter directory path to show top {top_n} largest items: ").strip()
+            filters_input = input("Enter filters (comma-separated, e.g., .txt,.py,size>1M,!node_modules): ").strip()
             filters = [f.strip() for f in filters_input.split(",")] if filters_input else None
-            show_top_5_heavy_items(path, filters)
+            show_top_heavy_items(path, filters, top_n, top_kind, size_mode=size_mode, sample_budget=sample_budget,
+                                 **scan_options)
         elif choice == "3":
             print("Exiting program.")
             break
@@ -86,5 +272,98 @@ def main_menu():
             print("Invalid choice, please try again.")
 
 
+def _positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"expected a whole number of at least 1, got {value}")
+    return number
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Disk Scanner")
+    parser.add_argument("--mode", choices=SCAN_MODES, default="threads",
+                        help="scan with a shared thread pool or with sharded worker processes")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of scan threads (or processes in processes mode)")
+    parser.add_argument("--top", type=_positive_int, default=5, help="how many items the largest-items option shows")
+    parser.add_argument("--top-kind", choices=TOP_ITEM_KINDS, default="both",
+                        help="rank files, directories (by recursive size) or both")
+    parser.add_argument("--size-mode", choices=SIZE_MODES, default="apparent",
+                        help="rank the largest items by apparent size or by space allocated on disk")
+    parser.add_argument("--backend", choices=LISTING_BACKENDS, default=None,
+                        help="directory listing backend: portable scandir (default) or raw getdents64/statx on Linux")
+    parser.add_argument("--cache", action="store_true",
+                        help="reuse directory listings from the persistent scan cache; files grown or rewritten "
+                             "in place keep their cached size until their directory changes")
+    parser.add_argument("--cache-path", default=None, help="location of the scan cache database")
+    parser.add_argument("-x", "--one-file-system", dest="one_filesystem", action="store_true",
+                        help="do not cross into mount points of other devices than the scanned directory's")
+    parser.add_argument("--skip-mount", dest="skip_mounts", metavar="PATH", action="append", default=[],
+                        help="leave out this mount point (repeatable)")
+    parser.add_argument("--skip-remote", action="store_true",
+                        help="leave out NFS, SMB, sshfs and other network or FUSE mounts")
+    parser.add_argument("--dir-timeout", type=float, default=None, metavar="SECONDS",
+                        help="give up on a directory whose listing takes longer, e.g. on a hung network mount")
+    parser.add_argument("--deadline", type=float, default=None, metavar="SECONDS",
+                        help="stop every scan after this long and show what it found so far, marked incomplete")
+    parser.add_argument("--sample", dest="sample_budget", type=float, default=None, metavar="SECONDS",
+                        help="estimate the largest items by sampling for SECONDS instead of a full scan "
+                             "(top-level entries only, with 95%% intervals)")
+    parser.add_argument("--list-mounts", metavar="PATH", default=None,
+                        help="list the mount points below PATH and exit")
+    parser.add_argument("--save-snapshot", nargs=2, metavar=("PATH", "FILE"), default=None,
+                        help="scan PATH, save the tree to FILE for --diff and exit")
+    parser.add_argument("--diff", nargs=2, metavar=("OLD", "NEW"), default=None,
+                        help="show what grew between two snapshots saved with --save-snapshot and exit")
+    parser.add_argument("--duplicates", metavar="PATH", default=None,
+                        help="list groups of identical files under PATH with the space they waste and exit")
+    parser.add_argument("--breakdown", metavar="PATH", default=None,
+                        help="show bytes by file type, owner and age (last access and modification) under PATH and exit")
+    parser.add_argument("--scan", metavar="PATH", default=None,
+                        help="print the tree of PATH as it is scanned and exit instead of showing the menu")
+    parser.add_argument("--format", dest="record_format", choices=RECORD_FORMATS, default="text",
+                        help="output format for --scan")
+    parser.add_argument("--filter", dest="filters", action="append", default=None,
+                        help="filter rule for --scan, --duplicates and --breakdown, e.g. .py, size>1M or !node_modules (repeatable)")
+    parser.add_argument("--log-level", choices=("DEBUG", "INFO", "WARNING", "ERROR"), default="WARNING",
+                        help="messages to log to stderr; DEBUG adds per-file messages and slows large scans down")
+    parser.add_argument("--metrics", dest="metrics_format", choices=METRICS_FORMATS, default=None,
+                        help="print scan counters and per-phase timings to stderr at the end of the run")
+    parser.add_argument("--metrics-file", default=None, metavar="FILE",
+                        help="write the --metrics output to FILE instead of stderr")
+    return parser.parse_args(argv)
+
+
+def scan_options_from_args(args):
+    options = {"mode": args.mode, "workers": args.workers, "backend": args.backend, "dir_timeout": args.dir_timeout,
+               "deadline": args.deadline}
+    if args.one_filesystem or args.skip_mounts or args.skip_remote:
+        options["mounts"] = MountPolicy(args.one_filesystem, args.skip_mounts, args.skip_remote)
+    if args.cache:
+        options["cache"] = ScanCache(args.cache_path)
+    if args.metrics_format:
+        options["metrics"] = ScanMetrics()
+    return options
+
+
 if __name__ == "__main__":
-    main_menu()
+    args = parse_args()
+    logging.basicConfig(level=args.log_level, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.list_mounts:
+        print_mounts(args.list_mounts)
+    elif args.diff:
+        show_snapshot_diff(*args.diff, args.top, args.top_kind, args.size_mode)
+    else:
+        options = scan_options_from_args(args)
+        if args.save_snapshot:
+            save_tree_snapshot(*args.save_snapshot, **options)
+        elif args.breakdown:
+            show_breakdowns(args.breakdown, args.filters, args.size_mode, args.top, **options)
+        elif args.duplicates:
+            show_duplicates(args.duplicates, args.filters, size_mode=args.size_mode, **options)
+        elif args.scan:
+            print_tree(args.scan, args.filters, args.record_format, **options)
+        else:
+            main_menu(options, args.top, args.top_kind, args.size_mode, args.sample_budget)
+        if "metrics" in options:
+            write_metrics(options["metrics"], args.metrics_format, args.metrics_file)
@@ -0,0 +1,167 @@
+import os
+import re
+import logging
+from collections import namedtuple
+
+MOUNTINFO_PATH = "/proc/self/mountinfo"
+
+# Filesystems whose directories may live on another machine, where a single listing can hang for minutes.
+REMOTE_FSTYPES = frozenset({
+    "nfs", "nfs4", "cifs", "smb3", "smbfs", "9p", "afs", "ceph", "glusterfs", "lustre", "gpfs", "beegfs",
+    "davfs", "ncpfs", "sshfs",
+})
+
+Mount = namedtuple("Mount", ["mount_id", "device", "root", "mount_point", "fstype", "source"])
+
+_ESCAPE = re.compile(r"\\([0-7]{3})")
+
+
+def _unescape(field):
+    # mountinfo writes space, tab, newline and backslash as octal escapes such as "\040".
+    return _ESCAPE.sub(lambda match: chr(int(match.group(1), 8)), field)
+
+
+def is_remote(mount):
+    """True for network filesystems and FUSE mounts (sshfs, rclone, s3fs, ...)."""
+    return mount.fstype in REMOTE_FSTYPES or mount.fstype.startswith("fuse.")
+
+
+def read_mounts(mountinfo=MOUNTINFO_PATH):
+    """
+    Reads the mount table of this process from /proc/self/mountinfo.
+
+    Reading the table touches no mounted filesystem, so it is safe even when
+    one of them hangs.
+
+    Args:
+        mountinfo (str): Path of the mountinfo file.
+
+    Returns:
+        list: Mount records in mount order, or an empty list where there is
+        no mountinfo (other systems than Linux).
+    """
+    try:
+        with open(mountinfo, encoding="utf-8", errors="surrogateescape") as f:
+            lines = f.read().splitlines()
+    except OSError as e:
+        logging.debug(f"Cannot read the mount table from {mountinfo}: {e}")
+        return []
+    mounts = []
+    for line in lines:
+        # "36 35 98:0 /mnt1 /mnt/parent rw,noatime master:1 - ext3 /dev/root rw,errors=continue"
+        fields = line.split()
+        try:
+            separator = fields.index("-", 6)
+            major, minor = fields[2].split(":")
+            mounts.append(Mount(int(fields[0]), os.makedev(int(major), int(minor)), _unescape(fields[3]),
+                                _unescape(fields[4]), fields[separator + 1], _unescape(fields[separator + 2])))
+        except (ValueError, IndexError):
+            logging.debug(f"Skipping malformed mountinfo line: {line!r}")
+    return mounts
+
+
+def mounts_under(path, mounts=None):
+    """
+    Returns the mount points strictly below ``path``, in path order.
+
+    Useful to list what a one-filesystem scan skipped, so those mounts can
+    be scanned separately.
+    """
+    mounts = read_mounts() if mounts is None else mounts
+    root = os.path.realpath(path)
+    prefix = root.rstrip(os.sep) + os.sep
+    # A later mount at the same path hides the earlier one.
+    visible = {mount.mount_point: mount for mount in mounts}
+    return [visible[point] for point in sorted(visible) if point.startswith(prefix) and point != root]
+
+
+class MountPolicy:
+    """
+    Decides at which mount points a scan stops.
+
+    A directory is not entered when it is a mount point listed in ``skip``,
+    a remote mount with ``skip_remote``, or (with ``one_filesystem``, like
+    ``du -x``) a mount of another device than the scan's root. The same rules
+    apply to the targets of followed directory symlinks.
+
+    Mount points are looked up by path in the mount table, so the check costs
+    one set lookup per directory; only a directory whose name is the name of
+    some mount point has its path resolved. Where there is no mount table,
+    ``one_filesystem`` falls back to one stat per directory to compare
+    st_dev.
+    """
+
+    def __init__(self, one_filesystem=False, skip=(), skip_remote=False, mounts=None):
+        self.one_filesystem = one_filesystem
+        self.skip_remote = skip_remote
+        self.skip = frozenset(os.path.realpath(p) for p in skip)
+        mounts = read_mounts() if mounts is None else mounts
+        # A later mount at the same path hides the earlier one.
+        self._by_point = {mount.mount_point: mount for mount in mounts}
+        self._names = frozenset(os.path.basename(p) for p in self._by_point.keys() | self.skip)
+
+    def mount_of(self, path):
+        """Returns the Mount holding a resolved ``path``, or None without a mount table."""
+        if not self._by_point:
+            return None
+        while True:
+            mount = self._by_point.get(path)
+            if mount is not None:
+                return mount
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
+
+    def device_of(self, path):
+        """Returns the device of the filesystem holding ``path``, as the scan compares it."""
+        mount = self.mount_of(os.path.realpath(path))
+        return mount.device if mount is not None else os.stat(path).st_dev
+
+    def _stops(self, mount_point, mount, device, root_device):
+        if mount_point in self.skip:
+            return True
+        if self.skip_remote and mount is not None and is_remote(mount):
+            return True
+        return self.one_filesystem and device != root_device
+
+    def stops_at(self, name, path, root_device):
+        """
+        Checks a directory (not a symlink) found by the scan.
+
+        Args:
+            name (str): The directory's name.
+            path (str): Its path.
+            root_device (int): device_of() the scan's root.
+
+        Returns:
+            bool: True when the directory is a mount point the scan must not enter.
+        """
+        if self._by_point:
+            if name not in self._names:
+                return False
+            real = os.path.realpath(path)
+            mount = self._by_point.get(real)
+            if mount is None:
+                return real in self.skip
+            return self._stops(real, mount, mount.device, root_device)
+        if not self.one_filesystem:
+            return name in self._names and os.path.realpath(path) in self.skip
+        try:
+            device = os.stat(path).st_dev
+        except OSError:
+            return False
+        return self._stops(os.path.realpath(path), None, device, root_device)
+
+    def leaves(self, resolved, root_device):
+        """True when a resolved symlink target lies on a mount the scan must not enter."""
+        mount = self.mount_of(resolved)
+        if mount is not None:
+            return self._stops(mount.mount_point, mount, mount.device, root_device)
+        if not self.one_filesystem:
+            return resolved in self.skip
+        try:
+            device = os.stat(resolved).st_dev
+        except OSError:
+            return False
+        return self._stops(resolved, None, device, root_device)
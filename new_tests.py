@@ -1,9 +1,11 @@
 import pytest
 import os
+import sys
 from unittest.mock import patch
 from disk_scanner import scan_directory, get_top_5_heavy_items
 from file_size import format_file_size, calculate_size
 from visualizer import visualize_disk_usage
+from size_tree import build_size_tree, SizeTree, FLAG_DIR
 import time
 from unittest.mock import MagicMock
 
@@ -66,3 +68,769 @@ def test_scan_directory_with_symlink_filter(test_directory_with_symlink):
     # Cleanup
     scan_directory.__globals__["ThreadPoolExecutor"] = original_executor
 
+
+
+@pytest.fixture
+def temp_dir_with_files(tmp_path):
+    (tmp_path / "file1.txt").write_text("12345")  # 5 bytes
+    (tmp_path / "file2.txt").write_text("1234567890")  # 10 bytes
+    subdir = tmp_path / "subdir"
+    subdir.mkdir()
+    (subdir / "file3.txt").write_text("123456")  # 6 bytes
+    return tmp_path
+
+
+def test_build_size_tree_rolls_up_sizes(temp_dir_with_files):
+    tree = build_size_tree(str(temp_dir_with_files))
+    assert tree.size == 21
+    subdir = next(node for node in tree.children if node.name == "subdir")
+    assert subdir.is_dir and subdir.size == 6
+
+
+def test_renderers_reuse_prebuilt_tree(temp_dir_with_files):
+    path = str(temp_dir_with_files)
+    tree = build_size_tree(path)
+    with patch("os.scandir", side_effect=AssertionError("filesystem touched")):
+        text = scan_directory(path, tree=tree)
+        top_items = get_top_5_heavy_items(path, tree=tree)
+        labels, sizes, _ = visualize_disk_usage(path, tree=tree)
+    assert "file3.txt - 6 bytes" in text
+    assert top_items[0]["name"] == os.path.join(path, "file2.txt")
+    assert dict(zip(labels, sizes))["subdir"] == 6
+
+
+def test_size_tree_interns_names_and_stays_compact():
+    tree = SizeTree("/root")
+    tree.add(-1, "", flags=FLAG_DIR)
+    for i in range(1000):
+        directory = tree.add(0, f"dir{i}", flags=FLAG_DIR)
+        tree.add(directory, "index.js", size=10)
+    tree.roll_up()
+    tree.compact()
+    root = tree.node(0)
+    assert root.size == 10000
+    assert tree.name(2) == "index.js" and tree.name_id[2] == tree.name_id[4]
+    assert tree.path(2) == os.path.join("/root", "dir0", "index.js")
+    assert tree.nbytes() / len(tree) < 64
+
+
+def test_work_stealing_scheduler_runs_spawned_tasks():
+    from scan_scheduler import WorkStealingScheduler
+
+    done = []
+
+    def spawn(depth):
+        def task(scheduler):
+            done.append(depth)
+            if depth < 6:
+                scheduler.submit(spawn(depth + 1))
+                scheduler.submit(spawn(depth + 1))
+        return task
+
+    scheduler = WorkStealingScheduler(workers=4)
+    scheduler.submit(spawn(0))
+    scheduler.run()
+    assert len(done) == 2 ** 7 - 1
+
+
+def test_build_size_tree_is_independent_of_worker_count(tmp_path):
+    for i in range(30):
+        subdir = tmp_path / f"d{i}" / "nested"
+        subdir.mkdir(parents=True)
+        (subdir / "f.bin").write_bytes(b"x" * i)
+    single = build_size_tree(str(tmp_path), workers=1)
+    many = build_size_tree(str(tmp_path), workers=8)
+    assert single.size == many.size == sum(range(30))
+    assert scan_directory(str(tmp_path), workers=1) == scan_directory(str(tmp_path), workers=8)
+
+
+def test_size_tree_round_trips_through_bytes(temp_dir_with_files):
+    tree = build_size_tree(str(temp_dir_with_files)).tree
+    restored = SizeTree.from_bytes(tree.to_bytes())
+    assert restored.root_path == tree.root_path
+    assert list(restored.size) == list(tree.size)
+    assert [restored.path(i) for i in range(len(restored))] == [tree.path(i) for i in range(len(tree))]
+
+
+@pytest.mark.parametrize("sharding", ["balanced", "top-level"])
+def test_sharded_scan_matches_threaded_scan(test_directory_with_symlink, sharding):
+    from sharded_scan import build_sharded_size_tree
+
+    path = str(test_directory_with_symlink)
+    sharded = build_sharded_size_tree(path, follow_symlinks=True, processes=2, sharding=sharding)
+    threaded = build_size_tree(path, follow_symlinks=True)
+    assert sharded.size == threaded.size
+    assert scan_directory(path, tree=sharded) == scan_directory(path, tree=threaded)
+
+
+def test_async_scanner_yields_entries_and_matches_sync_api(temp_dir_with_files):
+    import asyncio
+    from async_scanner import iter_entries_async, get_top_5_heavy_items_async, scan_directory_async
+
+    path = str(temp_dir_with_files)
+
+    async def collect():
+        return [entry async for entry in iter_entries_async(path, max_concurrency=2, queue_size=1)]
+
+    entries = asyncio.run(collect())
+    assert entries[-1].path == path and entries[-1].size == 21
+    assert {entry.name: entry.size for entry in entries}["subdir"] == 6
+    assert asyncio.run(get_top_5_heavy_items_async(path)) == get_top_5_heavy_items(path)
+    assert asyncio.run(scan_directory_async(path)) == scan_directory(path)
+
+
+def test_async_scanner_stops_when_consumer_stops(tmp_path):
+    import asyncio
+    from async_scanner import iter_entries_async
+
+    for i in range(50):
+        (tmp_path / f"d{i}").mkdir()
+        (tmp_path / f"d{i}" / "f.txt").write_text("x")
+
+    async def first_entry():
+        async for entry in iter_entries_async(str(tmp_path), queue_size=1):
+            return entry
+
+    assert asyncio.run(first_entry()) is not None
+
+
+def test_scan_cache_reuses_unchanged_directories(temp_dir_with_files, tmp_path_factory):
+    from scan_cache import ScanCache
+
+    path = str(temp_dir_with_files)
+    for directory in (path, os.path.join(path, "subdir")):
+        os.utime(directory, (time.time() - 60, time.time() - 60))
+    cache = ScanCache(str(tmp_path_factory.mktemp("cache") / "cache.sqlite"))
+    assert build_size_tree(path, cache=cache).size == 21
+
+    with patch("os.scandir", side_effect=AssertionError("directory listed again")):
+        assert build_size_tree(path, cache=cache).size == 21
+    assert cache.hits == 2
+    assert cache.cached_totals(path) == (21, 4)
+
+    (temp_dir_with_files / "subdir" / "new.txt").write_text("1234")
+    tree = build_size_tree(path, cache=cache)
+    assert tree.size == 25
+    cache.close()
+
+
+def test_scan_cache_keeps_rows_of_directories_not_listed(tmp_path):
+    from scan_cache import ScanCache
+
+    for name in ("keep/inner", "gone/inner"):
+        (tmp_path / name).mkdir(parents=True)
+        (tmp_path / name / "file.txt").write_text("12345")
+    for directory in (tmp_path, tmp_path / "keep", tmp_path / "keep" / "inner", tmp_path / "gone",
+                      tmp_path / "gone" / "inner"):
+        os.utime(directory, (time.time() - 60, time.time() - 60))
+    cache = ScanCache(":memory:")
+    build_size_tree(str(tmp_path), cache=cache)
+    keep = str(tmp_path / "keep" / "inner")
+    assert cache.cached_totals(keep) is not None
+
+    # A pruned scan does not list "keep", so its rows stay.
+    build_size_tree(str(tmp_path), cache=cache, prune=lambda name, path: name == "keep")
+    assert cache.cached_totals(keep) is not None
+
+    # A directory missing from its parent's listing is dropped with everything below it.
+    (tmp_path / "gone" / "inner" / "file.txt").unlink()
+    (tmp_path / "gone" / "inner").rmdir()
+    (tmp_path / "gone").rmdir()
+    build_size_tree(str(tmp_path), cache=cache)
+    assert cache.cached_totals(str(tmp_path / "gone" / "inner")) is None
+    assert cache.cached_totals(keep) is not None
+    cache.close()
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux-only")
+def test_watcher_keeps_pruned_directories_out(tmp_path):
+    from watcher import SizeTreeWatcher
+    from scan_filters import compile_filter, pruner
+
+    (tmp_path / "node_modules").mkdir()
+    (tmp_path / "node_modules" / "big.js").write_bytes(b"x" * 50_000)
+    (tmp_path / "a.txt").write_bytes(b"12")
+    prune = pruner(compile_filter(["!node_modules"]))
+    root = build_size_tree(str(tmp_path), prune=prune)
+    watcher = SizeTreeWatcher(root, coalesce_delay=0.05, prune=prune)
+    try:
+        os.utime(tmp_path / "node_modules")
+        (tmp_path / "pkg" / "node_modules").mkdir(parents=True)
+        (tmp_path / "pkg" / "node_modules" / "dep.js").write_bytes(b"x" * 1000)
+        (tmp_path / "pkg" / "index.js").write_bytes(b"123")
+        for _ in range(20):
+            watcher.process_events(timeout=0.2)
+            if root.size == 5:
+                break
+        assert root.size == 2 + 3
+        with watcher.lock:
+            assert not watcher._resync_directory(0)
+        assert sorted(child.name for child in root.children) == ["a.txt", "pkg"]
+    finally:
+        watcher.stop()
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux-only")
+def test_watcher_propagates_deltas_to_ancestors(temp_dir_with_files):
+    from watcher import SizeTreeWatcher
+
+    root = build_size_tree(str(temp_dir_with_files))
+    watcher = SizeTreeWatcher(root, coalesce_delay=0.05)
+    try:
+        with open(temp_dir_with_files / "subdir" / "file3.txt", "a") as f:
+            f.write("7890")  # 6 -> 10 bytes
+        (temp_dir_with_files / "new_dir" / "deep").mkdir(parents=True)
+        (temp_dir_with_files / "new_dir" / "deep" / "x.bin").write_bytes(b"x" * 100)
+        os.remove(temp_dir_with_files / "file1.txt")
+        for _ in range(20):
+            watcher.process_events(timeout=0.2)
+            if root.size == 120:
+                break
+        assert root.size == 10 + 10 + 100  # file2, grown file3, new x.bin
+        assert sorted(child.name for child in root.children) == ["file2.txt", "new_dir", "subdir"]
+    finally:
+        watcher.stop()
+
+
+def test_top_heavy_items_uses_recursive_directory_sizes(temp_dir_with_files):
+    from disk_scanner import get_top_heavy_items
+
+    path = str(temp_dir_with_files)
+    (temp_dir_with_files / "subdir" / "nested").mkdir()
+    (temp_dir_with_files / "subdir" / "nested" / "big.bin").write_bytes(b"x" * 50)
+
+    dirs = get_top_heavy_items(path, n=2, kind="dirs")
+    assert [(item["name"], item["bytes"]) for item in dirs] == [
+        (os.path.join(path, "subdir"), 56),
+        (os.path.join(path, "subdir", "nested"), 50),
+    ]
+    files = get_top_heavy_items(path, n=10, kind="files")
+    assert [item["bytes"] for item in files] == [50, 10, 6, 5]
+    tree = build_size_tree(path)
+    assert get_top_heavy_items(path, n=3, tree=tree) == get_top_heavy_items(path, n=3)
+    assert get_top_heavy_items(path, n=0, tree=tree) == get_top_heavy_items(path, n=0) == []
+
+
+def test_iter_scan_lines_streams_the_same_tree(temp_dir_with_files):
+    import json
+    from disk_scanner import iter_scan_lines
+
+    path = str(temp_dir_with_files)
+    (temp_dir_with_files / "subdir" / "nested").mkdir()
+    (temp_dir_with_files / "subdir" / "nested" / "deep.txt").write_bytes(b"x" * 7)
+    tree = build_size_tree(path, follow_symlinks=True)
+    for filters in (None, [".txt"]):
+        streamed = "".join(iter_scan_lines(path, filters=filters, workers=2, prefetch=1))
+        assert streamed == scan_directory(path, filters=filters, tree=tree)
+
+    records = [json.loads(line) for line in iter_scan_lines(path, record_format="ndjson")]
+    assert records[-1] == {"type": "dir", "path": path, "size": 28, "allocated": tree.allocated, "is_link": False}
+    subdir = next(r for r in records if r["path"] == os.path.join(path, "subdir"))
+    assert subdir["size"] == 13
+    # A prebuilt tree (what the process-pool mode prints from) gives the same records.
+    for filters in (None, [".txt"]):
+        assert ("".join(iter_scan_lines(path, filters=filters, record_format="ndjson", tree=tree))
+                == "".join(iter_scan_lines(path, filters=filters, record_format="ndjson")))
+    with pytest.raises(ValueError):
+        next(iter_scan_lines(path, record_format="xml"))
+
+
+def test_iter_scan_lines_can_be_closed_early(temp_dir_with_files):
+    from disk_scanner import iter_scan_lines
+
+    for i in range(20):
+        (temp_dir_with_files / f"dir{i:02}").mkdir()
+    lines = iter_scan_lines(str(temp_dir_with_files))
+    assert next(lines)
+    lines.close()
+    with pytest.raises(StopIteration):
+        next(lines)
+
+
+def test_scan_progress_counts_during_the_scan(temp_dir_with_files):
+    from size_tree import ScanProgress
+
+    path = str(temp_dir_with_files)
+    progress = ScanProgress()
+    assert progress.fraction() == 0.0 and progress.eta() is None
+    root = build_size_tree(path, progress=progress)
+    assert progress.finished and progress.fraction() == 1.0
+    assert progress.entries == len(root.tree) - 1 == 4
+    assert progress.dirs_completed == progress.dirs_discovered == 2
+
+    # Seeded from an earlier scan, the estimate follows the entries seen so far
+    seeded = ScanProgress(expected_entries=8)
+    seeded.add_listing(4, 0)
+    assert seeded.fraction() == 0.5
+    seeded.add_listing(10, 0)
+    assert seeded.fraction() == 0.99
+
+
+def test_scan_filter_rules():
+    from scan_filters import compile_filter
+
+    assert compile_filter(None) is None
+    assert compile_filter(" , ") is None
+    filters = compile_filter(".TXT, tar.gz, *.log")
+    assert filters.matches("/a/b.txt", 1)
+    assert filters.matches("/a/archive.tar.gz", 1)
+    assert filters.matches("/a/x.LOG", 1)
+    assert not filters.matches("/a/b.py", 1)
+
+    sized = compile_filter(["size>10", "size<1K"])
+    assert sized.matches("/a/b", 11) and not sized.matches("/a/b", 10) and not sized.matches("/a/b", 2048)
+    assert compile_filter("re:/src/.*\\.py$").matches("/x/src/mod.py", 1)
+    with pytest.raises(ValueError):
+        compile_filter("size>5parsecs")
+
+
+def test_excluded_directories_are_never_listed(temp_dir_with_files):
+    import size_tree
+    from disk_scanner import get_top_heavy_items, iter_scan_lines
+    from scan_filters import compile_filter
+
+    path = str(temp_dir_with_files)
+    (temp_dir_with_files / "node_modules" / "pkg").mkdir(parents=True)
+    (temp_dir_with_files / "node_modules" / "pkg" / "index.txt").write_bytes(b"x" * 1000)
+    listed = []
+    original = size_tree._list_directory
+
+    def recording_lister(dir_path):
+        listed.append(dir_path)
+        return original(dir_path)
+
+    filters = compile_filter(".txt,!node_modules")
+    with patch.object(size_tree, "_list_directory", recording_lister):
+        root = build_size_tree(path, prune=filters.prunes)
+        output = "".join(iter_scan_lines(path, filters=filters))
+    assert not any("node_modules" in p for p in listed)
+    assert root.size == 21
+    assert "index.txt" not in output and "file1.txt" in output
+    assert [item["bytes"] for item in get_top_heavy_items(path, n=1, filters=filters)] == [10]
+
+
+def test_listing_needs_at_most_one_stat_per_entry(temp_dir_with_files):
+    from fs_listing import LISTING_STATS
+
+    for i in range(10):
+        (temp_dir_with_files / "subdir" / f"dir{i}").mkdir()
+        (temp_dir_with_files / "subdir" / f"dir{i}" / "f.bin").write_bytes(b"x" * i)
+    LISTING_STATS.reset()
+    build_size_tree(str(temp_dir_with_files))
+    assert LISTING_STATS.entries == 24
+    # Directories come from d_type and cost nothing; each file costs one lstat.
+    assert LISTING_STATS.stats_per_entry <= 14 / 24
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="statx is Linux only")
+def test_statx_backend_lists_like_scandir(test_directory_with_symlink, temp_dir_with_files):
+    from fs_listing import get_lister, list_directory
+
+    try:
+        statx_lister = get_lister("statx")
+    except OSError as e:
+        pytest.skip(str(e))
+    for path in (str(test_directory_with_symlink), str(temp_dir_with_files), str(temp_dir_with_files / "subdir")):
+        assert sorted(statx_lister(path)[0]) == sorted(list_directory(path)[0])
+    scanned = scan_directory(str(temp_dir_with_files), backend="statx")
+    assert scanned == scan_directory(str(temp_dir_with_files))
+
+
+def test_hardlinks_are_counted_once(temp_dir_with_files):
+    from disk_scanner import get_top_heavy_items, iter_scan_lines
+    from size_tree import iter_nodes
+
+    path = str(temp_dir_with_files)
+    (temp_dir_with_files / "big.bin").write_bytes(b"x" * 5000)
+    os.link(temp_dir_with_files / "big.bin", temp_dir_with_files / "subdir" / "big-link.bin")
+    root = build_size_tree(path)
+    assert root.size == 5021
+    assert sum(node.is_duplicate for node in iter_nodes(root)) == 1
+    assert root.allocated >= os.stat(temp_dir_with_files / "big.bin").st_blocks * 512
+    assert calculate_size(path) == 5021
+    top = get_top_heavy_items(path, n=10, kind="files")
+    assert [item["bytes"] for item in top].count(5000) == 1
+    assert top[0]["allocated_bytes"] == os.stat(temp_dir_with_files / "big.bin").st_blocks * 512
+    assert "".join(iter_scan_lines(path)).count("[HARDLINK]") == 1
+
+
+def test_sparse_file_allocated_size(tmp_path):
+    sparse = tmp_path / "disk.img"
+    with open(sparse, "wb") as f:
+        f.truncate(64 * 1024 * 1024)
+    if os.stat(sparse).st_blocks * 512 >= 64 * 1024 * 1024:
+        pytest.skip("filesystem does not support sparse files")
+    root = build_size_tree(str(tmp_path))
+    assert root.size == 64 * 1024 * 1024
+    assert root.allocated < root.size
+    assert SizeTree.from_bytes(root.tree.to_bytes()).allocated[0] == root.allocated
+    by_disk = get_top_5_heavy_items(str(tmp_path), size_mode="allocated")
+    assert by_disk[0]["bytes"] == 64 * 1024 * 1024 and by_disk[0]["allocated_bytes"] < by_disk[0]["bytes"]
+    with pytest.raises(ValueError):
+        get_top_5_heavy_items(str(tmp_path), size_mode="blocks")
+
+
+def test_inode_set_grows_and_keeps_devices_apart():
+    from inode_set import InodeSet
+
+    inodes = InodeSet()
+    assert inodes.add(1, 0) and not inodes.add(1, 0)
+    for inode in range(1, 20000):
+        assert inodes.add(1, inode * 7919)
+    assert not inodes.add(1, 7919 * 123)
+    assert (1, 7919 * 5) in inodes and (2, 7919 * 5) not in inodes
+    assert inodes.add(2, 7919 * 5)
+    assert len(inodes) == 20001
+    assert inodes.nbytes() <= 20001 * 8 * 4
+
+
+def test_scan_stops_at_mount_points(temp_dir_with_files):
+    from disk_scanner import get_top_heavy_items, iter_scan_lines
+    from mounts import Mount, MountPolicy, mounts_under
+
+    path = str(temp_dir_with_files)
+    real = os.path.realpath(path)
+    (temp_dir_with_files / "nfs" / "share").mkdir(parents=True)
+    (temp_dir_with_files / "nfs" / "share" / "remote.bin").write_bytes(b"x" * 1000)
+    table = [Mount(1, 1, "/", real, "ext4", "/dev/sda1"),
+             Mount(2, 2, "/", os.path.join(real, "nfs"), "nfs4", "server:/export")]
+    assert [mount.mount_point for mount in mounts_under(path, table)] == [os.path.join(real, "nfs")]
+
+    for policy in (MountPolicy(one_filesystem=True, mounts=table), MountPolicy(skip_remote=True, mounts=table),
+                   MountPolicy(skip=[os.path.join(path, "nfs")], mounts=table)):
+        root = build_size_tree(path, mounts=policy)
+        assert root.size == 21
+        assert [child.name for child in root.children if child.is_mount] == ["nfs"]
+        text = scan_directory(path, tree=build_size_tree(path, follow_symlinks=True, mounts=policy))
+        assert "[MOUNT] nfs (not scanned)" in text and "remote.bin" not in text
+        assert "".join(iter_scan_lines(path, mounts=policy)) == text
+        assert "nfs" not in " ".join(item["name"] for item in get_top_heavy_items(path, n=10, mounts=policy))
+    assert build_size_tree(path, mounts=MountPolicy(mounts=table)).size == 1021
+
+
+def test_read_mounts_unescapes_paths(tmp_path):
+    from mounts import read_mounts, is_remote
+
+    mountinfo = tmp_path / "mountinfo"
+    mountinfo.write_text(
+        "22 1 8:1 / / rw,relatime shared:1 - ext4 /dev/sda1 rw\n"
+        "40 22 0:50 / /mnt/my\\040share rw,relatime shared:20 master:3 - fuse.sshfs me@host:/ rw\n"
+        "garbage\n")
+    mounts = read_mounts(str(mountinfo))
+    assert [m.mount_point for m in mounts] == ["/", "/mnt/my share"]
+    assert mounts[0].device == os.makedev(8, 1)
+    assert not is_remote(mounts[0]) and is_remote(mounts[1])
+    assert read_mounts(str(tmp_path / "missing")) == []
+
+
+def test_slow_directories_time_out(temp_dir_with_files):
+    import size_tree
+
+    original = size_tree._list_directory
+
+    def hanging_lister(dir_path):
+        if dir_path.endswith("subdir"):
+            time.sleep(2)
+        return original(dir_path)
+
+    path = str(temp_dir_with_files)
+    started = time.monotonic()
+    with patch.object(size_tree, "_list_directory", hanging_lister):
+        root = build_size_tree(path, follow_symlinks=True, dir_timeout=0.2)
+    assert time.monotonic() - started < 1.5
+    subdir = [child for child in root.children if child.name == "subdir"][0]
+    assert subdir.timed_out and not subdir.denied
+    assert root.size == 15
+    assert "[TIMED OUT]" in scan_directory(path, tree=root)
+
+
+def test_snapshot_diff_reports_growth(temp_dir_with_files, tmp_path_factory):
+    from snapshots import save_snapshot, load_snapshot, diff_snapshots, format_diff
+
+    path = str(temp_dir_with_files)
+    snapshot = str(tmp_path_factory.mktemp("snapshots") / "before.dust")
+    save_snapshot(build_size_tree(path), snapshot)
+    assert load_snapshot(snapshot).size == 21
+
+    (temp_dir_with_files / "subdir" / "file3.txt").write_bytes(b"x" * 60)
+    (temp_dir_with_files / "logs").mkdir()
+    (temp_dir_with_files / "logs" / "app.log").write_bytes(b"x" * 500)
+    (temp_dir_with_files / "file2.txt").unlink()
+    (temp_dir_with_files / "file1.txt").unlink()
+    (temp_dir_with_files / "file1.txt").mkdir()
+
+    diff = diff_snapshots(snapshot, build_size_tree(path), n=3)
+    assert (diff.old_total, diff.new_total) == (21, 560)
+    assert (diff.added, diff.removed, diff.changed) == (3, 2, 2)
+    assert [(os.path.relpath(c.path, path), c.delta) for c in diff.largest] == [
+        ("logs", 500), (os.path.join("logs", "app.log"), 500), ("subdir", 54)]
+    assert [os.path.relpath(c.path, path) for c in diff.fastest] == ["subdir", os.path.join("subdir", "file3.txt")]
+    assert diff.fastest[0].ratio == 9.0
+    files_only = diff_snapshots(snapshot, build_size_tree(path), kind="files", min_size=10)
+    assert [c.delta for c in files_only.largest] == [500, 54] and files_only.fastest == []
+    assert "Largest growth:" in format_diff(diff)
+    empty = diff_snapshots(snapshot, build_size_tree(path), n=0)
+    assert empty.largest == empty.fastest == [] and (empty.added, empty.removed, empty.changed) == (3, 2, 2)
+
+
+def test_saved_snapshots_do_not_use_the_scan_cache(tmp_path):
+    from interface import save_tree_snapshot
+    from scan_cache import ScanCache
+    from snapshots import load_snapshot
+
+    (tmp_path / "data").mkdir()
+    log = tmp_path / "data" / "app.log"
+    log.write_bytes(b"x" * 100)
+    for directory in (tmp_path, tmp_path / "data"):
+        os.utime(directory, (time.time() - 60, time.time() - 60))
+    cache = ScanCache(":memory:")
+    assert build_size_tree(str(tmp_path), cache=cache).size == 100
+    with open(log, "ab") as f:
+        f.write(b"x" * 10_000)  # Grows in place: the directory's mtime stays the same.
+    snapshot = str(tmp_path / "after.dust")
+    save_tree_snapshot(str(tmp_path), snapshot, cache=cache)
+    assert load_snapshot(snapshot).size == 10_100
+    cache.close()
+
+
+def test_scan_metrics_count_listings_and_phases(temp_dir_with_files):
+    from scan_metrics import ScanMetrics
+
+    path = str(temp_dir_with_files)
+    metrics = ScanMetrics()
+    build_size_tree(path, metrics=metrics)
+    values = metrics.snapshot()
+    assert (values["dirs"], values["entries"], values["permission_errors"]) == (2, 4, 0)
+    assert values["workers"] > 0 and metrics.finished is not None
+    assert values["phase_seconds"]["list"] > 0 and values["phase_seconds"]["roll_up"] > 0
+    prometheus = metrics.to_prometheus()
+    assert "disk_scan_dirs_total 2\n" in prometheus
+    assert 'disk_scan_phase_seconds_total{phase="build"}' in prometheus
+
+    streamed = ScanMetrics()
+    scan_directory(path, metrics=streamed)
+    assert streamed.snapshot()["entries"] == 4
+    assert streamed.snapshot()["phase_seconds"]["render"] > 0
+    with pytest.raises(ValueError):
+        streamed.dump("xml")
+
+
+def test_listing_errors_are_summarized(caplog):
+    import logging
+    from fs_listing import ListingErrors
+
+    errors = ListingErrors(first=2, interval=3600, samples=2)
+    with caplog.at_level(logging.WARNING):
+        for i in range(5):
+            errors.add("permission denied", f"/dir{i}", f"Permission denied: /dir{i}")
+        assert [r.getMessage() for r in caplog.records][:2] == ["Permission denied: /dir0", "Permission denied: /dir1"]
+        assert len(caplog.records) == 3
+        errors.flush()
+    assert caplog.records[-1].getMessage() == "permission denied: 3 more directories (5 in total), e.g. /dir0, /dir1"
+    assert errors.counts == {}
+
+
+def test_cancelled_scan_returns_an_incomplete_tree(temp_dir_with_files):
+    import size_tree
+    from cancellation import CancelToken
+    from disk_scanner import iter_scan_lines, INCOMPLETE_LINE
+
+    path = str(temp_dir_with_files)
+    token = CancelToken()
+    original = size_tree._list_directory
+
+    def cancelling_lister(dir_path):
+        # Cancel while the root is being listed: its entries are kept, the subdirectory is never listed.
+        token.cancel()
+        return original(dir_path)
+
+    with patch.object(size_tree, "_list_directory", cancelling_lister):
+        root = build_size_tree(path, cancel=token)
+    assert root.incomplete and token.reason == "cancelled"
+    subdir = [child for child in root.children if child.name == "subdir"][0]
+    assert subdir.incomplete and subdir.children == []
+    assert root.size == 15
+    text = scan_directory(path, tree=root)
+    assert "[NOT SCANNED]" in text and text.endswith(INCOMPLETE_LINE)
+
+    expired = CancelToken(deadline=0)
+    assert list(iter_scan_lines(path, cancel=expired))[-1] == INCOMPLETE_LINE
+    assert expired.reason == "deadline"
+
+
+def test_cancel_abandons_a_hung_listing():
+    import threading
+    from cancellation import CancelToken
+    from fs_listing import with_timeout, LISTING_CANCELLED
+
+    token = CancelToken()
+    lister = with_timeout(lambda path: time.sleep(5) or ([], False), timeout=30, cancel=token)
+    started = time.monotonic()
+    threading.Timer(0.2, token.cancel).start()
+    assert lister("/hung") == ([], LISTING_CANCELLED)
+    assert time.monotonic() - started < 1
+
+
+def test_sampling_converges_to_the_exact_sizes(temp_dir_with_files):
+    from sampling import sample_sizes, format_estimate
+    from disk_scanner import get_top_heavy_items
+
+    deep = temp_dir_with_files / "subdir" / "a" / "b"
+    deep.mkdir(parents=True)
+    (deep / "file4.txt").write_text("1234")
+    path = str(temp_dir_with_files)
+    root = build_size_tree(path)
+
+    scan = sample_sizes(path, budget=30, seed=1)
+    assert scan.complete and scan.size == root.size == scan.low == scan.high
+    assert scan.visited_dirs == scan.estimated_dirs == 4
+    assert [(item.name, item.size) for item in scan.items] == [("file2.txt", 10), ("subdir", 10), ("file1.txt", 5)]
+    assert format_estimate(scan.items[1]) == format_file_size(10)
+
+    # Without any budget only the root is listed: directories get an open-ended estimate.
+    subdir = [item for item in sample_sizes(path, budget=0).items if item.name == "subdir"][0]
+    assert not subdir.exact and subdir.high is None
+    assert format_estimate(subdir).endswith(" - ?)")
+
+    top = get_top_heavy_items(path, 1, "dirs", sample_budget=30, seed=1)
+    assert top == [{"name": str(temp_dir_with_files / "subdir"), "size": format_file_size(10), "bytes": 10,
+                    "allocated": None, "allocated_bytes": None, "estimated": False, "low": 10, "high": 10,
+                    "visited_dirs": 3, "estimated_dirs": 3}]
+
+
+def test_find_duplicates_hashes_in_stages(tmp_path):
+    from duplicates import find_duplicates, format_duplicates, PARTIAL_BYTES
+    from scan_cache import ScanCache
+
+    big = os.urandom(3 * PARTIAL_BYTES)
+    (tmp_path / "a.bin").write_bytes(big)
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "b.bin").write_bytes(big)
+    # Same size and same ends as the copies: only the full hash tells it apart.
+    middle = bytearray(big)
+    middle[len(big) // 2] ^= 1
+    (tmp_path / "c.bin").write_bytes(bytes(middle))
+    (tmp_path / "small1.txt").write_text("0123456789")
+    (tmp_path / "small2.txt").write_text("0123456789")
+    (tmp_path / "other.txt").write_text("9876543210")
+    os.link(tmp_path / "a.bin", tmp_path / "a-link.bin")
+    (tmp_path / "empty1").touch()
+    (tmp_path / "empty2").touch()
+    for name in ("a.bin", "sub/b.bin", "c.bin", "small1.txt", "small2.txt", "other.txt"):
+        os.utime(tmp_path / name, (time.time() - 60, time.time() - 60))
+
+    cache = ScanCache(":memory:")
+    report = find_duplicates(str(tmp_path), cache=cache)
+    assert report.complete and report.candidates == 6
+    copies, small = report.groups
+    # Whichever of the two hardlinks is listed first stands for the inode.
+    assert len(copies.paths) == 2 and copies.paths[1] == str(tmp_path / "sub" / "b.bin")
+    assert copies.paths[0] in (str(tmp_path / "a.bin"), str(tmp_path / "a-link.bin"))
+    assert copies.reclaimable == len(big)
+    assert small.paths == (str(tmp_path / "small1.txt"), str(tmp_path / "small2.txt"))
+    assert report.reclaimable == len(big) + 10
+    assert "2 groups" in format_duplicates(report)
+
+    # Unchanged files are not read again.
+    again = find_duplicates(str(tmp_path), cache=cache)
+    assert again.groups == report.groups and again.hashed_bytes == 0
+
+
+@pytest.mark.parametrize("vectorized", [True, False])
+def test_breakdowns_group_files_by_type_owner_and_age(temp_dir_with_files, vectorized):
+    import breakdowns
+    from breakdowns import FileColumns, summarize, format_breakdowns
+
+    now = time.time()
+    old = temp_dir_with_files / "subdir" / "old.TXT"
+    old.write_text("1234567")
+    os.utime(old, (now - 400 * 86400, now - 400 * 86400))
+    os.link(old, temp_dir_with_files / "old-link.txt")
+    columns = FileColumns()
+    root = build_size_tree(str(temp_dir_with_files), columns=columns)
+    assert len(columns) == 4 and sum(columns.size) == root.size == 28
+
+    with patch.object(breakdowns, "np", breakdowns.np if vectorized else None):
+        report = summarize(columns, now=now)
+    assert [(row.label, row.bytes, row.files) for row in report.extensions] == [(".txt", 28, 4)]
+    assert report.owners[0].files == 4
+    assert [row.bytes for row in report.accessed] == [21, 0, 0, 0, 7, 0]
+    assert (report.stale.bytes, report.stale.files) == (7, 1)
+    assert "By last access" in format_breakdowns(report)
+
+
+def test_squarified_treemap_layout():
+    from treemap import squarify, layout_treemap, MIN_AREA
+
+    # The example from the squarified treemap paper: rows of 2, 2 and 3 items.
+    boxes = squarify([6, 6, 4, 3, 2, 2, 1], 0, 0, 6, 4)
+    assert [tuple(round(value, 2) for value in box) for box in boxes[:3]] == [
+        (0, 0, 3, 2), (0, 2, 3, 2), (3, 0, 1.71, 2.33)]
+    assert sum(w * h for _, _, w, h in boxes) == pytest.approx(24)
+
+    tree = SizeTree("/data")
+    tree.add(-1, "", flags=FLAG_DIR)
+    big = tree.add(0, "big", flags=FLAG_DIR)
+    tree.add(big, "movie.mkv", size=600_000)
+    for i in range(10_000):
+        tree.add(0, f"tiny{i}", size=1)
+    tree.add(0, "half.iso", size=400_000)
+    tree.roll_up()
+
+    rects = layout_treemap(tree.node(0), 100, 100)
+    top = [rect for rect in rects if rect.depth == 0]
+    assert [rect.label for rect in top] == ["big", "half.iso", "10000 other items"]
+    assert sum(rect.width * rect.height for rect in top) == pytest.approx(100 * 100)
+    assert top[2].other == 10_000 and top[2].size == 10_000 and top[2].index == -1
+    inner = [rect for rect in rects if rect.depth == 1]
+    assert [rect.label for rect in inner] == ["movie.mkv"] and inner[0].parent == rects.index(top[0])
+    assert all(rect.width * rect.height >= MIN_AREA for rect in rects if rect.index >= 0)
+    assert layout_treemap(tree.node(0), 100, 100, max_depth=1) == top
+
+
+def test_treemap_children_add_up_to_their_directory(tmp_path):
+    from treemap import layout_treemap
+
+    folder = tmp_path / "folder"
+    folder.mkdir()
+    (folder / "data.bin").write_bytes(b"x" * 5000)
+    os.symlink(folder / "data.bin", folder / "link.bin")
+    (tmp_path / "other.bin").write_bytes(b"y" * 3000)
+    root = build_size_tree(str(tmp_path))
+
+    rects = layout_treemap(root, 400, 400)
+    top = [rect for rect in rects if rect.parent == -1]
+    assert sum(rect.size for rect in top) == root.size
+    position, = [i for i, rect in enumerate(rects) if rect.label == "folder"]
+    inner = [rect for rect in rects if rect.parent == position]
+    assert sorted(rect.label for rect in inner) == ["data.bin", "link.bin"]
+    assert sum(rect.size for rect in inner) == rects[position].size
+
+
+def test_usage_slices_and_lru_cache_for_drill_down(temp_dir_with_files):
+    from visualizer import usage_slices, LRUCache
+
+    root = build_size_tree(str(temp_dir_with_files))
+    labels, sizes, _, nodes = usage_slices(root)
+    assert labels == ["file2.txt", "subdir", "file1.txt"] and sizes == [10, 6, 5]
+    subdir = nodes[1]
+    assert subdir.is_dir and usage_slices(subdir)[0] == ["file3.txt"]
+    labels, sizes, _, nodes = usage_slices(root, max_slices=1)
+    assert labels == ["file2.txt", "2 other items"] and sizes == [10, 11] and nodes[1] is None
+    # The "other" slice shows both sizes, like the others.
+    allocated = sum(node.allocated for node in usage_slices(root)[3][1:])
+    assert usage_slices(root, max_slices=1)[2][1] == f"{format_file_size(11)} ({format_file_size(allocated)} on disk)"
+
+    evicted = []
+    cache = LRUCache(2, on_evict=evicted.append)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert evicted == [2] and "b" not in cache and len(cache) == 2
+    cache.discard("a")
+    cache.discard("missing")
+    assert evicted == [2, 1] and cache.keys() == ["c"]
+    cache.put("a", 1)
+    cache.clear()
+    assert sorted(evicted) == [1, 1, 2, 3]
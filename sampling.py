@@ -0,0 +1,266 @@
+import os
+import math
+import time
+import random
+import logging
+from collections import namedtuple
+from file_size import format_file_size
+from fs_listing import LISTING_CANCELLED
+from size_tree import _TreeBuilder, _check_root, _make_lister, SIZE_MODES
+
+# Two-sided 95% normal quantile for the confidence intervals.
+_Z = 1.96
+# Probes every top-level directory gets before the budget goes to the most uncertain ones as well.
+_MIN_PROBES = 3
+
+# ``size`` is the estimate; ``low``/``high`` bound it with 95% confidence (``high`` is None while there are too
+# few probes). ``exact`` entries were listed completely. ``visited_dirs`` / ``estimated_dirs`` is how much of
+# the subtree was actually listed.
+SizeEstimate = namedtuple("SizeEstimate", ["path", "name", "is_dir", "size", "low", "high", "exact", "probes",
+                                           "visited_dirs", "estimated_dirs"])
+SampledScan = namedtuple("SampledScan", ["path", "size", "low", "high", "items", "visited_dirs", "estimated_dirs",
+                                         "elapsed", "complete"])
+
+
+class _Dir:
+    """A directory met by the sampler; listed lazily, and exact once its whole subtree has been listed."""
+
+    __slots__ = ("path", "parent", "top", "slot", "listed", "files", "open", "closed_size", "closed_dirs",
+                 "exact", "size", "dirs", "probes", "mean", "m2", "mean_dirs", "seen_size", "seen_dirs")
+
+    def __init__(self, path, parent, top):
+        self.path = path
+        self.parent = parent
+        # The top-level directory this one belongs to (itself for a top-level one).
+        self.top = top if top is not None else self
+        self.slot = 0
+        self.listed = False
+        self.files = 0
+        # Subdirectories whose size is not known exactly yet; the probes choose among them.
+        self.open = []
+        self.closed_size = 0
+        self.closed_dirs = 0
+        self.exact = False
+        self.size = 0
+        self.dirs = 0
+        # Only used on top-level directories: running mean and variance (Welford) of the probes' size
+        # estimates, their mean directory count and what has been listed under them.
+        self.probes = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.mean_dirs = 0.0
+        self.seen_size = 0
+        self.seen_dirs = 0
+
+
+class _Sampler:
+    def __init__(self, builder, size_mode, rng):
+        self.builder = builder
+        self.by_allocated = size_mode == "allocated"
+        self.rng = rng
+
+    def list(self, node):
+        """
+        Lists ``node`` and files its subdirectories as open; marks it exact
+        when it has none. Returns False when the listing was cancelled.
+        """
+        entries, denied = self.builder.lister(node.path)
+        if denied == LISTING_CANCELLED:
+            return False
+        node.listed = True
+        files = 0
+        for name, entry_path, is_dir, is_link, size, _, _, allocated, _ in entries:
+            if is_dir:
+                # Symlinks are never followed here; hardlinks are not de-duplicated either.
+                if is_link or (self.builder.prune is not None and self.builder.prune(name, entry_path)):
+                    continue
+                if self.builder.stops_at_mount(name, entry_path):
+                    continue
+                child = _Dir(entry_path, node, node.top)
+                child.slot = len(node.open)
+                node.open.append(child)
+            else:
+                files += allocated if self.by_allocated else size
+        node.files = files
+        node.top.seen_size += files
+        node.top.seen_dirs += 1
+        if not node.open:
+            self._close(node)
+        return True
+
+    def _close(self, node):
+        # The subtree of ``node`` is fully listed: fix its size and pass it on to the parents that it completes.
+        while True:
+            node.exact = True
+            node.size = node.files + node.closed_size
+            node.dirs = 1 + node.closed_dirs
+            parent = node.parent
+            if parent is None:
+                return
+            last = parent.open.pop()
+            if last is not node:
+                parent.open[node.slot] = last
+                last.slot = node.slot
+            parent.closed_size += node.size
+            parent.closed_dirs += node.dirs
+            if parent.open:
+                return
+            node = parent
+
+    def probe(self, top):
+        """
+        One random descent from ``top`` (Knuth's estimator of tree size).
+
+        At every directory the known part (its files and its exactly known
+        subdirectories) is added, one open subdirectory is picked at random
+        and its estimate is weighted by the number of open ones. The result
+        is an unbiased estimate of the subtree's size and directory count,
+        and every probe lists at least one new directory, so the estimates
+        become exact once the budget allows listing everything.
+        """
+        node, weight = top, 1
+        size = dirs = 0
+        while True:
+            if not node.listed and not self.list(node):
+                return
+            if node.exact:
+                size += weight * node.size
+                dirs += weight * node.dirs
+                break
+            size += weight * (node.files + node.closed_size)
+            dirs += weight * (1 + node.closed_dirs)
+            weight *= len(node.open)
+            node = self.rng.choice(node.open)
+        top.probes += 1
+        delta = size - top.mean
+        top.mean += delta / top.probes
+        top.m2 += delta * (size - top.mean)
+        top.mean_dirs += (dirs - top.mean_dirs) / top.probes
+
+
+def _standard_error(top):
+    """Standard error of a top-level directory's mean estimate, or None with fewer than two probes."""
+    if top.probes < 2:
+        return None
+    return math.sqrt(top.m2 / (top.probes - 1) / top.probes)
+
+
+def _estimate(top, name):
+    if top.exact:
+        return SizeEstimate(top.path, name, True, top.size, top.size, top.size, True, top.probes, top.dirs, top.dirs)
+    error = _standard_error(top)
+    # Everything listed so far is a hard lower bound.
+    size = max(top.mean, top.seen_size)
+    low = max(top.seen_size, size - _Z * error) if error is not None else top.seen_size
+    high = size + _Z * error if error is not None else None
+    return SizeEstimate(top.path, name, True, round(size), round(low), None if high is None else round(high), False,
+                        top.probes, top.seen_dirs, max(round(top.mean_dirs), top.seen_dirs))
+
+
+def _interval_width(top):
+    return _Z * (_standard_error(top) or 0.0)
+
+
+def sample_sizes(path, budget=10.0, size_mode="apparent", seed=None, cache=None, backend=None, prune=None,
+                 mounts=None, dir_timeout=None, cancel=None, on_update=None, update_interval=0.5):
+    """
+    Estimates the sizes of the top-level entries of ``path`` within a time budget.
+
+    The root is listed exactly. Every top-level directory is then estimated
+    by random probes: each probe descends through one random subdirectory
+    per level, listing what it meets, and extrapolates the subtree's size
+    from the branching it saw. Every directory gets a few probes first;
+    after that, probes alternate between going round-robin (file sizes are
+    heavy-tailed, so a few unlucky probes can hide a huge subtree) and
+    going to the directory whose confidence interval is widest.
+    Listings are kept, so later probes refine earlier ones and a subtree
+    that has been listed completely is reported exactly. The scan stops
+    when the budget is spent or everything is exact.
+
+    Args:
+        path (str): The root directory path.
+        budget (float): Seconds to spend.
+        size_mode (str): Estimate "apparent" or "allocated" sizes.
+        seed (int or None): Seed for the probes, for reproducible estimates.
+        cache, backend, prune, mounts, dir_timeout: As for build_size_tree.
+        cancel (CancelToken or None): Stops sampling early.
+        on_update (callable or None): Called with the current SampledScan
+            every ``update_interval`` seconds, for a progressive display.
+        update_interval (float): Seconds between on_update calls.
+
+    Returns:
+        SampledScan: The estimated total with its 95% interval, a
+        SizeEstimate per top-level entry (largest first; files are exact),
+        how many directories were listed out of the estimated total, the
+        elapsed time and whether everything ended up exact. Directory
+        symlinks are not followed and hardlinks are not de-duplicated.
+    """
+    if size_mode not in SIZE_MODES:
+        raise ValueError(f"Unknown size mode '{size_mode}'. Expected one of: {', '.join(SIZE_MODES)}.")
+    _check_root(path)
+    started = time.monotonic()
+    give_up = started + budget
+    builder = _TreeBuilder(None, os.path.realpath(path), False, _make_lister(cache, backend, dir_timeout, cancel=cancel),
+                           prune=prune, mounts=mounts)
+    sampler = _Sampler(builder, size_mode, random.Random(seed))
+
+    entries, _ = builder.lister(path)
+    files = []
+    tops = []
+    for name, entry_path, is_dir, is_link, size, _, _, allocated, _ in entries:
+        if is_dir and not is_link:
+            if (prune is not None and prune(name, entry_path)) or builder.stops_at_mount(name, entry_path):
+                continue
+            tops.append((name, _Dir(entry_path, None, None)))
+        elif not is_dir:
+            size = allocated if size_mode == "allocated" else size
+            files.append(SizeEstimate(entry_path, name, False, size, size, size, True, 0, 0, 0))
+
+    def result(complete):
+        items = files + [_estimate(top, name) for name, top in tops]
+        items.sort(key=lambda item: item.size, reverse=True)
+        total = sum(item.size for item in items)
+        low = sum(item.low for item in items)
+        errors = [(item.high - item.size) / _Z for item in items if item.high is not None and not item.exact]
+        unknown = any(item.high is None for item in items)
+        high = None if unknown else total + _Z * math.sqrt(sum(error * error for error in errors))
+        visited = 1 + sum(item.visited_dirs for item in items)
+        estimated = 1 + sum(item.estimated_dirs for item in items)
+        return SampledScan(path, total, low, high, items, visited, estimated, time.monotonic() - started,
+                           complete)
+
+    pending = [top for _, top in tops]
+    next_update = started + update_interval
+    turn = 0
+    while pending and time.monotonic() < give_up and not (cancel is not None and cancel.cancelled):
+        turn += 1
+        if turn <= _MIN_PROBES * len(pending):
+            top = pending[turn % len(pending)]
+        elif turn % 2:
+            top = max(pending, key=_interval_width)
+        else:
+            top = pending[turn // 2 % len(pending)]
+        sampler.probe(top)
+        if top.exact:
+            pending.remove(top)
+        if on_update is not None and time.monotonic() >= next_update:
+            on_update(result(False))
+            next_update = time.monotonic() + update_interval
+
+    scan = result(not pending)
+    logging.info(f"Sampled {path} in {scan.elapsed:.1f}s: listed {scan.visited_dirs} of about "
+                 f"{scan.estimated_dirs} directories ({visited_share(scan):.0%})")
+    return scan
+
+
+def visited_share(scan):
+    """Share of the estimated directories that were actually listed, between 0 and 1."""
+    return min(1.0, scan.visited_dirs / scan.estimated_dirs) if scan.estimated_dirs else 1.0
+
+
+def format_estimate(item):
+    """Renders an estimate as "~1.2 GB (0.9 GB - 1.6 GB)", or just the size when it is exact."""
+    if item.exact:
+        return format_file_size(item.size)
+    high = format_file_size(item.high) if item.high is not None else "?"
+    return f"~{format_file_size(item.size)} ({format_file_size(item.low)} - {high})"
@@ -0,0 +1,252 @@
+import os
+import time
+import sqlite3
+import marshal
+import logging
+import threading
+from size_tree import _list_directory, FLAG_DIR
+
+DEFAULT_MAX_ENTRIES = 2_000_000
+# A listing is only cached once its directory has been quiet for this long, so a
+# change made within the same mtime tick as the scan cannot hide behind the cache.
+_SETTLE_SECONDS = 2
+# Bumped whenever the layout of a cached listing changes.
+_LISTING_SCHEMA = 2
+
+
+def _encodable(path):
+    # SQLite needs valid UTF-8; paths with undecodable bytes are simply not cached.
+    try:
+        path.encode("utf-8")
+        return True
+    except UnicodeEncodeError:
+        return False
+
+
+def default_cache_path():
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "disk_usage", "scan_cache.sqlite")
+
+
+class ScanCache:
+    """
+    Persistent index of directory listings, keyed by directory path.
+
+    Each row stores a directory's mtime and inode, its listing (names, types,
+    apparent and allocated sizes, inodes, hardlink keys) and its rolled-up
+    size and entry count from the last scan.
+    When a directory's mtime and inode still match, its listing is reused
+    without calling scandir or stat on its entries. Subdirectories are still
+    stat'ed once each to validate their own rows, so changes deeper in the
+    tree are found. A file rewritten in place does not touch its directory's
+    mtime, so its new size is only seen after a scan without the cache.
+
+    A directory missing from its parent's fresh listing is dropped together
+    with the rows below it; rows under directories a scan did not list
+    (pruned, on another filesystem, timed out) are kept. The least recently
+    used rows are evicted beyond ``max_entries`` directories.
+
+    The cache also keeps the content digests computed by the duplicate
+    finder, per file (device and inode) and valid while its mtime and size
+    are unchanged; see lookup_hashes.
+    """
+
+    def __init__(self, db_path=None, max_entries=DEFAULT_MAX_ENTRIES):
+        self.db_path = db_path or default_cache_path()
+        self.max_entries = max_entries
+        if self.db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        # Scan workers share the connection; every use goes through the lock.
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS dirs ("
+            " path TEXT PRIMARY KEY, mtime_ns INTEGER, inode INTEGER, listing BLOB,"
+            " total_size INTEGER, total_entries INTEGER, last_used REAL)")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            " device INTEGER, inode INTEGER, mtime_ns INTEGER, size INTEGER, partial BLOB, full BLOB,"
+            " last_used REAL, PRIMARY KEY (device, inode))")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._check_format()
+        self.hits = 0
+        self.misses = 0
+        self._seen = []
+        # Directories listed by the current scan, and the subdirectories found in those listings.
+        self._listed = set()
+        self._found = set()
+        self._hashes_seen = []
+        self._scan_started = time.time()
+
+    def _check_format(self):
+        # marshal's format may change between Python versions; start over when it does.
+        row = self._connection.execute("SELECT value FROM meta WHERE key = 'listing_format'").fetchone()
+        current = f"marshal-{marshal.version}-{_LISTING_SCHEMA}"
+        if row is None or row[0] != current:
+            self._connection.execute("DELETE FROM dirs")
+            self._connection.execute("INSERT OR REPLACE INTO meta VALUES ('listing_format', ?)", (current,))
+            self._connection.commit()
+
+    def lister(self, fallback=_list_directory):
+        """Returns a directory lister that answers from the cache and falls back to ``fallback``."""
+        self._scan_started = time.time()
+
+        def list_directory(path):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return fallback(path)
+            listing = self.lookup(path, stat.st_mtime_ns, stat.st_ino)
+            if listing is not None:
+                entries, denied = listing
+            else:
+                entries, denied = fallback(path)
+                if not denied and stat.st_mtime < self._scan_started - _SETTLE_SECONDS:
+                    self.store(path, stat.st_mtime_ns, stat.st_ino, entries)
+            if not denied:
+                # What finish_scan needs to tell a deleted directory from one this scan did not list.
+                with self._lock:
+                    self._listed.add(path.rstrip(os.sep) or path)
+                    self._found.update(entry[1] for entry in entries if entry[2])
+            return entries, denied
+
+        return list_directory
+
+    def lookup(self, path, mtime_ns, inode):
+        """Returns the cached (entries, denied) listing of ``path`` if it is still valid."""
+        if not _encodable(path):
+            return None
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT mtime_ns, inode, listing FROM dirs WHERE path = ?", (path,)).fetchone()
+            if row is None or row[0] != mtime_ns or row[1] != inode:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._seen.append(path)
+        entries = [
+            (name, os.path.join(path, name), is_dir, is_link, size, entry_inode, link_target, allocated, hardlink)
+            for name, is_dir, is_link, size, entry_inode, link_target, allocated, hardlink in marshal.loads(row[2])
+        ]
+        return entries, False
+
+    def store(self, path, mtime_ns, inode, entries):
+        if not _encodable(path):
+            return
+        listing = marshal.dumps([
+            (name, is_dir, is_link, size, entry_inode, link_target, allocated, hardlink)
+            for name, _, is_dir, is_link, size, entry_inode, link_target, allocated, hardlink in entries
+        ])
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO dirs (path, mtime_ns, inode, listing, last_used) VALUES (?, ?, ?, ?, ?)",
+                (path, mtime_ns, inode, listing, time.time()))
+            self._seen.append(path)
+
+    def cached_totals(self, path):
+        """Returns (total_size, total_entries) recorded by the last scan of ``path``, or None."""
+        if not _encodable(path):
+            return None
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT total_size, total_entries FROM dirs WHERE path = ?", (path,)).fetchone()
+        return row if row and row[0] is not None else None
+
+    def finish_scan(self, root=None):
+        """
+        Records the rolled-up totals of a finished scan, drops rows for
+        directories that no longer exist under it and enforces the size cap.
+
+        A row counts as gone only when this scan listed its parent and did
+        not find it there, so pruned, filtered, mount-skipping or timed-out
+        scans keep the rows of what they did not look at.
+
+        Args:
+            root (SizeNode or None): Root of the tree that was just scanned.
+                Walks that keep no tree pass None; then only the listings
+                are saved.
+        """
+        totals = []
+        if root is not None:
+            tree = root.tree
+            entries = [1] * len(tree)
+            for index in range(len(tree) - 1, 0, -1):
+                entries[tree.parent[index]] += entries[index]
+            totals = [
+                (tree.size[index], entries[index] - 1, tree.path(index))
+                for index in range(len(tree)) if tree.flags[index] & FLAG_DIR
+            ]
+            totals = [row for row in totals if _encodable(row[2])]
+        now = time.time()
+        with self._lock:
+            connection = self._connection
+            connection.executemany("UPDATE dirs SET total_size = ?, total_entries = ? WHERE path = ?", totals)
+            connection.executemany("UPDATE dirs SET last_used = ? WHERE path = ?", ((now, p) for p in self._seen))
+            if root is not None:
+                prefix = root.tree.root_path.rstrip(os.sep) + os.sep
+                untouched = connection.execute(
+                    "SELECT path FROM dirs WHERE path >= ? AND path < ? AND last_used < ?",
+                    (prefix, prefix[:-1] + chr(ord(os.sep) + 1), now)).fetchall()
+                for path, in untouched:
+                    if os.path.dirname(path) in self._listed and path not in self._found:
+                        # Gone from disk, and so is everything below it.
+                        connection.execute("DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)",
+                                           (path, path + os.sep, path + chr(ord(os.sep) + 1)))
+            count = connection.execute("SELECT COUNT(*) FROM dirs").fetchone()[0]
+            if count > self.max_entries:
+                connection.execute(
+                    "DELETE FROM dirs WHERE path IN (SELECT path FROM dirs ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,))
+            connection.commit()
+            self._seen = []
+            self._listed = set()
+            self._found = set()
+        logging.info(f"Scan cache: {self.hits} hits, {self.misses} misses")
+
+    def lookup_hashes(self, device, inode, mtime_ns, size):
+        """
+        Returns the cached (partial, full) digests of a file whose mtime and
+        size still match, or None. ``full`` is None when only the partial
+        digest was ever needed.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT partial, full FROM hashes WHERE device = ? AND inode = ? AND mtime_ns = ? AND size = ?",
+                (device, inode, mtime_ns, size)).fetchone()
+            if row is not None:
+                self._hashes_seen.append((device, inode))
+        return tuple(row) if row is not None else None
+
+    def store_hashes(self, device, inode, mtime_ns, size, mtime, partial, full):
+        # Like listings, digests of files modified during the scan are not kept.
+        if mtime >= time.time() - _SETTLE_SECONDS:
+            return
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (device, inode, mtime_ns, size, partial, full, time.time()))
+
+    def finish_hashing(self):
+        """Saves the digests of a duplicate search and evicts the least recently used beyond ``max_entries``."""
+        now = time.time()
+        with self._lock:
+            connection = self._connection
+            connection.executemany("UPDATE hashes SET last_used = ? WHERE device = ? AND inode = ?",
+                                   ((now, device, inode) for device, inode in self._hashes_seen))
+            count = connection.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+            if count > self.max_entries:
+                connection.execute(
+                    "DELETE FROM hashes WHERE rowid IN (SELECT rowid FROM hashes ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,))
+            connection.commit()
+            self._hashes_seen = []
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM dirs")
+            self._connection.execute("DELETE FROM hashes")
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,201 @@
+import os
+import re
+import time
+import fnmatch
+import logging
+
+try:
+    import pwd
+except ImportError:  # Windows
+    pwd = None
+
+_SIZE_UNITS = {"": 1, "b": 1, "k": 1024, "kb": 1024, "m": 1024 ** 2, "mb": 1024 ** 2,
+               "g": 1024 ** 3, "gb": 1024 ** 3, "t": 1024 ** 4, "tb": 1024 ** 4}
+_AGE_UNITS = {"": 86400, "s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+_COMPARISON = re.compile(r"^(size|age)\s*([<>])\s*(\d+(?:\.\d+)?)\s*([a-z]*)$", re.IGNORECASE)
+_GLOB_CHARS = frozenset("*?[")
+
+
+def _glob_regex(patterns):
+    """Joins globs into one case-insensitive regex, or returns None when there are none."""
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{fnmatch.translate(p)})" for p in patterns), re.IGNORECASE)
+
+
+def _resolve_owner(owner):
+    if owner.isdigit():
+        return int(owner)
+    if pwd is None:
+        raise ValueError(f"Owner names are not supported on this system: '{owner}'")
+    try:
+        return pwd.getpwnam(owner).pw_uid
+    except KeyError:
+        raise ValueError(f"Unknown owner '{owner}'") from None
+
+
+class ScanFilter:
+    """
+    A filter spec compiled once into matchers.
+
+    A file matches when its name matches any of the extensions, globs or
+    regexes (or none of those are given), every size, age and owner bound
+    holds, and no exclude pattern matches its name. Extensions are looked up
+    in a set, and globs are joined into a single regex, so the cost per file
+    does not grow with the number of rules. Age and owner rules need one stat
+    per candidate file and are checked last.
+
+    Exclude patterns also prune directories: an excluded directory is never
+    listed, so its subtree costs no syscalls and is left out of all sizes.
+    A pattern containing "/" is matched against the full path, any other
+    pattern against the name.
+    """
+
+    def __init__(self, extensions=(), globs=(), regexes=(), min_size=None, max_size=None,
+                 min_age=None, max_age=None, owners=(), exclude=()):
+        self.extensions = frozenset(
+            (ext if ext.startswith(".") else "." + ext).lower() for ext in extensions)
+        name_globs = [p for p in globs if "/" not in p and os.sep not in p]
+        self._name_glob = _glob_regex(name_globs)
+        self._path_glob = _glob_regex([p for p in globs if p not in name_globs])
+        self._regexes = [re.compile(r) for r in regexes]
+        self.min_size = min_size
+        self.max_size = max_size
+        self.min_age = min_age
+        self.max_age = max_age
+        self.owners = frozenset(_resolve_owner(str(o)) for o in owners)
+        exclude_names = [p for p in exclude if "/" not in p and os.sep not in p]
+        self._exclude_name = _glob_regex(exclude_names)
+        self._exclude_path = _glob_regex([p for p in exclude if p not in exclude_names])
+        self._has_name_rules = bool(self.extensions or globs or regexes)
+        self._needs_stat = bool(min_age is not None or max_age is not None or self.owners)
+
+    @classmethod
+    def parse(cls, spec):
+        """
+        Compiles a spec: a comma-separated string or a list of rules.
+
+        Rules:
+            .txt / txt          extension (case-insensitive, ".tar.gz" works too)
+            *.log / src/*.py    glob on the name, or on the path if it contains "/"
+            re:<regex>          regex searched in the full path
+            size>10M, size<1G   size bounds (units B, K, M, G, T)
+            age<7d, age>30d     modification age bounds (units s, m, h, d, w)
+            owner:<name|uid>    owned by this user
+            !node_modules       exclude files and prune directories matching a glob
+        """
+        if isinstance(spec, str):
+            spec = spec.split(",")
+        rules = {"extensions": [], "globs": [], "regexes": [], "owners": [], "exclude": []}
+        bounds = {}
+        for token in spec:
+            token = token.strip()
+            if not token:
+                continue
+            if token.startswith("!"):
+                rules["exclude"].append(token[1:])
+            elif token.startswith("re:"):
+                rules["regexes"].append(token[3:])
+            elif token.startswith("owner:"):
+                rules["owners"].append(token[6:])
+            elif _GLOB_CHARS.intersection(token):
+                rules["globs"].append(token)
+            elif (comparison := _COMPARISON.match(token)) is not None:
+                field, operator, number, unit = comparison.groups()
+                units = _SIZE_UNITS if field.lower() == "size" else _AGE_UNITS
+                if unit.lower() not in units:
+                    raise ValueError(f"Unknown unit '{unit}' in filter rule '{token}'")
+                value = float(number) * units[unit.lower()]
+                bounds[("max_" if operator == "<" else "min_") + field.lower()] = value
+            else:
+                rules["extensions"].append(token)
+        return cls(**rules, **bounds)
+
+    @property
+    def is_empty(self):
+        return not (self._has_name_rules or self._needs_stat or self.has_excludes
+                    or self.min_size is not None or self.max_size is not None)
+
+    @property
+    def has_excludes(self):
+        return self._exclude_name is not None or self._exclude_path is not None
+
+    def prunes(self, name, path):
+        """Returns True for a directory that must not be listed at all."""
+        if self._exclude_name is not None and self._exclude_name.match(name):
+            return True
+        return self._exclude_path is not None and self._exclude_path.match(path) is not None
+
+    def _name_matches(self, name, path):
+        if self.extensions:
+            lowered = name.lower()
+            dot = lowered.find(".")
+            while dot != -1:
+                if lowered[dot:] in self.extensions:
+                    return True
+                dot = lowered.find(".", dot + 1)
+        if self._name_glob is not None and self._name_glob.match(name):
+            return True
+        if self._path_glob is not None and self._path_glob.match(path):
+            return True
+        return any(regex.search(path) for regex in self._regexes)
+
+    def matches(self, path, size=None):
+        """
+        Checks one item against the filter.
+
+        Args:
+            path (str): The item's path.
+            size (int or None): Its size if already known; otherwise it is
+                stat'ed when a size rule needs it.
+
+        Returns:
+            bool: True if the item passes.
+        """
+        name = os.path.basename(path)
+        if self._has_name_rules and not self._name_matches(name, path):
+            return False
+        if self.prunes(name, path):
+            return False
+        stat = None
+        if self._needs_stat or (size is None and (self.min_size is not None or self.max_size is not None)):
+            try:
+                stat = os.stat(path)
+            except OSError as e:
+                # Called per file: skip formatting the message unless it will be shown.
+                if logging.getLogger().isEnabledFor(logging.DEBUG):
+                    logging.debug(f"Cannot stat {path} for filtering: {e}")
+                return False
+            if size is None:
+                size = stat.st_size
+        if self.min_size is not None and size <= self.min_size:
+            return False
+        if self.max_size is not None and size >= self.max_size:
+            return False
+        if stat is not None:
+            age = time.time() - stat.st_mtime
+            if self.min_age is not None and age <= self.min_age:
+                return False
+            if self.max_age is not None and age >= self.max_age:
+                return False
+            if self.owners and stat.st_uid not in self.owners:
+                return False
+        return True
+
+
+def compile_filter(spec):
+    """
+    Returns a ScanFilter for ``spec``, or None when nothing is filtered.
+
+    ``spec`` may be None, a ScanFilter (returned as is), a comma-separated
+    string or a list of rules; see ScanFilter.parse.
+    """
+    if spec is None or isinstance(spec, ScanFilter):
+        return spec
+    compiled = ScanFilter.parse(spec)
+    return None if compiled.is_empty else compiled
+
+
+def pruner(filters):
+    """Returns the directory pruning callback of a compiled filter, or None."""
+    return filters.prunes if filters is not None and filters.has_excludes else None
@@ -0,0 +1,179 @@
+import json
+import time
+import threading
+import contextlib
+from fs_listing import LISTING_STATS, LISTING_TIMED_OUT, LISTING_CANCELLED
+
+# list: readdir and stat calls (the lister); build: adding entries to the tree, including pruning;
+# roll_up: summing sizes bottom-up; render: filtering and formatting output lines; gui: Tk updates.
+PHASES = ("list", "build", "roll_up", "render", "gui")
+METRICS_FORMATS = ("json", "prometheus")
+
+_PROMETHEUS_PREFIX = "disk_scan"
+# name, type, help, key in snapshot()
+_PROMETHEUS_METRICS = (
+    ("dirs_total", "counter", "Directories listed.", "dirs"),
+    ("entries_total", "counter", "Entries returned by directory listings.", "entries"),
+    ("stat_calls_total", "counter", "stat-family syscalls made by the listers (process-wide).", "stat_calls"),
+    ("permission_errors_total", "counter", "Directories that could not be read.", "permission_errors"),
+    ("timeouts_total", "counter", "Directory listings given up on after the per-directory timeout.", "timeouts"),
+    ("elapsed_seconds", "gauge", "Wall time since the scan started.", "elapsed_seconds"),
+    ("dirs_per_second", "gauge", "Directories listed per second of wall time.", "dirs_per_sec"),
+    ("entries_per_second", "gauge", "Entries listed per second of wall time.", "entries_per_sec"),
+    ("queue_depth", "gauge", "Directories waiting for a worker at the last listing.", "queue_depth"),
+    ("queue_depth_peak", "gauge", "Most directories waiting for a worker at once.", "peak_queue_depth"),
+    ("workers", "gauge", "Scan workers.", "workers"),
+    ("worker_utilization", "gauge", "Share of the workers' wall time spent listing and building.",
+     "worker_utilization"),
+)
+
+
+class ScanMetrics:
+    """
+    Counters and per-phase timers of a scan, readable while it runs.
+
+    Pass one to build_size_tree, walk_sizes or the disk_scanner functions
+    (``metrics=``) and read ``snapshot()`` from any thread, e.g. for a status
+    line, or dump it with ``to_json()`` / ``to_prometheus()`` when the scan is
+    done. Everything is counted once per directory listing, never per entry;
+    scans without metrics only pay an ``is None`` check per directory.
+
+    ``stat_calls`` is the delta of fs_listing.LISTING_STATS since the metrics
+    were created, so it includes other scans running in the same process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.finished = None
+        self.dirs = 0
+        self.entries = 0
+        self.permission_errors = 0
+        self.timeouts = 0
+        self.phase_seconds = dict.fromkeys(PHASES, 0.0)
+        self.workers = 0
+        self.queue_depth = 0
+        self.peak_queue_depth = 0
+        self._queue_depth = None
+        self._stat_calls_start = LISTING_STATS.stat_calls
+
+    def lister(self, lister):
+        """Wraps a directory lister so that every listing is counted and timed."""
+        def list_directory(path):
+            start = time.perf_counter()
+            entries, denied = lister(path)
+            elapsed = time.perf_counter() - start
+            depth = self._queue_depth() if self._queue_depth is not None else 0
+            with self._lock:
+                self.dirs += 1
+                self.entries += len(entries)
+                if denied == LISTING_TIMED_OUT:
+                    self.timeouts += 1
+                elif denied and denied != LISTING_CANCELLED:
+                    self.permission_errors += 1
+                self.phase_seconds["list"] += elapsed
+                self.queue_depth = depth
+                if depth > self.peak_queue_depth:
+                    self.peak_queue_depth = depth
+            return entries, denied
+
+        return list_directory
+
+    def watch(self, queue_depth, workers):
+        """
+        Samples the work queue of a scan at every listing.
+
+        Args:
+            queue_depth (callable or None): Returns the number of queued
+                directories, e.g. WorkStealingScheduler.queued.
+            workers (int): Number of workers the scan runs on.
+        """
+        self._queue_depth = queue_depth
+        self.workers = workers
+
+    def add_time(self, phase, seconds):
+        with self._lock:
+            self.phase_seconds[phase] += seconds
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Adds the time spent in the ``with`` block to phase ``name``."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def finish(self):
+        """Stops the wall clock the rates are computed over; later phases (e.g. "gui") still add up."""
+        self._queue_depth = None
+        self.queue_depth = 0
+        self.finished = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    def snapshot(self):
+        """
+        Returns the current values as a dict.
+
+        Returns:
+            dict: Counters (dirs, entries, stat_calls, permission_errors,
+            timeouts), rates (dirs_per_sec, entries_per_sec), queue_depth,
+            peak_queue_depth, workers, worker_utilization (0 to 1, listing
+            and build time over workers * elapsed), elapsed_seconds and
+            phase_seconds.
+        """
+        elapsed = self.elapsed
+        with self._lock:
+            phases = dict(self.phase_seconds)
+            values = {
+                "elapsed_seconds": elapsed,
+                "dirs": self.dirs,
+                "entries": self.entries,
+                "stat_calls": max(0, LISTING_STATS.stat_calls - self._stat_calls_start),
+                "permission_errors": self.permission_errors,
+                "timeouts": self.timeouts,
+                "queue_depth": self.queue_depth,
+                "peak_queue_depth": self.peak_queue_depth,
+                "workers": self.workers,
+            }
+        values["dirs_per_sec"] = values["dirs"] / elapsed if elapsed > 0 else 0.0
+        values["entries_per_sec"] = values["entries"] / elapsed if elapsed > 0 else 0.0
+        busy = phases["list"] + phases["build"]
+        values["worker_utilization"] = min(1.0, busy / (self.workers * elapsed)) if self.workers and elapsed > 0 else 0.0
+        values["phase_seconds"] = phases
+        return values
+
+    def status_line(self):
+        """A one-line summary for a status bar."""
+        values = self.snapshot()
+        line = f"{values['dirs_per_sec']:,.0f} folders/s, {values['entries_per_sec']:,.0f} items/s"
+        if values["workers"]:
+            line += f", queue {values['queue_depth']}, workers {values['worker_utilization']:.0%} busy"
+        return line
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """Renders the snapshot in the Prometheus text exposition format."""
+        values = self.snapshot()
+        lines = []
+        for name, kind, description, key in _PROMETHEUS_METRICS:
+            lines.append(f"# HELP {_PROMETHEUS_PREFIX}_{name} {description}")
+            lines.append(f"# TYPE {_PROMETHEUS_PREFIX}_{name} {kind}")
+            lines.append(f"{_PROMETHEUS_PREFIX}_{name} {values[key]}")
+        name = f"{_PROMETHEUS_PREFIX}_phase_seconds_total"
+        lines.append(f"# HELP {name} Time spent in each phase of the scan, summed over threads.")
+        lines.append(f"# TYPE {name} counter")
+        lines.extend(f'{name}{{phase="{phase}"}} {seconds}' for phase, seconds in values["phase_seconds"].items())
+        return "\n".join(lines) + "\n"
+
+    def dump(self, metrics_format):
+        """Returns the metrics as "json" or "prometheus" text."""
+        if metrics_format not in METRICS_FORMATS:
+            raise ValueError(f"Unknown metrics format '{metrics_format}'. "
+                             f"Expected one of: {', '.join(METRICS_FORMATS)}.")
+        return self.to_json() if metrics_format == "json" else self.to_prometheus()
@@ -0,0 +1,112 @@
+import os
+import threading
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def default_worker_count():
+    """Same default as ThreadPoolExecutor: enough threads to overlap I/O without oversubscribing."""
+    return min(32, (os.cpu_count() or 1) + 4)
+
+
+class WorkStealingScheduler:
+    """
+    Runs directory tasks on a fixed number of workers.
+
+    Every worker owns a deque. Tasks spawned by a worker go to the back of its
+    own deque and are popped from the back (depth-first, so the frontier stays
+    small); an idle worker steals from the front of another worker's deque,
+    which hands it the oldest and usually largest pending subtree. Nothing
+    blocks on a child task's result, so wide trees cannot starve the pool.
+
+    A task is a callable ``task(scheduler)``; it may call ``submit`` to queue
+    more tasks.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = max(1, workers or default_worker_count())
+        self._queues = [deque() for _ in range(self.workers)]
+        self._local = threading.local()
+        self._condition = threading.Condition()
+        self._pending = 0
+        self._idle = 0
+        self._next_queue = 0
+        self._error = None
+
+    @property
+    def queued(self):
+        """Tasks waiting in the deques; read without the lock, so it is only a sample."""
+        return sum(len(tasks) for tasks in self._queues)
+
+    def submit(self, task):
+        """Queues a task on the calling worker's deque, or round-robin from outside the pool."""
+        with self._condition:
+            self._pending += 1
+            worker_id = getattr(self._local, "worker_id", None)
+            if worker_id is None:
+                worker_id = self._next_queue
+                self._next_queue = (self._next_queue + 1) % self.workers
+            self._queues[worker_id].append(task)
+            if self._idle:
+                self._condition.notify()
+
+    def _take(self, worker_id):
+        try:
+            return self._queues[worker_id].pop()
+        except IndexError:
+            pass
+        for offset in range(1, self.workers):
+            try:
+                return self._queues[(worker_id + offset) % self.workers].popleft()
+            except IndexError:
+                continue
+        return None
+
+    def _work(self, worker_id):
+        self._local.worker_id = worker_id
+        while True:
+            task = self._take(worker_id)
+            if task is None:
+                with self._condition:
+                    if self._pending == 0 or self._error is not None:
+                        self._condition.notify_all()
+                        return
+                    self._idle += 1
+                    self._condition.wait(0.05)
+                    self._idle -= 1
+                continue
+            try:
+                task(self)
+            except BaseException as e:
+                logging.exception(f"Scan task failed: {e}")
+                with self._condition:
+                    if self._error is None:
+                        self._error = e
+            finally:
+                with self._condition:
+                    self._pending -= 1
+                    if self._pending == 0:
+                        self._condition.notify_all()
+
+    def run(self, executor=None):
+        """
+        Runs until every submitted task, including tasks they spawn, has finished.
+
+        Args:
+            executor (Executor or None): Pool to run the worker loops on. A
+                private ThreadPoolExecutor with ``workers`` threads is used
+                when omitted.
+        """
+        if executor is None:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="scan") as own_executor:
+                self._run_on(own_executor)
+        else:
+            self._run_on(executor)
+        if self._error is not None:
+            raise self._error
+
+    def _run_on(self, executor):
+        futures = [executor.submit(self._work, worker_id) for worker_id in range(self.workers)]
+        for future in futures:
+            future.result()
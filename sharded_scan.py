@@ -0,0 +1,120 @@
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from size_tree import SizeTree, _TreeBuilder, _check_root, _new_tree, _make_lister, _mark_incomplete, FLAG_INCOMPLETE
+from fs_listing import LISTING_ERRORS
+
+SHARDINGS = ("balanced", "top-level")
+# How often the parent process checks the cancel token while it waits for shards.
+_CANCEL_POLL_SECONDS = 0.1
+
+
+def _scan_shard(path, root_real, follow_symlinks, prune=None, backend=None, mounts=None, dir_timeout=None):
+    """Scans one shard in a worker process and returns its tree, not rolled up, as bytes."""
+    tree = _new_tree(path)
+    lister = _make_lister(backend=backend, dir_timeout=dir_timeout)
+    _TreeBuilder(tree, root_real, follow_symlinks, lister, prune=prune, mounts=mounts).scan(0, path, workers=1)
+    # Every worker process has its own counts; summarize them before the process is reused.
+    LISTING_ERRORS.flush()
+    return tree.to_bytes()
+
+
+def _split(builder, processes, sharding):
+    """
+    Lists the top of the tree in this process and returns the shards left to scan.
+
+    "top-level" makes every top-level directory a shard. "balanced" keeps
+    splitting breadth-first until there are several shards per process, so a
+    single huge directory does not leave the other processes idle.
+    """
+    frontier = builder.add_listing(0, *builder.lister(builder.tree.root_path))
+    if sharding == "top-level":
+        return frontier
+
+    target = processes * 4
+    for _ in range(3):
+        if not frontier or len(frontier) >= target:
+            break
+        next_frontier = []
+        for index, path in frontier:
+            next_frontier.extend(builder.add_listing(index, *builder.lister(path)))
+        frontier = next_frontier
+    return frontier
+
+
+def build_sharded_size_tree(path, follow_symlinks=False, processes=None, sharding="balanced", prune=None,
+                            backend=None, mounts=None, dir_timeout=None, metrics=None, cancel=None):
+    """
+    Builds a size tree by scanning shards of it in separate processes.
+
+    Useful on fast storage (NVMe, tmpfs) where a scan is bound by Python
+    bookkeeping under the GIL rather than by I/O. Each worker sends its
+    partial tree back as a SizeTree.to_bytes() blob, and the blobs are grafted
+    into one tree that is rolled up once at the end.
+
+    Args:
+        path (str): The root directory path.
+        follow_symlinks (bool): See build_size_tree. Targets outside the tree
+            are de-duplicated per shard only.
+        processes (int or None): Number of worker processes.
+        sharding (str): "balanced" or "top-level".
+        prune (callable or None): See build_size_tree; it is sent to the
+            workers, so it must be picklable (ScanFilter.prunes is).
+        backend (str or None): Directory listing backend, see fs_listing.get_lister.
+        mounts (MountPolicy or None): See build_size_tree; sent to the workers.
+        dir_timeout (float or None): See build_size_tree.
+        metrics (ScanMetrics or None): Counts the listings made while
+            splitting the tree and times grafting ("build") and rolling up;
+            the workers' own listings are not counted.
+        cancel (CancelToken or None): See build_size_tree. Shards not
+            finished when it fires are flagged FLAG_INCOMPLETE; worker
+            processes already running one finish it in the background.
+
+    Returns:
+        SizeNode: The root node of the tree.
+    """
+    if sharding not in SHARDINGS:
+        raise ValueError(f"Unknown sharding '{sharding}'. Expected one of: {', '.join(SHARDINGS)}.")
+    _check_root(path)
+    processes = processes or os.cpu_count() or 1
+    root_real = os.path.realpath(path)
+    tree = _new_tree(path)
+    lister = _make_lister(backend=backend, dir_timeout=dir_timeout, metrics=metrics, cancel=cancel)
+    builder = _TreeBuilder(tree, root_real, follow_symlinks, lister, prune=prune, mounts=mounts)
+    shards = _split(builder, processes, sharding)
+    logging.info(f"Scanning {path} as {len(shards)} shards on {processes} processes")
+
+    if shards:
+        executor = ProcessPoolExecutor(max_workers=processes)
+        pending = ()
+        try:
+            futures = {
+                executor.submit(_scan_shard, shard_path, root_real, follow_symlinks, prune, backend, mounts,
+                                dir_timeout): index
+                for index, shard_path in shards
+            }
+            pending = set(futures)
+            poll = _CANCEL_POLL_SECONDS if cancel is not None else None
+            while pending and not (cancel is not None and cancel.cancelled):
+                done, pending = wait(pending, timeout=poll, return_when=FIRST_COMPLETED)
+                for future in done:
+                    shard = SizeTree.from_bytes(future.result())
+                    if metrics is None:
+                        tree.graft(futures[future], shard)
+                    else:
+                        with metrics.phase("build"):
+                            tree.graft(futures[future], shard)
+            for future in pending:
+                tree.flags[futures[future]] |= FLAG_INCOMPLETE
+        finally:
+            executor.shutdown(wait=not pending, cancel_futures=True)
+    LISTING_ERRORS.flush()
+    _mark_incomplete(tree, path, cancel)
+
+    if metrics is None:
+        tree.roll_up()
+    else:
+        with metrics.phase("roll_up"):
+            tree.roll_up()
+    tree.compact()
+    return tree.node(0)
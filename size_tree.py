@@ -0,0 +1,800 @@
+import os
+import sys
+import stat
+import struct
+import logging
+import itertools
+import threading
+import time
+from array import array
+from scan_scheduler import WorkStealingScheduler
+from fs_listing import (list_directory as _list_directory, get_lister, with_timeout, LISTING_TIMED_OUT,
+                        LISTING_CANCELLED, LISTING_ERRORS)
+from inode_set import InodeSet
+
+FLAG_DIR = 1
+FLAG_LINK = 2
+FLAG_DENIED = 4
+# A directory that was not descended into (a symlink, or a mount point with FLAG_MOUNT); it has no children list.
+FLAG_UNFOLLOWED = 8
+# Another hardlink to the same inode was counted first; this node is not rolled up.
+FLAG_HARDLINK = 16
+# A mount point the scan stopped at (see mounts.MountPolicy); always set together with FLAG_UNFOLLOWED.
+FLAG_MOUNT = 32
+# Listing the directory took longer than the scan's per-directory timeout.
+FLAG_TIMED_OUT = 64
+# The scan was cancelled (or hit its deadline) before this directory was listed; set on the root too, so a
+# partial tree can be told apart. Sizes of an incomplete tree are lower bounds.
+FLAG_INCOMPLETE = 128
+
+_NO_NODE = -1
+
+SCAN_MODES = ("threads", "processes")
+# "apparent" is the file length, "allocated" the space taken on disk (st_blocks * 512).
+SIZE_MODES = ("apparent", "allocated")
+
+_MAGIC = b"DUST"
+_FORMAT_VERSION = 2
+# magic, version, little endian, nodes, name offsets, name bytes, symlinks, symlink bytes, root path bytes
+_HEADER = struct.Struct("<4sBB2xQQQQQQ")
+
+
+class SizeTree:
+    """
+    Compact array-backed storage for a scanned tree.
+
+    Each node is a row across parallel typed arrays (parent, apparent and
+    allocated size, inode, flags, name id and first-child / next-sibling
+    links), which costs a few dozen bytes per entry instead of a Python
+    object per file. Names are interned into a
+    single UTF-8 blob, so repeated names such as ``__init__.py`` are stored once.
+    Children are always added after their parent, which lets sizes be rolled up
+    with one reverse pass over the arrays.
+    """
+
+    def __init__(self, root_path):
+        self.root_path = root_path
+        self.parent = array("i")
+        self.size = array("Q")
+        self.allocated = array("Q")
+        self.inode = array("Q")
+        self.flags = array("B")
+        self.name_id = array("I")
+        self.first_child = array("i")
+        self.next_sibling = array("i")
+        self.link_targets = {}
+        self._names_blob = bytearray()
+        self._name_offsets = array("Q", [0])
+        self._name_lookup = {}
+
+    def __len__(self):
+        return len(self.parent)
+
+    def _intern(self, name):
+        name_id = self._name_lookup.get(name)
+        if name_id is None:
+            name_id = len(self._name_offsets) - 1
+            self._names_blob += name.encode("utf-8", "surrogateescape")
+            self._name_offsets.append(len(self._names_blob))
+            self._name_lookup[name] = name_id
+        return name_id
+
+    def add(self, parent, name, size=0, inode=0, flags=0, link_target=None, allocated=0):
+        """Appends a node under ``parent`` (-1 for the root) and returns its index."""
+        index = len(self.parent)
+        self.parent.append(parent)
+        self.size.append(size)
+        self.allocated.append(allocated)
+        self.inode.append(inode)
+        self.flags.append(flags)
+        self.name_id.append(self._intern(name))
+        self.first_child.append(_NO_NODE)
+        if parent == _NO_NODE:
+            self.next_sibling.append(_NO_NODE)
+        else:
+            self.next_sibling.append(self.first_child[parent])
+            self.first_child[parent] = index
+        if link_target is not None:
+            self.link_targets[index] = link_target
+        return index
+
+    def name(self, index):
+        name_id = self.name_id[index]
+        start, end = self._name_offsets[name_id], self._name_offsets[name_id + 1]
+        return self._names_blob[start:end].decode("utf-8", "surrogateescape")
+
+    def interned_names(self):
+        """Returns every distinct name as raw UTF-8 bytes, indexed by name id (see ``name_id``)."""
+        blob, offsets = self._names_blob, self._name_offsets
+        return [bytes(blob[offsets[i]:offsets[i + 1]]) for i in range(len(offsets) - 1)]
+
+    def path(self, index):
+        parts = []
+        while index > 0:
+            parts.append(self.name(index))
+            index = self.parent[index]
+        return os.path.join(self.root_path, *reversed(parts)) if parts else self.root_path
+
+    def child_indices(self, index):
+        child = self.first_child[index]
+        while child != _NO_NODE:
+            yield child
+            child = self.next_sibling[child]
+
+    def roll_up(self):
+        """Adds every node's sizes into its parent, deepest nodes first; repeated hardlinks count once."""
+        size, allocated, parent, flags = self.size, self.allocated, self.parent, self.flags
+        for index in range(len(parent) - 1, 0, -1):
+            if not flags[index] & FLAG_HARDLINK:
+                size[parent[index]] += size[index]
+                allocated[parent[index]] += allocated[index]
+
+    def compact(self):
+        """Drops the name interning table once no more nodes are going to be added."""
+        self._name_lookup = {}
+
+    def nbytes(self):
+        """Approximate memory held by the store, in bytes."""
+        arrays = self._arrays() + (self._name_offsets,)
+        total = sum(a.itemsize * len(a) for a in arrays) + len(self._names_blob)
+        total += sum(len(target) + 64 for target in self.link_targets.values())
+        return total
+
+    def add_delta(self, index, delta, allocated_delta=0):
+        """Adds ``delta`` bytes (and ``allocated_delta`` on disk) to a node and all of its ancestors, in O(depth)."""
+        size, allocated, parent = self.size, self.allocated, self.parent
+        if self.flags[index] & FLAG_HARDLINK:
+            # Not counted in its ancestors, so only the node itself changes.
+            size[index] += delta
+            allocated[index] += allocated_delta
+            return
+        while index != _NO_NODE:
+            size[index] += delta
+            allocated[index] += allocated_delta
+            index = parent[index]
+
+    def find_child(self, index, name):
+        for child in self.child_indices(index):
+            if self.name(child) == name:
+                return child
+        return None
+
+    def remove(self, index):
+        """Unlinks a node (and so its whole subtree) and subtracts its size from its ancestors."""
+        parent = self.parent[index]
+        if parent == _NO_NODE:
+            raise ValueError("The root node cannot be removed.")
+        previous = None
+        for child in self.child_indices(parent):
+            if child == index:
+                break
+            previous = child
+        if previous is None:
+            self.first_child[parent] = self.next_sibling[index]
+        else:
+            self.next_sibling[previous] = self.next_sibling[index]
+        self.next_sibling[index] = _NO_NODE
+        self.parent[index] = _NO_NODE
+        if not self.flags[index] & FLAG_HARDLINK:
+            self.add_delta(parent, -self.size[index], -self.allocated[index])
+
+    def _arrays(self):
+        return (self.parent, self.size, self.allocated, self.inode, self.flags, self.name_id,
+                self.first_child, self.next_sibling)
+
+    def to_bytes(self):
+        """
+        Serializes the store into a compact binary blob.
+
+        The arrays are written as raw machine values, so a tree crosses a
+        process boundary (or goes to disk) without pickling a Python object per node.
+        """
+        link_indices = array("i", self.link_targets)
+        link_blob = "\0".join(self.link_targets.values()).encode("utf-8", "surrogateescape")
+        root_blob = self.root_path.encode("utf-8", "surrogateescape")
+        header = _HEADER.pack(_MAGIC, _FORMAT_VERSION, sys.byteorder == "little", len(self),
+                              len(self._name_offsets), len(self._names_blob), len(link_indices),
+                              len(link_blob), len(root_blob))
+        parts = [header, root_blob]
+        parts.extend(a.tobytes() for a in self._arrays())
+        parts += [self._name_offsets.tobytes(), bytes(self._names_blob), link_indices.tobytes(), link_blob]
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Rebuilds a store written by to_bytes."""
+        view = memoryview(data)
+        (magic, version, little_endian, nodes, offsets, blob_size, links,
+         link_blob_size, root_size) = _HEADER.unpack_from(view)
+        if magic != _MAGIC or version != _FORMAT_VERSION:
+            raise ValueError("Not a size tree snapshot or unsupported format version.")
+        position = _HEADER.size
+
+        def take(size):
+            nonlocal position
+            chunk = view[position:position + size]
+            position += size
+            return chunk
+
+        tree = cls(bytes(take(root_size)).decode("utf-8", "surrogateescape"))
+        swap = bool(little_endian) != (sys.byteorder == "little")
+        for a in tree._arrays():
+            a.frombytes(take(a.itemsize * nodes))
+        tree._name_offsets = array("Q")
+        tree._name_offsets.frombytes(take(8 * offsets))
+        tree._names_blob = bytearray(take(blob_size))
+        link_indices = array("i")
+        link_indices.frombytes(take(4 * links))
+        if swap:
+            for a in tree._arrays() + (tree._name_offsets, link_indices):
+                a.byteswap()
+        targets = bytes(take(link_blob_size)).decode("utf-8", "surrogateescape").split("\0") if links else []
+        tree.link_targets = dict(zip(link_indices, targets))
+        return tree
+
+    def graft(self, index, other):
+        """
+        Attaches every node of ``other`` below ``index``; ``other``'s root becomes ``index``.
+
+        Sizes are copied as they are, so ``other`` should not be rolled up yet
+        when this tree is going to be rolled up afterwards.
+        """
+        base = len(self) - 1
+        name_base = len(self._name_offsets) - 1
+        blob_base = len(self._names_blob)
+
+        def remap(i):
+            return _NO_NODE if i == _NO_NODE else base + i
+
+        self.flags[index] |= other.flags[0] & (FLAG_DENIED | FLAG_TIMED_OUT)
+        self.parent.extend(index if p == 0 else base + p for p in other.parent[1:])
+        self.size.extend(other.size[1:])
+        self.allocated.extend(other.allocated[1:])
+        self.inode.extend(other.inode[1:])
+        self.flags.extend(other.flags[1:])
+        self.name_id.extend(n + name_base for n in other.name_id[1:])
+        self.first_child.extend(remap(c) for c in other.first_child[1:])
+        self.next_sibling.extend(remap(c) for c in other.next_sibling[1:])
+        self._names_blob += other._names_blob
+        self._name_offsets.extend(o + blob_base for o in other._name_offsets[1:])
+        for i, target in other.link_targets.items():
+            self.link_targets[base + i] = target
+
+        # Splice other's top-level children in front of the existing children of ``index``.
+        first = other.first_child[0]
+        if first != _NO_NODE:
+            last = first
+            while other.next_sibling[last] != _NO_NODE:
+                last = other.next_sibling[last]
+            self.next_sibling[base + last] = self.first_child[index]
+            self.first_child[index] = base + first
+
+    def node(self, index=0):
+        return SizeNode(self, index)
+
+
+class SizeNode:
+    """A lightweight view of one node of a SizeTree."""
+
+    __slots__ = ("tree", "index")
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, SizeNode) and self.tree is other.tree and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.tree), self.index))
+
+    @property
+    def name(self):
+        if self.index == 0:
+            return os.path.basename(os.path.normpath(self.tree.root_path)) or self.tree.root_path
+        return self.tree.name(self.index)
+
+    @property
+    def path(self):
+        return self.tree.path(self.index)
+
+    @property
+    def size(self):
+        return self.tree.size[self.index]
+
+    @property
+    def allocated(self):
+        return self.tree.allocated[self.index]
+
+    def size_in(self, size_mode):
+        """Returns the "apparent" or "allocated" size."""
+        return self.allocated if size_mode == "allocated" else self.size
+
+    @property
+    def inode(self):
+        return self.tree.inode[self.index]
+
+    @property
+    def is_dir(self):
+        return bool(self.tree.flags[self.index] & FLAG_DIR)
+
+    @property
+    def is_link(self):
+        return bool(self.tree.flags[self.index] & FLAG_LINK)
+
+    @property
+    def denied(self):
+        return bool(self.tree.flags[self.index] & FLAG_DENIED)
+
+    @property
+    def timed_out(self):
+        return bool(self.tree.flags[self.index] & FLAG_TIMED_OUT)
+
+    @property
+    def incomplete(self):
+        """True for the root of a cancelled scan and for the directories it did not get to."""
+        return bool(self.tree.flags[self.index] & FLAG_INCOMPLETE)
+
+    @property
+    def is_mount(self):
+        """True for a mount point that the scan did not enter."""
+        return bool(self.tree.flags[self.index] & FLAG_MOUNT)
+
+    @property
+    def is_duplicate(self):
+        """True for a hardlink whose inode was already counted through another path."""
+        return bool(self.tree.flags[self.index] & FLAG_HARDLINK)
+
+    @property
+    def link_target(self):
+        return self.tree.link_targets.get(self.index)
+
+    @property
+    def parent(self):
+        parent = self.tree.parent[self.index]
+        return None if parent == _NO_NODE else SizeNode(self.tree, parent)
+
+    @property
+    def children(self):
+        flags = self.tree.flags[self.index]
+        if not flags & FLAG_DIR or flags & FLAG_UNFOLLOWED:
+            return None
+        return [SizeNode(self.tree, child) for child in self.tree.child_indices(self.index)]
+
+    def sorted_children(self):
+        """Returns the children ordered the way the scanner prints them (case-insensitive by name)."""
+        children = self.children
+        if not children:
+            return []
+        return sorted(children, key=lambda node: node.name.lower())
+
+    def __repr__(self):
+        kind = "dir" if self.is_dir else "file"
+        return f"SizeNode({self.path!r}, {kind}, size={self.size}, allocated={self.allocated})"
+
+
+def _is_within(path, root):
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+
+
+class ScanProgress:
+    """
+    Progress of a running scan, counted during the traversal itself.
+
+    Every listed directory adds its entries to ``entries`` and its
+    subdirectories to ``dirs_discovered``. When the entry count of an earlier
+    scan of the same tree is known (``expected_entries``), the fraction done
+    is entries seen / expected; otherwise it is estimated from the share of
+    discovered directories that have been listed. Counters are updated by the
+    scan workers and can be read from any thread.
+    """
+
+    def __init__(self, expected_entries=None):
+        self.expected_entries = expected_entries or None
+        self.entries = 0
+        self.dirs_discovered = 1
+        self.dirs_completed = 0
+        self.finished = False
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._best = 0.0
+
+    def add_listing(self, entries, subdirs):
+        with self._lock:
+            self.entries += entries
+            self.dirs_discovered += subdirs
+            self.dirs_completed += 1
+
+    def finish(self):
+        self.finished = True
+
+    def fraction(self):
+        """Returns the estimated fraction of the scan that is done, between 0 and 1."""
+        if self.finished:
+            return 1.0
+        with self._lock:
+            if self.expected_entries:
+                estimate = self.entries / self.expected_entries
+            else:
+                estimate = self.dirs_completed / self.dirs_discovered
+            # Never move backwards, and never claim to be done before the scan is.
+            self._best = min(max(self._best, estimate), 0.99)
+            return self._best
+
+    def eta(self):
+        """Returns the estimated seconds left, or None while there is too little to go on."""
+        done = self.fraction()
+        if done >= 1.0:
+            return 0.0
+        if done < 0.01:
+            return None
+        elapsed = time.monotonic() - self.started
+        return elapsed * (1 - done) / done
+
+
+class _TreeBuilder:
+    """
+    Adds directory listings to a SizeTree; shared by all workers of one scan.
+
+    ``tree`` may be None for walks that only stream sizes (see walk_sizes) and
+    use the builder for its lister, lock and symlink policy.
+    """
+
+    def __init__(self, tree, root_real, follow_symlinks=False, lister=None, progress=None, prune=None, mounts=None,
+                 metrics=None, cancel=None):
+        self.tree = tree
+        self.root_real = root_real
+        self.follow_symlinks = follow_symlinks
+        self.lister = lister or _list_directory
+        self.progress = progress
+        # prune(name, path) -> True for directories that are left out of the scan entirely.
+        self.prune = prune
+        # The tree arrays and the set of followed symlink targets are shared by all workers.
+        self.lock = threading.Lock()
+        self.visited = {root_real}
+        # (st_dev, st_ino) of every multiply-linked file seen, so each inode is counted once.
+        self.hardlinks = InodeSet()
+        # mounts.MountPolicy deciding which mount points are not entered, or None to cross them all.
+        self.mounts = mounts
+        self.root_device = mounts.device_of(root_real) if mounts is not None else None
+        # scan_metrics.ScanMetrics timing the "build" phase, or None.
+        self.metrics = metrics
+        # cancellation.CancelToken checked before every directory, or None.
+        self.cancel = cancel
+
+    def follows_link(self, entry_path):
+        """Decides whether to descend into a directory symlink; call with ``lock`` held."""
+        if not self.follow_symlinks:
+            return False
+        resolved = os.path.realpath(entry_path)
+        if resolved in self.visited or _is_within(resolved, self.root_real):
+            return False
+        if self.mounts is not None and self.mounts.leaves(resolved, self.root_device):
+            return False
+        self.visited.add(resolved)
+        return True
+
+    def stops_at_mount(self, name, entry_path):
+        """True for a directory (not a symlink) that is a mount point the scan must not enter."""
+        return self.mounts is not None and self.mounts.stops_at(name, entry_path, self.root_device)
+
+    def add_listing(self, index, entries, denied):
+        """Adds one directory's entries under ``index`` and returns the subdirectories to descend into."""
+        tree = self.tree
+        subdirs = []
+        with self.lock:
+            if denied == LISTING_CANCELLED:
+                tree.flags[index] |= FLAG_INCOMPLETE
+            elif denied:
+                tree.flags[index] |= FLAG_TIMED_OUT if denied == LISTING_TIMED_OUT else FLAG_DENIED
+            for name, entry_path, is_dir, is_link, size, inode, link_target, allocated, hardlink in entries:
+                if is_dir and self.prune is not None and self.prune(name, entry_path):
+                    continue
+                flags = (FLAG_DIR if is_dir else 0) | (FLAG_LINK if is_link else 0)
+                if is_dir and is_link and not self.follows_link(entry_path):
+                    flags |= FLAG_UNFOLLOWED
+                elif is_dir and not is_link and self.stops_at_mount(name, entry_path):
+                    flags |= FLAG_MOUNT | FLAG_UNFOLLOWED
+                if hardlink is not None and not self.hardlinks.add(*hardlink):
+                    flags |= FLAG_HARDLINK
+                child = tree.add(index, name, size, inode, flags, link_target, allocated)
+                if is_dir and not flags & FLAG_UNFOLLOWED:
+                    subdirs.append((child, entry_path))
+        if self.progress is not None:
+            self.progress.add_listing(len(entries), len(subdirs))
+        return subdirs
+
+    def scan(self, index, path, executor=None, workers=None):
+        """Scans the directory ``path`` into the subtree rooted at ``index``."""
+        metrics, cancel = self.metrics, self.cancel
+
+        def scan_task(child, dir_path):
+            def task(scheduler):
+                if cancel is not None and cancel.cancelled:
+                    # Queued directories drain without being listed, so the workers stop quickly.
+                    with self.lock:
+                        self.tree.flags[child] |= FLAG_INCOMPLETE
+                    return
+                entries, denied = self.lister(dir_path)
+                if metrics is None:
+                    subdirs = self.add_listing(child, entries, denied)
+                else:
+                    with metrics.phase("build"):
+                        subdirs = self.add_listing(child, entries, denied)
+                for subdir in subdirs:
+                    scheduler.submit(scan_task(*subdir))
+            return task
+
+        scheduler = WorkStealingScheduler(workers)
+        if metrics is not None:
+            metrics.watch(lambda: scheduler.queued, scheduler.workers)
+        scheduler.submit(scan_task(index, path))
+        scheduler.run(executor)
+
+
+def _check_root(path):
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        logging.error(f"Path does not exist: {path}")
+        raise FileNotFoundError(f"Path '{path}' does not exist.") from None
+    if not stat.S_ISDIR(mode):
+        raise NotADirectoryError(f"'{path}' is not a valid directory.")
+
+
+def _new_tree(path):
+    tree = SizeTree(path)
+    tree.add(_NO_NODE, "", inode=os.stat(path).st_ino, flags=FLAG_DIR)
+    return tree
+
+
+def _mark_incomplete(tree, path, cancel):
+    """Flags the root of a cancelled scan's tree; returns True when the scan was cancelled."""
+    if cancel is None or not cancel.cancelled:
+        return False
+    tree.flags[0] |= FLAG_INCOMPLETE
+    logging.warning(f"Scan of {path} stopped ({cancel.reason}); the results are incomplete")
+    return True
+
+
+def _make_lister(cache=None, backend=None, dir_timeout=None, metrics=None, cancel=None, columns=None):
+    """
+    Returns the lister for a scan: the backend's, answered from the cache when
+    one is given, given up on after ``dir_timeout`` seconds per directory (or
+    as soon as ``cancel`` fires) and counted by ``metrics``. With ``columns``
+    (breakdowns.FileColumns) every directory is listed with scandir and its
+    files are captured; the cache and the backend are not used then.
+    """
+    if columns is not None:
+        lister = columns.lister()
+    else:
+        lister = get_lister(backend) if backend is not None else None
+    if cache is not None and columns is None:
+        lister = cache.lister(lister or _list_directory)
+    if dir_timeout is not None:
+        lister = with_timeout(lister or _list_directory, dir_timeout, cancel)
+    if metrics is not None:
+        lister = metrics.lister(lister or _list_directory)
+    return lister
+
+
+def build_size_tree(path, follow_symlinks=False, executor=None, workers=None, mode="threads", cache=None,
+                    progress=None, prune=None, backend=None, mounts=None, dir_timeout=None, metrics=None, cancel=None,
+                    columns=None):
+    """
+    Walks a directory tree exactly once and returns it as an in-memory size tree.
+
+    Every directory is listed a single time by a shared work-stealing
+    scheduler; sizes are then rolled up bottom-up, so each node's ``size`` is
+    the total of everything beneath it.
+
+    Args:
+        path (str): The root directory path.
+        follow_symlinks (bool): Descend into symlinked directories whose target
+            lies outside the scanned tree. Targets inside the tree (including
+            cycles) are always kept as leaf symlink nodes, so nothing is counted twice.
+        executor (Executor or None): Pool to run the scan workers on; a
+            private one is created when omitted.
+        workers (int or None): Number of scan workers (threads, or processes
+            in "processes" mode).
+        mode (str): "threads" scans with one shared thread pool; "processes"
+            splits the tree into shards scanned by a process pool (see sharded_scan).
+        cache (ScanCache or None): Persistent listing cache; directories whose
+            mtime and inode are unchanged are not listed again. Only used in
+            "threads" mode.
+        progress (ScanProgress or None): Updated as directories are listed
+            ("threads" mode), and marked finished when the tree is ready.
+        prune (callable or None): ``prune(name, path)`` returns True for
+            directories to leave out without listing them, e.g.
+            ScanFilter.prunes.
+        backend (str or None): Directory listing backend, "scandir" (the
+            default) or "statx"; see fs_listing.get_lister.
+        mounts (MountPolicy or None): Mount points not to enter, e.g.
+            MountPolicy(one_filesystem=True) to stay on the root's device.
+            They are kept as leaf nodes flagged FLAG_MOUNT.
+        dir_timeout (float or None): Seconds after which the listing of a
+            single directory is given up on; the directory is flagged
+            FLAG_TIMED_OUT and the scan goes on without it.
+        metrics (ScanMetrics or None): Counts listings and times the scan's
+            phases; finished when the tree is ready. In "processes" mode only
+            the listings made by this process are counted.
+        cancel (CancelToken or None): Stops the scan early when cancelled
+            or past its deadline. The tree built so far is returned with
+            the root and every directory not listed flagged
+            FLAG_INCOMPLETE; its sizes are lower bounds, and the cache does
+            not record its totals.
+        columns (FileColumns or None): Also captures the extension, times
+            and owner of every file for breakdowns, in the same pass. Every
+            directory is then listed afresh with scandir, without the cache.
+            Only in "threads" mode.
+
+    Returns:
+        SizeNode: The root node of the tree.
+    """
+    if mode not in SCAN_MODES:
+        raise ValueError(f"Unknown scan mode '{mode}'. Expected one of: {', '.join(SCAN_MODES)}.")
+    if columns is not None:
+        if mode == "processes":
+            raise ValueError("Breakdown columns can only be captured in threads mode.")
+        # Cached listings carry no times or owners, and a scan that skipped the cache must not prune it.
+        cache = None
+    if mode == "processes":
+        from sharded_scan import build_sharded_size_tree
+        if cache is not None:
+            logging.info("The scan cache is not used in processes mode.")
+        root = build_sharded_size_tree(path, follow_symlinks=follow_symlinks, processes=workers, prune=prune,
+                                       backend=backend, mounts=mounts, dir_timeout=dir_timeout, metrics=metrics,
+                                       cancel=cancel)
+        if progress is not None:
+            progress.finish()
+        if metrics is not None:
+            metrics.finish()
+        return root
+
+    _check_root(path)
+    tree = _new_tree(path)
+    lister = _make_lister(cache, backend, dir_timeout, metrics, cancel, columns)
+    builder = _TreeBuilder(tree, os.path.realpath(path), follow_symlinks, lister, progress, prune, mounts, metrics,
+                           cancel)
+    builder.scan(0, path, executor, workers)
+    LISTING_ERRORS.flush()
+    incomplete = _mark_incomplete(tree, path, cancel)
+    if progress is not None:
+        progress.finish()
+    if metrics is None:
+        tree.roll_up()
+    else:
+        with metrics.phase("roll_up"):
+            tree.roll_up()
+        metrics.finish()
+    tree.compact()
+    root = tree.node(0)
+    if cache is not None:
+        # The listings of a partial scan are still good, but its totals are not, and the rows of the
+        # directories it did not reach must not be dropped.
+        cache.finish_scan(None if incomplete else root)
+    return root
+
+
+def walk_sizes(path, on_entry, follow_symlinks=False, executor=None, workers=None, lister=None, prune=None,
+               mounts=None, metrics=None, cancel=None):
+    """
+    Walks a directory tree once without keeping it in memory.
+
+    ``on_entry(path, size, allocated, is_dir, is_link)`` is called for every
+    file as soon as its directory is listed, and for every directory (the
+    root last) once its whole subtree is done, with the directory's recursive
+    apparent and allocated sizes. A file whose inode was already reported
+    through another hardlink is skipped. Calls are serialized, so the callback
+    needs no locking of its own. Only directories still being scanned are
+    held in memory.
+
+    Args:
+        path (str): The root directory path.
+        on_entry (callable): Receives every entry, see above.
+        follow_symlinks (bool): See build_size_tree.
+        executor (Executor or None): Pool to run the scan workers on.
+        workers (int or None): Number of scan workers.
+        lister (callable or None): Directory lister, e.g. ScanCache.lister().
+        prune (callable or None): See build_size_tree.
+        mounts (MountPolicy or None): See build_size_tree; mount points that
+            are not entered are not reported.
+        metrics (ScanMetrics or None): Times the "build" phase (including
+            the callbacks) and samples the work queue. Listings are only
+            counted when ``lister`` is wrapped with ScanMetrics.lister.
+        cancel (CancelToken or None): Once it is cancelled, directories not
+            listed yet are reported as empty, so the walk ends quickly with
+            partial sizes.
+
+    Returns:
+        bool: True when the walk was complete, False when it was cancelled.
+    """
+    _check_root(path)
+    builder = _TreeBuilder(None, os.path.realpath(path), follow_symlinks, lister, prune=prune, mounts=mounts)
+    lock = builder.lock
+    # dir id -> [subdirectories still being scanned, bytes so far, path, parent id, is_link, allocated so far]
+    open_dirs = {0: [0, 0, path, None, False, 0]}
+    next_id = itertools.count(1)
+
+    def complete(dir_id):
+        # A finished directory may finish its parent too; called with ``lock`` held.
+        while True:
+            _, size, dir_path, parent, is_link, allocated = open_dirs.pop(dir_id)
+            on_entry(dir_path, size, allocated, True, is_link)
+            if parent is None:
+                return
+            state = open_dirs[parent]
+            state[0] -= 1
+            state[1] += size
+            state[5] += allocated
+            if state[0]:
+                return
+            dir_id = parent
+
+    def scan_task(dir_id, dir_path):
+        def task(scheduler):
+            if cancel is not None and cancel.cancelled:
+                entries = []
+            else:
+                entries, _ = builder.lister(dir_path)
+            subdirs = []
+            started = time.perf_counter() if metrics is not None else 0
+            with lock:
+                files_size = files_allocated = 0
+                for name, entry_path, is_dir, is_link, size, _, _, allocated, hardlink in entries:
+                    if is_dir and prune is not None and prune(name, entry_path):
+                        continue
+                    if is_dir and not is_link and builder.stops_at_mount(name, entry_path):
+                        continue
+                    if is_dir and (not is_link or builder.follows_link(entry_path)):
+                        subdir_id = next(next_id)
+                        open_dirs[subdir_id] = [0, 0, entry_path, dir_id, is_link, 0]
+                        subdirs.append((subdir_id, entry_path))
+                        continue
+                    if hardlink is not None and not builder.hardlinks.add(*hardlink):
+                        continue
+                    files_size += size
+                    files_allocated += allocated
+                    on_entry(entry_path, size, allocated, is_dir, is_link)
+                state = open_dirs[dir_id]
+                state[0] = len(subdirs)
+                state[1] += files_size
+                state[5] += files_allocated
+                if not subdirs:
+                    complete(dir_id)
+            if metrics is not None:
+                metrics.add_time("build", time.perf_counter() - started)
+            for subdir in subdirs:
+                scheduler.submit(scan_task(*subdir))
+        return task
+
+    scheduler = WorkStealingScheduler(workers)
+    if metrics is not None:
+        metrics.watch(lambda: scheduler.queued, scheduler.workers)
+    scheduler.submit(scan_task(0, path))
+    scheduler.run(executor)
+    LISTING_ERRORS.flush()
+    if metrics is not None:
+        metrics.finish()
+    if cancel is not None and cancel.cancelled:
+        logging.warning(f"Walk of {path} stopped ({cancel.reason}); the results are incomplete")
+        return False
+    return True
+
+
+def iter_nodes(root, prune=None):
+    """
+    Yields every node of the tree in depth-first order, starting with the root.
+
+    Directories for which ``prune(name, path)`` is true are skipped with
+    everything beneath them.
+    """
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        yield node
+        if node.children:
+            children = node.sorted_children()
+            if prune is not None:
+                children = [child for child in children if not (child.is_dir and prune(child.name, child.path))]
+            stack.extend(reversed(children))
@@ -0,0 +1,217 @@
+import os
+import heapq
+import logging
+from array import array
+from collections import namedtuple
+from file_size import format_file_size
+from size_tree import SizeTree, SizeNode, FLAG_DIR, SIZE_MODES
+
+DIFF_KINDS = ("files", "dirs", "both")
+
+
+def save_snapshot(root, file_path):
+    """
+    Saves a scanned tree to ``file_path`` in the SizeTree.to_bytes format.
+
+    The file is written next to its final name and then renamed, so a
+    crash never leaves a half-written snapshot behind.
+
+    Args:
+        root (SizeNode or SizeTree): The tree, rolled up, as returned by build_size_tree.
+        file_path (str): Where to write the snapshot.
+    """
+    tree = root.tree if isinstance(root, SizeNode) else root
+    temporary = f"{file_path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(tree.to_bytes())
+    os.replace(temporary, file_path)
+    logging.info(f"Saved a snapshot of {tree.root_path} ({len(tree)} entries) to {file_path}")
+
+
+def load_snapshot(file_path):
+    """Loads a snapshot written by save_snapshot and returns its root SizeNode."""
+    with open(file_path, "rb") as f:
+        return SizeTree.from_bytes(f.read()).node(0)
+
+
+def _tree_of(snapshot):
+    if isinstance(snapshot, SizeNode):
+        return snapshot.tree
+    if isinstance(snapshot, SizeTree):
+        return snapshot
+    return load_snapshot(snapshot).tree
+
+
+class Change(namedtuple("Change", ["path", "is_dir", "old_size", "new_size"])):
+    """One entry whose size differs between two snapshots; a size of 0 on one side means it did not exist."""
+
+    __slots__ = ()
+
+    @property
+    def delta(self):
+        return self.new_size - self.old_size
+
+    @property
+    def ratio(self):
+        """Growth relative to the old size (1.0 is doubled), or None for a new entry."""
+        return self.delta / self.old_size if self.old_size else None
+
+
+SnapshotDiff = namedtuple("SnapshotDiff", ["old_total", "new_total", "added", "removed", "changed",
+                                           "largest", "fastest"])
+
+
+def _name_ranks(old_tree, new_tree):
+    """
+    Ranks the interned names of both trees in one byte-wise order.
+
+    There are far fewer distinct names than nodes, so sorting them once lets
+    every directory's children be sorted and compared as plain integers.
+    """
+    old_names, new_names = old_tree.interned_names(), new_tree.interned_names()
+    rank = {name: i for i, name in enumerate(sorted(set(old_names).union(new_names)))}
+    return array("I", [rank[name] for name in old_names]), array("I", [rank[name] for name in new_names])
+
+
+def _sorted_children(tree, ranks, index):
+    first_child, next_sibling, name_id = tree.first_child, tree.next_sibling, tree.name_id
+    children = []
+    child = first_child[index]
+    while child >= 0:
+        children.append((ranks[name_id[child]], child))
+        child = next_sibling[child]
+    children.sort()
+    return children
+
+
+def diff_snapshots(old, new, n=10, kind="both", size_mode="apparent", min_size=0):
+    """
+    Compares two scans of the same directory and reports what grew.
+
+    Both trees are walked once, side by side: the children of every
+    directory are sorted by name and merge-joined, which is a merge join of
+    the two sorted path tables without ever building them. Names are ranked
+    once up front, so the join compares integers; no per-path lookups or
+    full path strings are needed, except for the N entries that are
+    reported.
+
+    Args:
+        old (SizeNode, SizeTree or str): The earlier scan, or the path of a
+            snapshot saved with save_snapshot.
+        new (SizeNode, SizeTree or str): The later scan.
+        n (int): How many entries each ranking keeps.
+        kind (str): Rank "files", "dirs" or "both".
+        size_mode (str): Compare "apparent" or "allocated" sizes.
+        min_size (int): Entries smaller than this in the old scan are left
+            out of the relative ranking, so a file going from 1 to 100 bytes
+            does not top it.
+
+    Returns:
+        SnapshotDiff: Totals of both scans, the number of entries added,
+        removed and changed in size, and two lists of Change records:
+        ``largest`` by absolute growth and ``fastest`` by relative growth,
+        largest first. The root itself is not ranked. Paths are those of
+        the new scan (the old one for removed entries).
+    """
+    if kind not in DIFF_KINDS:
+        raise ValueError(f"Unknown item kind '{kind}'. Expected one of: {', '.join(DIFF_KINDS)}.")
+    if size_mode not in SIZE_MODES:
+        raise ValueError(f"Unknown size mode '{size_mode}'. Expected one of: {', '.join(SIZE_MODES)}.")
+    old_tree, new_tree = _tree_of(old), _tree_of(new)
+    by_allocated = size_mode == "allocated"
+    old_sizes = old_tree.allocated if by_allocated else old_tree.size
+    new_sizes = new_tree.allocated if by_allocated else new_tree.size
+    old_flags, new_flags = old_tree.flags, new_tree.flags
+    want_files, want_dirs = kind != "dirs", kind != "files"
+    old_ranks, new_ranks = _name_ranks(old_tree, new_tree)
+
+    largest, fastest = [], []
+    added = removed = changed = 0
+    sequence = 0
+    # Pairs of (old index, new index); -1 where the entry exists on one side only.
+    stack = [(0, 0)]
+    while stack:
+        old_index, new_index = stack.pop()
+        is_dir = bool((old_flags[old_index] if new_index < 0 else new_flags[new_index]) & FLAG_DIR)
+        if old_index >= 0 and new_index >= 0 and is_dir != bool(old_flags[old_index] & FLAG_DIR):
+            # A file replaced by a directory (or the other way round) is a removal and an addition.
+            stack.append((old_index, -1))
+            stack.append((-1, new_index))
+            continue
+        old_size = old_sizes[old_index] if old_index >= 0 else 0
+        new_size = new_sizes[new_index] if new_index >= 0 else 0
+
+        if old_index != 0:
+            if old_index < 0:
+                added += 1
+            elif new_index < 0:
+                removed += 1
+            elif old_size != new_size:
+                changed += 1
+            if n > 0 and new_size > old_size and (want_dirs if is_dir else want_files):
+                sequence += 1
+                # On ties the entry met first (in path order) wins.
+                item = (new_size - old_size, -sequence, old_index, new_index, is_dir, old_size, new_size)
+                if len(largest) < n:
+                    heapq.heappush(largest, item)
+                elif item > largest[0]:
+                    heapq.heapreplace(largest, item)
+                if old_index >= 0 and old_size and old_size >= min_size:
+                    item = ((new_size - old_size) / old_size,) + item
+                    if len(fastest) < n:
+                        heapq.heappush(fastest, item)
+                    elif item > fastest[0]:
+                        heapq.heapreplace(fastest, item)
+
+        if not is_dir:
+            continue
+        old_children = _sorted_children(old_tree, old_ranks, old_index) if old_index >= 0 else []
+        new_children = _sorted_children(new_tree, new_ranks, new_index) if new_index >= 0 else []
+        pairs = []
+        i = j = 0
+        while i < len(old_children) and j < len(new_children):
+            old_name, old_child = old_children[i]
+            new_name, new_child = new_children[j]
+            if old_name == new_name:
+                pairs.append((old_child, new_child))
+                i += 1
+                j += 1
+            elif old_name < new_name:
+                pairs.append((old_child, -1))
+                i += 1
+            else:
+                pairs.append((-1, new_child))
+                j += 1
+        pairs.extend((old_child, -1) for _, old_child in old_children[i:])
+        pairs.extend((-1, new_child) for _, new_child in new_children[j:])
+        stack.extend(reversed(pairs))
+
+    def change(item):
+        old_index, new_index, is_dir, old_size, new_size = item[-5:]
+        path = new_tree.path(new_index) if new_index >= 0 else old_tree.path(old_index)
+        return Change(path, is_dir, old_size, new_size)
+
+    return SnapshotDiff(old_sizes[0], new_sizes[0], added, removed, changed,
+                        [change(item) for item in sorted(largest, reverse=True)],
+                        [change(item) for item in sorted(fastest, reverse=True)])
+
+
+def format_diff(diff):
+    """Renders a SnapshotDiff as the text report printed by the CLI and shown by the GUI."""
+    def signed(size):
+        return ("+" if size >= 0 else "-") + format_file_size(abs(size))
+
+    lines = [f"Total: {format_file_size(diff.old_total)} -> {format_file_size(diff.new_total)} "
+             f"({signed(diff.new_total - diff.old_total)})",
+             f"{diff.added} added, {diff.removed} removed, {diff.changed} changed in size"]
+    if diff.largest:
+        lines.append("")
+        lines.append("Largest growth:")
+        lines.extend(f"{i}. {c.path} {signed(c.delta)} ({format_file_size(c.old_size)} -> "
+                     f"{format_file_size(c.new_size)})" for i, c in enumerate(diff.largest, 1))
+    if diff.fastest:
+        lines.append("")
+        lines.append("Fastest growth:")
+        lines.extend(f"{i}. {c.path} +{c.ratio:.0%} ({format_file_size(c.old_size)} -> "
+                     f"{format_file_size(c.new_size)})" for i, c in enumerate(diff.fastest, 1))
+    return "\n".join(lines)
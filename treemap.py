@@ -0,0 +1,135 @@
+import heapq
+from collections import namedtuple
+from size_tree import FLAG_DIR, FLAG_HARDLINK, FLAG_UNFOLLOWED, SIZE_MODES
+
+# Coordinates are in pixels with y growing downwards. ``index`` is the node in the size tree, or -1 for an
+# "other" bucket, whose ``other`` is the number of items merged into it. ``parent`` is the position of the
+# enclosing rectangle in the layout list, -1 at the top level.
+TreemapRect = namedtuple("TreemapRect", ["x", "y", "width", "height", "depth", "index", "label", "size", "is_dir",
+                                         "other", "parent"])
+
+# Items smaller than this many square pixels are merged into their directory's "other" bucket.
+MIN_AREA = 64
+# Directories narrower or lower than this are drawn as one box, without their contents.
+MIN_NESTED_SIDE = 12
+PADDING = 2
+HEADER = 14
+
+
+def _worst(largest, smallest, total, side):
+    # Worst aspect ratio of a row of areas with this largest and smallest item, laid along ``side``.
+    side2 = side * side
+    total2 = total * total
+    return max(side2 * largest / total2, total2 / (side2 * smallest))
+
+
+def squarify(sizes, x, y, width, height):
+    """
+    Lays out ``sizes`` (positive, largest first) in a rectangle with the
+    squarified algorithm of Bruls, Huizing and van Wijk: items fill rows
+    along the shorter side for as long as that keeps the worst aspect
+    ratio of the row from getting worse.
+
+    Returns:
+        list: (x, y, width, height) per size, in the same order.
+    """
+    total = sum(sizes)
+    if total <= 0 or width <= 0 or height <= 0:
+        return [(x, y, 0.0, 0.0) for _ in sizes]
+    scale = width * height / total
+    areas = [size * scale for size in sizes]
+    rects = []
+    start = 0
+    while start < len(areas):
+        side = min(width, height)
+        end = start + 1
+        row = areas[start]
+        worst = _worst(row, row, row, side)
+        while end < len(areas):
+            candidate = _worst(areas[start], areas[end], row + areas[end], side)
+            if candidate > worst:
+                break
+            row += areas[end]
+            worst = candidate
+            end += 1
+        thickness = row / side
+        offset = 0.0
+        if width >= height:
+            # A column along the left edge.
+            for area in areas[start:end]:
+                rects.append((x, y + offset, thickness, area / thickness))
+                offset += area / thickness
+            x += thickness
+            width = max(0.0, width - thickness)
+        else:
+            # A row along the top edge.
+            for area in areas[start:end]:
+                rects.append((x + offset, y, area / thickness, thickness))
+                offset += area / thickness
+            y += thickness
+            height = max(0.0, height - thickness)
+        start = end
+    return rects
+
+
+def layout_treemap(root, width, height, size_mode="apparent", max_depth=None, min_area=MIN_AREA):
+    """
+    Computes a nested squarified treemap of a size tree.
+
+    Only the sizes already in the tree are used; nothing is read from disk.
+    The layout is culled to what can be seen: items below ``min_area``
+    square pixels are merged into one "other" rectangle per directory
+    (only the largest items of a huge directory are even sorted), and
+    directories too small to show their contents are not descended into.
+    So the work depends on the number of pixels, not of nodes.
+
+    Args:
+        root (SizeNode): The directory to lay out.
+        width (float): Width of the treemap in pixels.
+        height (float): Height of the treemap in pixels.
+        size_mode (str): Size rectangles by "apparent" or "allocated" size.
+        max_depth (int or None): Levels below ``root`` to lay out; None for
+            as deep as the rectangles stay visible.
+        min_area (float): Smallest rectangle shown on its own, in square pixels.
+
+    Returns:
+        list: TreemapRect's, every directory before its contents.
+    """
+    if size_mode not in SIZE_MODES:
+        raise ValueError(f"Unknown size mode '{size_mode}'. Expected one of: {', '.join(SIZE_MODES)}.")
+    tree = root.tree
+    sizes = tree.allocated if size_mode == "allocated" else tree.size
+    flags = tree.flags
+    rects = []
+    # (node index, parent rectangle, depth, x, y, width, height) of directories whose contents are laid out next.
+    pending = [(root.index, -1, 0, 0.0, 0.0, float(width), float(height))]
+    while pending:
+        index, parent, depth, x, y, w, h = pending.pop()
+        # Repeated hardlinks are not rolled up into their directory, so they get no area either; symlinks are
+        # counted with their own (lstat) size, so they keep theirs and the children add up to the directory.
+        children = [(sizes[child], child) for child in tree.child_indices(index)
+                    if sizes[child] > 0 and not flags[child] & FLAG_HARDLINK]
+        total = sum(size for size, _ in children)
+        if not total or w <= 0 or h <= 0:
+            continue
+        # No more than area / min_area items can reach min_area.
+        visible = int(w * h / min_area)
+        largest = heapq.nlargest(visible, children) if visible < len(children) else sorted(children, reverse=True)
+        cutoff = min_area * total / (w * h)
+        shown = [(size, child) for size, child in largest if size >= cutoff]
+        other = total - sum(size for size, _ in shown)
+        boxes = squarify([size for size, _ in shown] + ([other] if other > 0 else []), x, y, w, h)
+        for (size, child), (bx, by, bw, bh) in zip(shown, boxes):
+            is_dir = bool(flags[child] & FLAG_DIR) and not flags[child] & FLAG_UNFOLLOWED
+            position = len(rects)
+            rects.append(TreemapRect(bx, by, bw, bh, depth, child, tree.name(child), size, is_dir, 0, parent))
+            if is_dir and (max_depth is None or depth + 1 < max_depth):
+                inner_w, inner_h = bw - 2 * PADDING, bh - HEADER - PADDING
+                if inner_w >= MIN_NESTED_SIDE and inner_h >= MIN_NESTED_SIDE:
+                    pending.append((child, position, depth + 1, bx + PADDING, by + HEADER, inner_w, inner_h))
+        if other > 0:
+            bx, by, bw, bh = boxes[-1]
+            count = len(children) - len(shown)
+            rects.append(TreemapRect(bx, by, bw, bh, depth, -1, f"{count} other items", other, False, count,
+                                     parent))
+    return rects
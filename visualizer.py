@@ -1,8 +1,13 @@
 import os
-import logging
+import contextlib
+from collections import OrderedDict
 import matplotlib.pyplot as plt
 from matplotlib.patches import Patch
-from file_size import calculate_size, format_file_size
+from file_size import format_file_size
+from size_tree import build_size_tree, SIZE_MODES
+from scan_filters import compile_filter, pruner
+from sampling import sample_sizes, format_estimate
+from treemap import layout_treemap, PADDING
 from tkinter import Toplevel
 from tkinter import Label, Canvas, BOTH
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
@@ -11,8 +16,6 @@ from tkinter import Toplevel, Label, Frame, BOTH, LEFT
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
 from tkinter import Toplevel, Frame, Label, BOTH, LEFT
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
@@ -21,6 +24,14 @@ from tkinter import Toplevel, Frame, Label, BOTH, LEFT
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
 from matplotlib.colors import to_hex  # Преобразуем цвета в HEX
+from matplotlib.patches import Rectangle
+from matplotlib.collections import PatchCollection
+from tkinter import Button
+
+# Обозреватель держит отрисованными диаграммы стольких папок; самые давние удаляются
+EXPLORER_CACHE_SIZE = 16
+# Больше секторов кольцо не различает; остальное идёт в «N other items»
+MAX_SLICES = 20
 
 
 def plot_disk_usage(labels, sizes, formatted_sizes):
@@ -73,35 +84,392 @@ def plot_disk_usage(labels, sizes, formatted_sizes):
     info_label.pack(side="top", pady=10)
 
 
+def usage_slices(node, size_mode="apparent", filters=None, max_slices=MAX_SLICES):
+    """
+    The slices of a usage chart of ``node``'s children, read from the size tree.
+
+    Symlinks, repeated hardlinks and children that do not match ``filters``
+    are left out. Beyond ``max_slices`` the smallest children are merged
+    into one "N other items" slice.
+
+    Returns:
+        tuple: (labels, sizes, formatted_sizes, nodes), largest first;
+        ``nodes`` holds the SizeNode of every slice (None for "other").
+    """
+    children = []
+    for child in node.children or ():
+        if child.is_link or child.is_duplicate or (filters is not None and not filters.matches(child.path, child.size)):
+            continue
+        if child.size_in(size_mode) > 0:
+            children.append(child)
+    children.sort(key=lambda child: child.size_in(size_mode), reverse=True)
+    shown, rest = children[:max_slices], children[max_slices:]
+    labels = [child.name for child in shown]
+    sizes = [child.size_in(size_mode) for child in shown]
+    formatted_sizes = [f"{format_file_size(child.size)} ({format_file_size(child.allocated)} on disk)"
+                       for child in shown]
+    nodes = list(shown)
+    if rest:
+        labels.append(f"{len(rest)} other items")
+        sizes.append(sum(child.size_in(size_mode) for child in rest))
+        size, allocated = sum(child.size for child in rest), sum(child.allocated for child in rest)
+        formatted_sizes.append(f"{format_file_size(size)} ({format_file_size(allocated)} on disk)")
+        nodes.append(None)
+    return labels, sizes, formatted_sizes, nodes
+
+
+class LRUCache:
+    """
+    A small least-recently-used cache; ``on_evict(value)`` is called for
+    every value pushed out, e.g. to destroy a widget.
+    """
+
+    def __init__(self, maxsize, on_evict=None):
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def keys(self):
+        return list(self._items)
+
+    def get(self, key):
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            _, evicted = self._items.popitem(last=False)
+            if self.on_evict is not None:
+                self.on_evict(evicted)
+
+    def discard(self, key):
+        """Removes ``key`` if it is cached, handing its value to ``on_evict``."""
+        if key in self._items:
+            evicted = self._items.pop(key)
+            if self.on_evict is not None:
+                self.on_evict(evicted)
+
+    def clear(self):
+        while self._items:
+            _, evicted = self._items.popitem(last=False)
+            if self.on_evict is not None:
+                self.on_evict(evicted)
+
+
+class DiskUsageExplorer:
+    """
+    A usage chart window with click-to-drill-down and breadcrumbs.
+
+    Clicking a directory's slice (or its legend entry) shows that directory,
+    the breadcrumb buttons go back up. Everything comes from the size tree
+    in memory, nothing is scanned again. The rendered chart of every visited
+    directory is kept (canvas and legend together) in an LRU cache of
+    ``cache_size`` entries, so going back and forth only swaps widgets.
+    When the tree changes (e.g. a watcher updated it), invalidate() drops
+    the charts of the changed directories.
+
+    Args:
+        root (SizeNode): The directory to start at; breadcrumbs stop here.
+        size_mode (str): Size slices by "apparent" or "allocated" size.
+        filters (ScanFilter or None): Children to leave out of the charts.
+        lock (lock or None): Held while reading the tree, e.g. the watcher's.
+        cache_size (int): How many rendered charts to keep.
+    """
+
+    def __init__(self, root, size_mode="apparent", filters=None, lock=None, cache_size=EXPLORER_CACHE_SIZE):
+        if size_mode not in SIZE_MODES:
+            raise ValueError(f"Unknown size mode '{size_mode}'. Expected one of: {', '.join(SIZE_MODES)}.")
+        self.root = root
+        self.size_mode = size_mode
+        self.filters = compile_filter(filters)
+        self.lock = lock
+        self.window = Toplevel()
+        self.window.title(f"Disk Usage: {root.path}")
+        self.window.geometry("900x650")
+        self.breadcrumbs = Frame(self.window)
+        self.breadcrumbs.pack(side="top", fill="x", padx=5, pady=5)
+        self.body = Frame(self.window)
+        self.body.pack(side="top", fill=BOTH, expand=True)
+        self.views = LRUCache(cache_size, on_evict=lambda view: view.destroy())
+        self.current = None
+        self._shown = None
+        self.show(root)
+
+    def _reading(self):
+        return self.lock if self.lock is not None else contextlib.nullcontext()
+
+    def show(self, node):
+        """Shows the chart of ``node``, from the cache when it was rendered before."""
+        with self._reading():
+            key = node.index
+            view = self.views.get(key)
+            if view is None:
+                view = self._render(node)
+            crumbs = []
+            step = node
+            while step is not None and step != self.root:
+                crumbs.append(step)
+                step = step.parent
+            crumbs.append(self.root)
+        if self._shown is not None:
+            self._shown.pack_forget()
+        self.views.put(key, view)
+        view.pack(fill=BOTH, expand=True)
+        self._shown = view
+        self.current = node
+        self._show_breadcrumbs(reversed(crumbs))
+
+    def invalidate(self, indices):
+        """
+        Drops the cached charts of the directories in ``indices`` (node
+        indices whose size or contents changed) and redraws the current one
+        if it is among them; a current directory that was removed from the
+        tree gives way to the root.
+        """
+        stale = [key for key in self.views.keys() if key in indices]
+        if not stale or not self.window.winfo_exists():
+            return
+        node = self.current
+        if node.index in stale:
+            # Показанный вид уничтожается вместе с записью кэша
+            self._shown = None
+        for key in stale:
+            self.views.discard(key)
+        with self._reading():
+            step = node
+            while step is not None and step != self.root:
+                step = step.parent
+        if step is None:
+            node = self.root
+        if self._shown is None or node != self.current:
+            self.show(node)
+
+    def _show_breadcrumbs(self, crumbs):
+        for widget in self.breadcrumbs.winfo_children():
+            widget.destroy()
+        for i, crumb in enumerate(crumbs):
+            if i:
+                Label(self.breadcrumbs, text="›").pack(side=LEFT)
+            text = crumb.path if crumb == self.root else crumb.name
+            Button(self.breadcrumbs, text=text, relief="flat",
+                   command=lambda crumb=crumb: self.show(crumb)).pack(side=LEFT)
+
+    def _drill(self, node):
+        if node is not None and node.is_dir and not node.is_link:
+            self.show(node)
+
+    def _render(self, node):
+        # Вид папки: кольцевая диаграмма и легенда в одном Frame, который кэшируется целиком
+        view = Frame(self.body)
+        labels, sizes, formatted_sizes, nodes = usage_slices(node, self.size_mode, self.filters)
+        fig = Figure(figsize=(6, 6))
+        ax = fig.add_subplot(111)
+        canvas = FigureCanvasTkAgg(fig, master=view)
+        canvas.get_tk_widget().pack(side=LEFT, fill=BOTH, expand=True)
+        legend_frame = Frame(view)
+        legend_frame.pack(side=LEFT, fill=BOTH, padx=10)
+        if not sizes:
+            ax.text(0.5, 0.5, "Empty", ha="center", va="center")
+            ax.axis("off")
+            canvas.draw()
+            return view
+
+        wedges, _, _ = ax.pie(sizes, autopct='%1.1f%%', startangle=90, wedgeprops=dict(width=0.3),
+                              textprops=dict(color="w"))
+        ax.axis('equal')
+        targets = {}
+        for wedge, label, size, child in zip(wedges, labels, formatted_sizes, nodes):
+            drillable = child is not None and child.is_dir
+            if drillable:
+                wedge.set_picker(True)
+                targets[wedge] = child
+            legend_label = Label(legend_frame, text=f"{label}{'/' if drillable else ''}: {size}",
+                                 bg=to_hex(wedge.get_facecolor()[:3]), fg="black", anchor="w", padx=5,
+                                 cursor="hand2" if drillable else "")
+            legend_label.pack(fill=BOTH, pady=2)
+            if drillable:
+                legend_label.bind("<Button-1>", lambda event, child=child: self._drill(child))
+        canvas.mpl_connect("pick_event", lambda event: self._drill(targets.get(event.artist)))
+        canvas.draw()
+        return view
+
+
+def plot_breakdowns(report):
+    """
+    Shows a BreakdownReport (see breakdowns.breakdown) next to the usage chart:
+    bytes by file type, by owner and by last access, as bar charts.
+    """
+    window = Toplevel()
+    window.title("Disk Usage Breakdowns")
+    window.geometry("1200x500")
+
+    # Три диаграммы рядом: типы файлов, владельцы, давность последнего доступа
+    fig = Figure(figsize=(12, 5))
+    charts = (
+        ("By type", [row._replace(label=row.label or "(none)") for row in report.extensions]),
+        ("By owner", report.owners),
+        ("By last access", report.accessed),
+    )
+    for i, (title, rows) in enumerate(charts, 1):
+        ax = fig.add_subplot(1, len(charts), i)
+        # Самая большая строка сверху
+        ax.barh([row.label for row in rows][::-1], [row.bytes for row in rows][::-1])
+        ax.set_title(title)
+        ax.xaxis.set_major_formatter(lambda value, _: format_file_size(int(value)))
+        ax.tick_params(axis="x", labelrotation=30)
+    fig.tight_layout()
+
+    canvas = FigureCanvasTkAgg(fig, master=window)
+    canvas.get_tk_widget().pack(side="top", fill=BOTH, expand=True)
+
+    info_label = Label(
+        window,
+        text=f"{report.stale.files:,} files ({format_file_size(report.stale.bytes)}) {report.stale.label}",
+        font=("Arial", 10),
+        anchor="w"
+    )
+    info_label.pack(side="top", pady=10)
+
+
+def treemap_colors(rects, cmap_name="tab20"):
+    """
+    Colors for the rectangles of a treemap layout: one hue per top-level
+    entry, lighter with every level of nesting; "other" buckets are grey.
+    """
+    cmap = plt.get_cmap(cmap_name)
+    top = []
+    colors = []
+    hues = 0
+    for rect in rects:
+        if rect.parent < 0:
+            top.append(hues)
+            hues += 1
+        else:
+            top.append(top[rect.parent])
+        if rect.index < 0:
+            colors.append((0.8, 0.8, 0.8))
+            continue
+        r, g, b, _ = cmap(top[-1] % cmap.N)
+        light = min(0.6, 0.15 * rect.depth)
+        colors.append((r + (1 - r) * light, g + (1 - g) * light, b + (1 - b) * light))
+    return colors
+
 
+def plot_treemap(rects, width, height, title="Disk Usage Treemap"):
+    """
+    Draws a layout from treemap.layout_treemap in a new window.
 
-def visualize_disk_usage(path, filters=None):
+    All rectangles go into one PatchCollection, and only those large
+    enough for their text are labelled, so big layouts stay fast to draw.
+    """
+    window = Toplevel()
+    window.title(title)
+
+    fig = Figure(figsize=(width / 100, height / 100), dpi=100)
+    ax = fig.add_axes((0, 0, 1, 1))
+    ax.set_xlim(0, width)
+    ax.set_ylim(height, 0)  # Ось y вниз, как в раскладке
+    ax.axis("off")
+    boxes = [Rectangle((rect.x, rect.y), rect.width, rect.height) for rect in rects]
+    ax.add_collection(PatchCollection(boxes, facecolors=treemap_colors(rects), edgecolors="white", linewidths=0.5))
+    for rect in rects:
+        # Подписываем только прямоугольники, в которые помещается текст
+        if rect.width < 40 or rect.height < 12:
+            continue
+        label = f"{rect.label} ({format_file_size(rect.size)})"
+        ax.text(rect.x + PADDING, rect.y + 1, label[:max(1, int(rect.width / 6))], fontsize=7, va="top",
+                clip_on=True)
+
+    canvas = FigureCanvasTkAgg(fig, master=window)
+    canvas.get_tk_widget().pack(fill=BOTH, expand=True)
+    canvas.draw()
+
+
+def visualize_treemap(path, filters=None, tree=None, width=1200, height=800, size_mode="apparent", max_depth=None,
+                      **scan_options):
+    """
+    Lays out a squarified treemap of ``path`` for plot_treemap.
+
+    The layout comes from the subtree sizes of a size tree (``tree``, or
+    one built with ``**scan_options`` such as ``mode`` or ``cache``), so
+    drawing an already scanned directory touches no file. ``filters`` only
+    prune the scan; see treemap.layout_treemap for the other arguments.
+
+    Returns:
+        list: TreemapRect's.
+    """
+    if tree is None:
+        tree = build_size_tree(path, prune=pruner(compile_filter(filters)), **scan_options)
+    return layout_treemap(tree, width, height, size_mode, max_depth)
+
+
+def visualize_disk_usage(path, filters=None, tree=None, workers=None, mode="threads", cache=None, backend=None,
+                         size_mode="apparent", mounts=None, dir_timeout=None, metrics=None, cancel=None,
+                         sample_budget=None, seed=None):
     """
     Visualize disk usage for the given path with optional filters.
+
+    Slices are sized by ``size_mode`` ("apparent" or "allocated"); the
+    formatted sizes show both numbers.
+
+    With ``sample_budget`` (seconds) and no prebuilt tree, the sizes of the
+    top-level directories are estimated by sampling.sample_sizes instead of
+    a full scan; the formatted sizes then show the estimate in ``size_mode``
+    with its 95% interval and how many folders were listed.
     """
+    if size_mode not in SIZE_MODES:
+        raise ValueError(f"Unknown size mode '{size_mode}'. Expected one of: {', '.join(SIZE_MODES)}.")
     if not os.path.exists(path):
         raise FileNotFoundError(f"Path '{path}' does not exist.")
-
-    def apply_filters(item_path):
-        if not filters:
-            return True
-        return any(item_path.endswith(ext.strip()) for ext in filters)
+    filters = compile_filter(filters)
+    if tree is None and sample_budget is not None:
+        return _visualize_sampled(path, filters, sample_budget, size_mode, seed, cache=cache, backend=backend,
+                                  mounts=mounts, dir_timeout=dir_timeout, cancel=cancel)
+    if tree is None:
+        tree = build_size_tree(path, workers=workers, mode=mode, cache=cache, prune=pruner(filters), backend=backend,
+                               mounts=mounts, dir_timeout=dir_timeout, metrics=metrics, cancel=cancel)
 
     labels = []
     sizes = []
-    for item in os.listdir(path):
-        item_path = os.path.join(path, item)
-        if os.path.islink(item_path) or not apply_filters(item_path):  # Skip symbolic links or non-matching items
+    formatted_sizes = []
+    for node in tree.sorted_children():
+        # Skip symbolic links, repeated hardlinks or non-matching items
+        if node.is_link or node.is_duplicate or (filters is not None and not filters.matches(node.path, node.size)):
             continue
-        size = calculate_size(item_path)
-        if size > 0:
-            labels.append(item)
-            sizes.append(size)
+        if node.size_in(size_mode) > 0:
+            labels.append(node.name)
+            sizes.append(node.size_in(size_mode))
+            formatted_sizes.append(f"{format_file_size(node.size)} ({format_file_size(node.allocated)} on disk)")
 
     if not sizes:
         raise ValueError("No data found for visualization.")
 
-    formatted_sizes = [format_file_size(s) for s in sizes]
     return labels, sizes, formatted_sizes  # Возвращаем все три объекта
 
 
+def _visualize_sampled(path, filters, budget, size_mode, seed, **scan_options):
+    scan = sample_sizes(path, budget, size_mode, seed, prune=pruner(filters), **scan_options)
+    labels = []
+    sizes = []
+    formatted_sizes = []
+    for item in scan.items:
+        if filters is not None and not filters.matches(item.path, item.size):
+            continue
+        if item.size > 0:
+            labels.append(item.name)
+            sizes.append(item.size)
+            listed = "" if item.exact else f", {item.visited_dirs} of ~{item.estimated_dirs} folders listed"
+            formatted_sizes.append(f"{format_estimate(item)}{listed}")
+    if not sizes:
+        raise ValueError("No data found for visualization.")
+    return labels, sizes, formatted_sizes
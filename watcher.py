@@ -0,0 +1,302 @@
+import os
+import stat
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+import threading
+from size_tree import _TreeBuilder, _new_tree, FLAG_DIR, FLAG_LINK, FLAG_UNFOLLOWED, FLAG_MOUNT
+from fs_listing import _allocated, ListingErrors
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_ONLYDIR)
+
+# struct inotify_event { int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[]; }
+_EVENT = struct.Struct("iIII")
+
+
+def _load_libc():
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    if not hasattr(libc, "inotify_init1"):
+        raise OSError(errno.ENOSYS, "inotify is not available on this system")
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+
+def _stat_entry(path):
+    """Returns (is_dir, is_link, size, inode, link_target, allocated) the way _list_directory reports an entry."""
+    lstat = os.lstat(path)
+    is_link = stat.S_ISLNK(lstat.st_mode)
+    is_dir, size, link_target = stat.S_ISDIR(lstat.st_mode), lstat.st_size, None
+    allocated = _allocated(lstat)
+    if is_link:
+        try:
+            link_target = os.readlink(path)
+            target = os.stat(path)
+            is_dir, size, allocated = stat.S_ISDIR(target.st_mode), target.st_size, _allocated(target)
+        except OSError:
+            is_dir, size, allocated = False, 0, 0
+    if is_dir:
+        size = allocated = 0
+    return is_dir, is_link, size, lstat.st_ino, link_target, allocated
+
+
+class SizeTreeWatcher:
+    """
+    Keeps a scanned size tree current using Linux inotify.
+
+    Every scanned directory gets a watch. Events are collected for
+    ``coalesce_delay`` seconds and reduced to a set of (directory, name) pairs,
+    so a burst of writes to one file costs a single stat. Each changed name is
+    re-checked and its size delta is added to the ancestors in O(depth); new
+    directories are scanned and watched. If the kernel event queue overflows,
+    every watched directory is re-listed and reconciled with the tree.
+    Files created while watching are not checked against earlier hardlinks.
+
+    Pass the scan's ``prune`` and ``mounts`` (see build_size_tree) so that
+    directories the scan left out stay out: pruned names are ignored and
+    mount points the scan did not enter are added unscanned.
+
+    The tree is changed from the watcher thread while holding ``lock``;
+    readers that walk the tree concurrently should hold it too.
+    ``on_change`` is called (from the watcher thread) with the set of
+    directory indices whose size or children changed.
+    """
+
+    def __init__(self, root, on_change=None, coalesce_delay=0.5, prune=None, mounts=None):
+        self.root = root
+        self.tree = root.tree
+        self.on_change = on_change
+        self.coalesce_delay = coalesce_delay
+        self.prune = prune
+        self.mounts = mounts
+        self._root_device = mounts.device_of(os.path.realpath(root.path)) if mounts is not None else None
+        self.lock = threading.RLock()
+        self._libc = _load_libc()
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self._wd_to_index = {}
+        self._index_to_wd = {}
+        self._names = {}
+        self._pending = set()
+        self._overflowed = False
+        self._stop = threading.Event()
+        self._thread = None
+        self._watch_limit_logged = False
+        # A tree with unreadable directories fails to watch each of them; log a summary instead.
+        self._watch_errors = ListingErrors()
+        with self.lock:
+            self._watch_subtree(0)
+
+    # --- watches -------------------------------------------------------
+
+    def _watch(self, index):
+        path = os.fsencode(self.tree.path(index))
+        wd = self._libc.inotify_add_watch(self._fd, path, WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOSPC and not self._watch_limit_logged:
+                logging.warning("inotify watch limit reached; raise fs.inotify.max_user_watches to watch everything.")
+                self._watch_limit_logged = True
+            elif error != errno.ENOSPC:
+                self._watch_errors.add("cannot watch", os.fsdecode(path),
+                                       f"Cannot watch {path!r}: {os.strerror(error)}")
+            return
+        self._wd_to_index[wd] = index
+        self._index_to_wd[index] = wd
+
+    def _watch_subtree(self, index):
+        tree = self.tree
+        stack = [index]
+        while stack:
+            current = stack.pop()
+            flags = tree.flags[current]
+            if flags & FLAG_DIR and not flags & FLAG_UNFOLLOWED:
+                self._watch(current)
+                stack.extend(tree.child_indices(current))
+        self._watch_errors.flush()
+
+    def _forget_subtree(self, index):
+        tree = self.tree
+        stack = [index]
+        while stack:
+            current = stack.pop()
+            self._names.pop(current, None)
+            wd = self._index_to_wd.pop(current, None)
+            if wd is not None:
+                self._wd_to_index.pop(wd, None)
+                self._libc.inotify_rm_watch(self._fd, wd)
+            if tree.flags[current] & FLAG_DIR:
+                stack.extend(tree.child_indices(current))
+
+    # --- tree updates --------------------------------------------------
+
+    def _children_by_name(self, dir_index):
+        names = self._names.get(dir_index)
+        if names is None:
+            tree = self.tree
+            names = {tree.name(child): child for child in tree.child_indices(dir_index)}
+            self._names[dir_index] = names
+        return names
+
+    def _remove(self, dir_index, name, child):
+        self._forget_subtree(child)
+        self.tree.remove(child)
+        del self._children_by_name(dir_index)[name]
+
+    def _add(self, dir_index, name, path, is_dir, is_link, size, inode, link_target, allocated):
+        tree = self.tree
+        flags = (FLAG_DIR if is_dir else 0) | (FLAG_LINK if is_link else 0)
+        if is_dir and is_link:
+            flags |= FLAG_UNFOLLOWED
+        elif is_dir and self.mounts is not None and self.mounts.stops_at(name, path, self._root_device):
+            flags |= FLAG_MOUNT | FLAG_UNFOLLOWED
+        child = tree.add(dir_index, name, 0, inode, flags, link_target)
+        self._children_by_name(dir_index)[name] = child
+        if is_dir and not flags & FLAG_UNFOLLOWED:
+            # Watch before scanning, so entries created during the scan still produce events.
+            self._watch(child)
+            subtree = _new_tree(path)
+            _TreeBuilder(subtree, os.path.realpath(path), prune=self.prune, mounts=self.mounts).scan(0, path,
+                                                                                                  workers=1)
+            subtree.roll_up()
+            tree.graft(child, subtree)
+            size, allocated = subtree.size[0], subtree.allocated[0]
+            for grandchild in list(tree.child_indices(child)):
+                self._watch_subtree(grandchild)
+        tree.add_delta(child, size, allocated)
+
+    def _reconcile(self, dir_index, name):
+        """Brings one name of a directory in line with the filesystem; returns True if anything changed."""
+        tree = self.tree
+        path = os.path.join(tree.path(dir_index), name)
+        child = self._children_by_name(dir_index).get(name)
+        try:
+            is_dir, is_link, size, inode, link_target, allocated = _stat_entry(path)
+        except OSError:
+            if child is None:
+                return False
+            self._remove(dir_index, name, child)
+            return True
+        if child is None and is_dir and not is_link and self.prune is not None and self.prune(name, path):
+            # Left out of the scan, so left out of the tree as well.
+            return False
+
+        if child is not None:
+            flags = tree.flags[child]
+            same_kind = bool(flags & FLAG_DIR) == is_dir and bool(flags & FLAG_LINK) == is_link
+            if same_kind and tree.inode[child] == inode:
+                if is_dir:
+                    return False
+                delta = size - tree.size[child]
+                allocated_delta = allocated - tree.allocated[child]
+                if delta or allocated_delta:
+                    tree.add_delta(child, delta, allocated_delta)
+                return bool(delta or allocated_delta)
+            self._remove(dir_index, name, child)
+        self._add(dir_index, name, path, is_dir, is_link, size, inode, link_target, allocated)
+        return True
+
+    def _resync_directory(self, dir_index):
+        try:
+            names = set(os.listdir(self.tree.path(dir_index)))
+        except OSError:
+            names = set()
+        changed = False
+        for name in names | set(self._children_by_name(dir_index)):
+            changed |= self._reconcile(dir_index, name)
+        return changed
+
+    # --- event loop ----------------------------------------------------
+
+    def _read_events(self):
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                self._overflowed = True
+            elif mask & IN_IGNORED:
+                index = self._wd_to_index.pop(wd, None)
+                if index is not None:
+                    self._index_to_wd.pop(index, None)
+            elif name and wd in self._wd_to_index:
+                self._pending.add((self._wd_to_index[wd], os.fsdecode(name)))
+
+    def process_events(self, timeout=0.0):
+        """
+        Waits up to ``timeout`` seconds for events, then applies everything
+        that arrives within the coalescing window. Returns the changed directories.
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        deadline = time.monotonic() + self.coalesce_delay
+        while True:
+            self._read_events()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([self._fd], [], [], remaining)[0]:
+                break
+        return self._apply()
+
+    def _apply(self):
+        changed = set()
+        with self.lock:
+            if self._overflowed:
+                logging.warning("inotify queue overflowed; re-listing watched directories.")
+                self._overflowed = False
+                self._pending.clear()
+                for index in list(self._index_to_wd):
+                    if index in self._index_to_wd and self._resync_directory(index):
+                        changed.add(index)
+            pending, self._pending = self._pending, set()
+            for dir_index, name in pending:
+                if dir_index in self._index_to_wd and self._reconcile(dir_index, name):
+                    changed.add(dir_index)
+        if changed and self.on_change is not None:
+            self.on_change(changed)
+        return changed
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.process_events(timeout=0.2)
+            except Exception as e:
+                logging.exception(f"Watcher failed to apply changes: {e}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="size-tree-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        os.close(self._fd)